@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.http import HttpRequest
-from app.models import User, Category, Product, Supplier, DailyMetrics
+from app.models import User, Category, Product, Supplier, DailyMetrics, PotentialSalesState, ProductSnapshot, WeeklyMetrics, MonthlyMetrics, ExportJob
 from django_admin_listfilter_dropdown.filters import DropdownFilter, RelatedDropdownFilter
 from django.db.models import QuerySet, Exists, OuterRef, Subquery, IntegerField
 from datetime import datetime, timedelta
+from app.helpers.data_version import bump_data_version
 
 # Register your models here.
 
@@ -156,10 +157,13 @@ class ProductAdmin(admin.ModelAdmin):
 
     def set_products_active(self, request: HttpRequest, queryset: QuerySet):
         updated: int = queryset.update(is_active=True)
+        # QuerySet.update sends no post_save, move the data version here
+        bump_data_version()
         self.message_user(request, f"{updated} products set as active.")
 
     def set_products_inactive(self, request: HttpRequest, queryset: QuerySet):
         updated: int = queryset.update(is_active=False)
+        bump_data_version()
         self.message_user(request, f"{updated} products set as inactive.")
     
     is_new_product_display.boolean = True
@@ -184,3 +188,65 @@ class DailyMetricsAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queryset to include related product data"""
         return super().get_queryset(request).select_related('product')
+
+
+@admin.register(PotentialSalesState)
+class PotentialSalesStateAdmin(admin.ModelAdmin):
+    """Potential sales watermark admin"""
+    list_display = ('product', 'computed_until', 'min_stock', 'good_stock_sales_sum', 'good_stock_days', 'updated_at')
+    search_fields = ('product__code', 'product__name')
+    readonly_fields = ('product', 'min_stock', 'computed_until', 'good_stock_sales_sum', 'good_stock_days', 'updated_at')
+    ordering = ['product__code']
+
+    def get_queryset(self, request):
+        """Optimize queryset to include related product data"""
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(ProductSnapshot)
+class ProductSnapshotAdmin(admin.ModelAdmin):
+    """Product planning snapshot admin"""
+    list_display = ('product', 'latest_date', 'latest_stock', 'avg_daily_demand', 'remainder_days', 'as_of', 'updated_at')
+    search_fields = ('product__code', 'product__name')
+    readonly_fields = ('product', 'latest_date', 'latest_stock', 'avg_daily_demand', 'remainder_days', 'as_of', 'updated_at')
+    ordering = ['product__code']
+
+    def get_queryset(self, request):
+        """Optimize queryset to include related product data"""
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(WeeklyMetrics, MonthlyMetrics)
+class MetricsRollupAdmin(admin.ModelAdmin):
+    """Weekly and monthly metrics rollup admin"""
+    list_display = (
+        'product', 'period_start', 'days', 'sales_quantity_sum', 'potential_sales_sum',
+        'stock_days', 'stockout_days', 'min_stock', 'max_stock', 'last_stock'
+    )
+    search_fields = ('product__code', 'product__name')
+    date_hierarchy = 'period_start'
+    ordering = ['product__code', '-period_start']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        """Optimize queryset to include related product data"""
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Background export job admin"""
+    list_display = ('id', 'status', 'format', 'processed_rows', 'total_rows', 'created_at', 'finished_at', 'expires_at')
+    list_filter = ('status', 'format')
+    readonly_fields = (
+        'status', 'format', 'params', 'total_rows', 'processed_rows', 'file', 'error', 'attempts', 'claimed_by',
+        'created_at', 'started_at', 'updated_at', 'finished_at', 'expires_at'
+    )
+
+    def has_add_permission(self, request):
+        return False
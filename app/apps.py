@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class SupplyPlannerConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'app'
+
+    def ready(self):
+        # Register model signal handlers
+        from app import signals  # pylint: disable=unused-import,import-outside-toplevel
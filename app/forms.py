@@ -1,5 +1,8 @@
 from django import forms
+from django.conf import settings
+from django.urls import reverse
 from app.models import Category, Supplier
+from app.helpers.typeahead import typeahead_labels
 
 
 class ItemsPerPageForm(forms.Form):
@@ -88,6 +91,45 @@ class ProductNameFilterForm(forms.Form):
     )
 
 
+class ProductSearchForm(forms.Form):
+    """Form for searching products by code, model and name at once"""
+    
+    search = forms.CharField(
+        required=False,
+        max_length=200,
+        widget=forms.TextInput(attrs={
+            'name': 'search',
+            'placeholder': 'Search code, model or name...',
+            'class': 'w-full p-1 text-xs border border-gray-300 rounded focus:outline-none focus:ring-1 focus:ring-blue-500 focus:border-blue-500'
+        })
+    )
+
+
+def facet_choices(facet: dict, empty_label: str) -> list[tuple]:
+    """Dropdown choices from a product facet, labels followed by product counts when known"""
+    choices: list[tuple] = [('empty', f"{empty_label} ({facet['empty']})")] if facet['empty'] else []
+    choices.extend(
+        (option_id, label if count is None else f'{label} ({count})')
+        for option_id, label, count in facet['options']
+    )
+    return choices
+
+
+def typeahead_choices(facet: dict, empty_label: str, source: str, selected: list) -> list[tuple]:
+    """
+    Dropdown choices in typeahead mode: the empty option and the selected options only,
+    the rest is loaded from the typeahead endpoint as the user types
+    """
+    selected = [str(value) for value in selected]
+    choices: list[tuple] = [
+        choice for choice in facet_choices(facet, empty_label) if choice[0] == 'empty' or str(choice[0]) in selected
+    ]
+    # Selected options outside the facet (no products under the current filters) still need a label
+    known: set = {str(choice[0]) for choice in choices}
+    choices.extend(typeahead_labels(source, [value for value in selected if value not in known]))
+    return choices
+
+
 class ProductCategoryFilterForm(forms.Form):
     """Form for filtering products by categories with custom multi-select"""
     
@@ -102,18 +144,18 @@ class ProductCategoryFilterForm(forms.Form):
         })
     )
 
-    def __init__(self, *args, request=None, **kwargs):
+    def __init__(self, *args, facet: dict = None, **kwargs):
         super().__init__(*args, **kwargs)
-        # Add "No category" option first, then all categories
-        category_ids: list[int] = request.session.get('category_ids')
-        if category_ids is None:
-            category_ids = list(Category.objects.values_list('id', flat=True))
-        if Category.objects.filter(id__in=category_ids).filter(products__isnull=True).exists():
-            choices: list[tuple] = [('empty', 'Be kategorijos')]
+        # "No category" option first, then the categories of the filtered products with their counts
+        if facet is None:
+            facet = {'options': [(cat.id, cat.name, None) for cat in Category.objects.all()], 'empty': 0}
+        self.typeahead_url: str = ''
+        if len(facet['options']) > settings.PRODUCT_FILTER_TYPEAHEAD_THRESHOLD:
+            self.typeahead_url = reverse('filter_typeahead', args=['categories'])
+            selected: list = self['categories'].value() or []
+            self.fields['categories'].choices = typeahead_choices(facet, 'Be kategorijos', 'categories', selected)
         else:
-            choices: list[tuple] = []
-        choices.extend([(cat.id, cat.name) for cat in Category.objects.filter(id__in=category_ids)])
-        self.fields['categories'].choices = choices
+            self.fields['categories'].choices = facet_choices(facet, 'Be kategorijos')
 
 
 class ProductSupplierFilterForm(forms.Form):
@@ -130,18 +172,18 @@ class ProductSupplierFilterForm(forms.Form):
         })
     )
 
-    def __init__(self, *args, request=None, **kwargs):
+    def __init__(self, *args, facet: dict = None, **kwargs):
         super().__init__(*args, **kwargs)
-        # Add "No suppliers" option first, then all suppliers
-        supplier_ids: list[int] = request.session.get('supplier_ids')
-        if supplier_ids is None:
-            supplier_ids = list(Supplier.objects.values_list('id', flat=True))
-        if Supplier.objects.filter(id__in=supplier_ids).filter(products__isnull=True).exists():
-            choices: list[tuple] = [('empty', 'Be tiekėjų')]
+        # "No suppliers" option first, then the suppliers of the filtered products with their counts
+        if facet is None:
+            facet = {'options': [(sup.id, sup.company_name, None) for sup in Supplier.objects.all()], 'empty': 0}
+        self.typeahead_url: str = ''
+        if len(facet['options']) > settings.PRODUCT_FILTER_TYPEAHEAD_THRESHOLD:
+            self.typeahead_url = reverse('filter_typeahead', args=['suppliers'])
+            selected: list = self['suppliers'].value() or []
+            self.fields['suppliers'].choices = typeahead_choices(facet, 'Be tiekėjų', 'suppliers', selected)
         else:
-            choices: list[tuple] = []
-        choices.extend([(sup.id, sup.company_name) for sup in Supplier.objects.filter(id__in=supplier_ids)])
-        self.fields['suppliers'].choices = choices
+            self.fields['suppliers'].choices = facet_choices(facet, 'Be tiekėjų')
 
 
 class MinMaxFilterForm(forms.Form):
@@ -0,0 +1,197 @@
+from typing import Iterable, Optional
+from django.db import connection, transaction
+
+CLOSURE_TABLE: str = 'app_categoryclosure'
+# Created by migration 0018 and moved on every committed category change; shared by all processes
+CATEGORY_TREE_SEQUENCE: str = 'app_categorytree_seq'
+PATH_SEPARATOR: str = ' > '
+
+
+def rebuild_category_closure():
+    """
+    Rebuild the whole category closure table and every category level with a recursive
+    query. For bulk loads that bypass Category.save().
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {CLOSURE_TABLE}')
+        cursor.execute(f"""
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM app_category
+                UNION ALL
+                SELECT tree.ancestor_id, child.id, tree.depth + 1
+                FROM tree
+                JOIN app_category AS child ON child.parent_id = tree.descendant_id
+            )
+            INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, depth FROM tree
+        """)
+        cursor.execute(f"""
+            UPDATE app_category AS category SET level = depths.level
+            FROM (
+                SELECT descendant_id, MAX(depth) AS level FROM {CLOSURE_TABLE} GROUP BY descendant_id
+            ) AS depths
+            WHERE depths.descendant_id = category.id AND category.level <> depths.level
+        """)
+    invalidate_category_tree()
+
+
+def insert_category_closure(category_id: int, parent_id: Optional[int]):
+    """Add the closure rows of a new leaf category: itself and every ancestor of its parent"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth)
+            SELECT %(category_id)s, %(category_id)s, 0
+            UNION ALL
+            SELECT ancestor_id, %(category_id)s, depth + 1 FROM {CLOSURE_TABLE} WHERE descendant_id = %(parent_id)s
+            ON CONFLICT (ancestor_id, descendant_id) DO NOTHING
+        """, {'category_id': category_id, 'parent_id': parent_id})
+
+
+def move_category_subtree(category_id: int, parent_id: Optional[int]):
+    """
+    Re-link a category and its whole subtree under a new parent (None for a root):
+    the paths from the old ancestors are dropped, paths from the new ones added, and
+    level is recomputed for every category of the subtree.
+    """
+    with connection.cursor() as cursor:
+        subtree: str = f'SELECT descendant_id FROM {CLOSURE_TABLE} WHERE ancestor_id = %(category_id)s'
+        cursor.execute(f"""
+            DELETE FROM {CLOSURE_TABLE}
+            WHERE descendant_id IN ({subtree}) AND ancestor_id NOT IN ({subtree})
+        """, {'category_id': category_id})
+        if parent_id is not None:
+            cursor.execute(f"""
+                INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth)
+                SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+                FROM {CLOSURE_TABLE} AS above
+                CROSS JOIN {CLOSURE_TABLE} AS below
+                WHERE above.descendant_id = %(parent_id)s AND below.ancestor_id = %(category_id)s
+            """, {'category_id': category_id, 'parent_id': parent_id})
+        cursor.execute(f"""
+            UPDATE app_category AS category SET level = depths.level
+            FROM (
+                SELECT descendant_id, MAX(depth) AS level FROM {CLOSURE_TABLE}
+                WHERE descendant_id IN ({subtree})
+                GROUP BY descendant_id
+            ) AS depths
+            WHERE depths.descendant_id = category.id
+        """, {'category_id': category_id})
+
+
+def get_descendant_ids(category_ids: Iterable, include_self: bool = True) -> list:
+    """All descendant ids of the given categories in one indexed closure lookup"""
+    category_ids = [int(category_id) for category_id in category_ids]
+    if not category_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT DISTINCT descendant_id FROM {CLOSURE_TABLE}
+            WHERE ancestor_id = ANY(%s) AND depth >= %s
+        """, [category_ids, 0 if include_self else 1])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class CategoryTree:
+    """
+    Read-only in-memory copy of the category tree with precomputed paths and subtrees,
+    so path and descendant lookups are dictionary reads.
+    """
+
+    def __init__(self, rows: Iterable):
+        """rows: (id, parent_id, name) of every category"""
+        self.parents: dict = {}
+        self.names: dict = {}
+        self.children: dict = {}
+        for category_id, parent_id, name in rows:
+            self.parents[category_id] = parent_id
+            self.names[category_id] = name
+            self.children.setdefault(parent_id, []).append(category_id)
+        self.paths: dict = {}
+        self.descendants: dict = {}
+        # Walk down from the roots so each path extends its parent's path
+        stack: list = [(category_id, '') for category_id in self.children.get(None, [])]
+        order: list = []
+        while stack:
+            category_id, parent_path = stack.pop()
+            self.paths[category_id] = f'{parent_path}{PATH_SEPARATOR}{self.names[category_id]}' if parent_path else self.names[category_id]
+            order.append(category_id)
+            stack.extend((child_id, self.paths[category_id]) for child_id in self.children.get(category_id, []))
+        # Children come after their parents in order, so reversed order builds subtrees bottom-up
+        for category_id in reversed(order):
+            subtree: set = {category_id}
+            for child_id in self.children.get(category_id, []):
+                subtree |= self.descendants[child_id]
+            self.descendants[category_id] = frozenset(subtree)
+
+    def __contains__(self, category_id) -> bool:
+        return category_id in self.paths
+
+    def path(self, category_id: int) -> Optional[str]:
+        """Full path such as 'Electronics > Computers > Laptops', None for unknown ids"""
+        return self.paths.get(category_id)
+
+    def descendant_ids(self, category_ids: Iterable, include_self: bool = True) -> set:
+        """Ids of the given categories' subtrees; unknown ids are ignored"""
+        result: set = set()
+        for category_id in category_ids:
+            subtree: frozenset = self.descendants.get(int(category_id), frozenset())
+            result |= subtree if include_self else subtree - {int(category_id)}
+        return result
+
+
+_category_tree: Optional[CategoryTree] = None
+_category_tree_version: Optional[int] = None
+# Whether the loaded tree was compared with the shared version in the current request or job
+_category_tree_checked: bool = False
+
+
+def get_category_tree_version() -> int:
+    """Current category tree version, 0 before the first category change"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {CATEGORY_TREE_SEQUENCE}')
+        return cursor.fetchone()[0]
+
+
+def get_category_tree() -> CategoryTree:
+    """
+    The process-wide category tree: loaded with one query on first use and again only
+    after the shared version sequence moved (a category was saved or deleted somewhere).
+    The version is read once per request or export job, so later lookups cost no query.
+    """
+    global _category_tree, _category_tree_version, _category_tree_checked
+    if _category_tree is None or not _category_tree_checked:
+        # Read the version before the rows: a change committed in between only causes another reload
+        version: int = get_category_tree_version()
+        if _category_tree is None or version != _category_tree_version:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT id, parent_id, name FROM app_category')
+                _category_tree = CategoryTree(cursor.fetchall())
+            _category_tree_version = version
+        _category_tree_checked = True
+    return _category_tree
+
+
+def expire_category_tree_check(**kwargs):
+    """
+    Compare the tree with the shared version on its next use. Connected to
+    request_started and called by the export worker before each job.
+    """
+    global _category_tree_checked
+    _category_tree_checked = False
+
+
+def invalidate_category_tree():
+    """
+    Drop this process's tree now and move the shared version once the transaction
+    commits, so other processes reload committed data at their next request.
+    """
+    global _category_tree
+    _category_tree = None
+    transaction.on_commit(bump_category_tree_version)
+
+
+def bump_category_tree_version() -> int:
+    """Take the next category tree version"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT nextval('{CATEGORY_TREE_SEQUENCE}')")
+        return cursor.fetchone()[0]
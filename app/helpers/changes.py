@@ -0,0 +1,13 @@
+from app.helpers.derived import refresh_derived_metrics
+from app.helpers.potential_sales import invalidate_potential_sales
+
+
+def propagate_daily_metrics_changes(changes: dict):
+    """
+    Bring data derived from DailyMetrics up to date after rows were written or deleted.
+    changes maps product id -> (first changed date, last changed date).
+    """
+    if not changes:
+        return
+    invalidate_potential_sales(changes)
+    refresh_derived_metrics(changes)
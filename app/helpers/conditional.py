@@ -0,0 +1,71 @@
+import hashlib
+import json
+from datetime import date, datetime
+from functools import wraps
+from typing import Callable, Optional
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from app.helpers.data_version import get_data_version_stamp
+
+# Session state the product list and its exports are rendered from
+PRODUCT_LIST_SESSION_KEYS: tuple = ('items_per_page', 'filter_data', 'order_days_data', 'product_sort')
+
+
+def request_data_version(request) -> tuple[int, Optional[datetime]]:
+    """Data version stamp read once per request, shared by the ETag and Last-Modified checks"""
+    if not hasattr(request, '_data_version_stamp'):
+        request._data_version_stamp = get_data_version_stamp()  # pylint: disable=protected-access
+    return request._data_version_stamp  # pylint: disable=protected-access
+
+
+def make_etag(*parts) -> str:
+    """Short strong ETag value from JSON-serialisable parts"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+
+def data_version_etag(request, *args, **kwargs) -> str:
+    """ETag of a response that only depends on the data and the URL"""
+    return make_etag(request_data_version(request)[0], request.get_full_path())
+
+
+def data_version_last_modified(request, *args, **kwargs) -> Optional[datetime]:
+    """Last-Modified of a response that only depends on the data and the URL"""
+    return request_data_version(request)[1]
+
+
+def product_list_etag(request, *args, **kwargs) -> str:
+    """
+    ETag of the product list, its fragments and exports: the data version, today (stale
+    snapshots are refreshed on read), the URL, the HTMX target, the list state in the
+    session and the CSRF secret embedded in the page
+    """
+    return make_etag(
+        request_data_version(request)[0],
+        date.today(),
+        request.get_full_path(),
+        request.headers.get('HX-Request', ''),
+        request.headers.get('HX-Target', ''),
+        [request.session.get(key) for key in PRODUCT_LIST_SESSION_KEYS],
+        request.META.get('CSRF_COOKIE', ''),
+    )
+
+
+def conditional_on_data_version(etag_func: Callable = data_version_etag,
+                                last_modified_func: Optional[Callable] = None) -> Callable:
+    """
+    Answer GET and HEAD with 304 Not Modified when the client's ETag (or, without one,
+    its Last-Modified) still matches, so repeated requests cost one version lookup.
+    Responses are private and revalidated on every use: they follow the session, and
+    only the server knows whether the data moved on.
+    """
+    def decorator(view_func: Callable) -> Callable:
+        conditional_view: Callable = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('HX-Request', 'HX-Target'))
+            return response
+        return wrapper
+    return decorator
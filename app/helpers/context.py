@@ -1,12 +1,33 @@
+from typing import Optional
+from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import QuerySet, Q, Avg, Subquery, OuterRef, IntegerField, FloatField, Case, When, F
-from django.db.models.functions import Round, Greatest
+from django.db.models import QuerySet, Q, Field, IntegerField, FloatField, Case, When, F
+from django.db.models.expressions import Expression
+from django.db.models.functions import Cast, Coalesce, Floor, Greatest, NullIf, Round
+from django.db.models.sql.constants import LOUTER
 from django.http import QueryDict
-from app.models import Category, Product, DailyMetrics, Supplier
-from app.forms import ItemsPerPageForm, ProductCodeFilterForm, ProductModelFilterForm, ProductNameFilterForm, ProductCategoryFilterForm, ProductSupplierFilterForm, OrderDaysForm
-from app.helpers.utils import get_filter_dropdown_queryset
+from app.models import Product
+from app.forms import (
+    ItemsPerPageForm, ProductCodeFilterForm, ProductModelFilterForm, ProductNameFilterForm, ProductCategoryFilterForm,
+    ProductSupplierFilterForm, OrderDaysForm, ProductStockFilterForm, ProductDailyDemandFilterForm,
+    ProductRemainderDaysFilterForm, ProductPOQuantityFilterForm, ProductSearchForm
+)
+from app.helpers.facets import get_product_facets
+from app.helpers.snapshots import SNAPSHOT_DEMAND_DAYS, refresh_product_snapshots
+from app.helpers.pagination import keyset_paginate
+from app.helpers.counts import CachedCountPaginator, filter_signature, product_count_cache_key
+from app.helpers.search import search_product_queryset
+from app.helpers.categories import get_category_tree
 from datetime import datetime, timedelta
 
+# Sortable planning columns with min/max filters: filter form prefix -> annotation
+PLANNING_COLUMNS: dict = {
+    'stock': 'current_stock',
+    'daily_demand': 'avg_daily_demand',
+    'remainder_days': 'remainder_days',
+    'po_quantity': 'po_quantity',
+}
+
 
 def apply_relation_filter(queryset: QuerySet, filter_list: list, field_name: str) -> QuerySet:
     """ Apply filtering   """
@@ -49,6 +70,30 @@ def apply_min_max_filter(queryset: QuerySet, field_name: str, min_value: str, ma
     return queryset
 
 
+def apply_planning_filters(queryset: QuerySet, filter_data) -> QuerySet:
+    """
+    Apply the min/max filters of the planning columns to an annotated Product queryset.
+    On the snapshot annotation these are indexed ProductSnapshot columns; PO quantity
+    depends on order days, so it is an expression over the same row.
+    """
+    for name, field_name in PLANNING_COLUMNS.items():
+        queryset = apply_min_max_filter(
+            queryset, field_name, filter_data.get(f'min_{name}', ''), filter_data.get(f'max_{name}', ''), value_type=float
+        )
+    return queryset
+
+
+def sort_product_queryset(queryset: QuerySet, sort: str) -> QuerySet:
+    """
+    Order an annotated Product queryset by a planning column, '-' prefix for descending.
+    Empty values go last either way; code and id keep the order stable between pages.
+    """
+    field_name: str = PLANNING_COLUMNS.get(sort.lstrip('-'), '') if sort else ''
+    if not field_name:
+        return queryset
+    ordering = F(field_name).desc(nulls_last=True) if sort.startswith('-') else F(field_name).asc(nulls_last=True)
+    return queryset.order_by(ordering, 'code', 'pk')
+
 
 def filter_product_queryset(
         product_queryset: QuerySet,
@@ -56,16 +101,18 @@ def filter_product_queryset(
         model_filter: str = '',
         name_filter: str = '',
         category_filter: list = None,
-        supplier_filter: list = None
+        supplier_filter: list = None,
+        search_filter: str = ''
     ) -> QuerySet:
     """
     Returns filtered Product queryset (no annotation)
+    A search_filter is matched against code, model and name and ranks the results when pg_trgm is installed
     """
     if not category_filter:
         category_filter = []
     if not supplier_filter:
         supplier_filter = []
-    products = product_queryset.filter(is_active=True).order_by('code')
+    products = product_queryset.filter(is_active=True).order_by('code', 'pk')
     if code_filter:
         products = products.filter(code__icontains=code_filter)
     if model_filter:
@@ -73,53 +120,41 @@ def filter_product_queryset(
     if name_filter:
         products = products.filter(name__icontains=name_filter)
     if category_filter:
-        expanded_ids = set()
-        for cat_id in category_filter:
-            if cat_id == 'empty':
-                expanded_ids.add('empty')
-                continue
-            category = Category.objects.get(pk=cat_id)
-            expanded_ids.add(category.id)
-            expanded_ids.update(cat.id for cat in category.get_descendants())
-        expanded_category_filter = list(expanded_ids)
+        # Selected categories with all their subcategories from the in-memory tree
+        expanded_category_filter: list = list(
+            get_category_tree().descendant_ids(cat_id for cat_id in category_filter if cat_id != 'empty')
+        )
+        if 'empty' in category_filter:
+            expanded_category_filter.append('empty')
         products = apply_relation_filter(products, expanded_category_filter, 'category')
     if supplier_filter:
         products = apply_relation_filter(products, supplier_filter, 'suppliers')
-    # Removed filters for annotated fields: current_stock, avg_daily_demand, remainder_days, po_quantity
+    if search_filter:
+        products = search_product_queryset(products, search_filter)
+    # Filters on the annotated planning columns: apply_planning_filters
     return products
 
 def annotate_product_queryset(
         product_queryset: QuerySet,
         order_days_value: int,
-        daily_demand_days: int = 365
+        daily_demand_days: int = SNAPSHOT_DEMAND_DAYS,
+        live: bool = False
     ) -> QuerySet:
     """
     Annotates a Product queryset (no filtering)
+    Stock, demand and remainder days are read from ProductSnapshot; live=True or a
+    demand window other than the snapshot's reads DailyMetrics (annotate_live_metrics).
     """
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=daily_demand_days)
-    products = product_queryset.select_related('category').prefetch_related('suppliers').annotate(
-        current_stock=Subquery(
-            DailyMetrics.objects.filter(
-                product=OuterRef('pk')
-            ).order_by('-date').values('stock')[:1],
-            output_field=IntegerField()
-        ),
-        avg_daily_demand=Avg(
-            'daily_metrics__potential_sales',
-            filter=Q(
-                daily_metrics__date__range=[start_date, end_date],
-                daily_metrics__potential_sales__isnull=False
-            )
-        ),
-        remainder_days=Case(
-            When(
-                Q(avg_daily_demand__gt=0) & Q(current_stock__isnull=False), 
-                then=F('current_stock') / F('avg_daily_demand')
-            ),
-            default=None,
-            output_field=IntegerField()
-        ),
+    products = product_queryset.select_related('category').prefetch_related('suppliers')
+    if live or daily_demand_days != SNAPSHOT_DEMAND_DAYS:
+        return annotate_live_metrics(products, order_days_value, daily_demand_days)
+    products = products.annotate(
+        current_stock=F('snapshot__latest_stock'),
+        avg_daily_demand=F('snapshot__avg_daily_demand'),
+        remainder_days=F('snapshot__remainder_days'),
+        snapshot_as_of=F('snapshot__as_of')
+    )
+    products = products.annotate(
         po_quantity=Case(
             When(
                 Q(avg_daily_demand__isnull=False) & Q(avg_daily_demand__gt=0) & Q(current_stock__isnull=False),
@@ -132,9 +167,144 @@ def annotate_product_queryset(
     return products
 
 
-def populate_product_list_context(request, context):
+# Latest stock and windowed average demand of one product. The aggregate without GROUP BY
+# always returns one row, so products without metrics keep NULL figures. OFFSET 0 stops
+# the planner from pulling the subquery up, which would copy the stock lookup into
+# every filter on the derived columns.
+LIVE_METRICS_SQL: str = """
+    SELECT
+        (
+            SELECT stock FROM app_dailymetrics
+            WHERE product_id = {parent}.id ORDER BY date DESC LIMIT 1
+        ) AS current_stock,
+        AVG(potential_sales) AS avg_daily_demand
+    FROM app_dailymetrics
+    WHERE product_id = {parent}.id AND date BETWEEN %s AND %s AND potential_sales IS NOT NULL
+    OFFSET 0
+"""
+
+
+class LateralJoin:
+    """
+    LEFT JOIN LATERAL (sql) ON TRUE as a join of a Query's alias map, so the derived
+    table is computed once per row of the parent table and its columns can be referenced
+    like any joined column. sql refers to the parent table as {parent}.
+    """
+    join_type = LOUTER
+    nullable = True
+    filtered_relation = None
+    join_field = None
+
+    def __init__(self, table_name: str, parent_alias: str, sql: str, params: tuple, table_alias: Optional[str] = None):
+        self.table_name = table_name
+        self.parent_alias = parent_alias
+        self.table_alias = table_alias or table_name
+        self.sql = sql
+        self.params = tuple(params)
+
+    def as_sql(self, compiler, connection) -> tuple:
+        sql: str = self.sql.format(parent=compiler.quote_name_unless_alias(self.parent_alias))
+        return f'{self.join_type} LATERAL ({sql}) {compiler.quote_name_unless_alias(self.table_alias)} ON TRUE', list(self.params)
+
+    def relabeled_clone(self, change_map: dict) -> 'LateralJoin':
+        return self.__class__(
+            self.table_name, change_map.get(self.parent_alias, self.parent_alias), self.sql, self.params,
+            change_map.get(self.table_alias, self.table_alias)
+        )
+
+    # The derived table has a row for every parent row, so inner and outer joins are the same
+    def promote(self) -> 'LateralJoin':
+        return self
+
+    def demote(self) -> 'LateralJoin':
+        return self
+
+    @property
+    def identity(self) -> tuple:
+        return self.__class__, self.table_name, self.parent_alias, self.sql, self.params
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, LateralJoin) and self.identity == other.identity
+
+    def __hash__(self) -> int:
+        return hash(self.identity)
+
+
+class LateralColumn(Expression):
+    """A column of a LateralJoin, relabeled along with it"""
+    contains_column_references = True
+
+    def __init__(self, alias: str, column: str, output_field: Field):
+        super().__init__(output_field=output_field)
+        self.alias = alias
+        self.column = column
+
+    def as_sql(self, compiler, connection) -> tuple:
+        return f'{compiler.quote_name_unless_alias(self.alias)}.{connection.ops.quote_name(self.column)}', []
+
+    def relabeled_clone(self, change_map: dict) -> 'LateralColumn':
+        return self.__class__(change_map.get(self.alias, self.alias), self.column, self.output_field)
+
+    def get_group_by_cols(self) -> list:
+        return [self]
+
+
+def annotate_live_metrics(products: QuerySet, order_days_value: int, daily_demand_days: int) -> QuerySet:
+    """
+    Annotates stock, demand, remainder days and PO quantity straight from DailyMetrics.
+    Latest stock and windowed average demand come from a LEFT JOIN LATERAL evaluated
+    once per product on the (product, date) index, so the product query needs no GROUP BY,
+    supplier joins with DISTINCT cannot multiply the daily rows, and remainder days and
+    PO quantity reuse the joined columns instead of repeating the lookups.
+    """
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=daily_demand_days)
+    products = products.all()
+    alias: str = products.query.join(
+        LateralJoin('live_metrics', products.query.get_initial_alias(), LIVE_METRICS_SQL, (start_date, end_date))
+    )
+    return products.annotate(
+        current_stock=LateralColumn(alias, 'current_stock', IntegerField()),
+        avg_daily_demand=LateralColumn(alias, 'avg_daily_demand', FloatField())
+    ).alias(
+        # NULL unless demand is positive, which also covers a missing stock below
+        positive_demand=NullIf(Greatest(F('avg_daily_demand'), 0.0, output_field=FloatField()), 0.0)
+    ).annotate(
+        remainder_days=Cast(Floor(F('current_stock') / F('positive_demand')), output_field=IntegerField()),
+        # demand * max(order days - stock / demand, 0) with demand factored in
+        po_quantity=Coalesce(
+            Round(Greatest(order_days_value * F('positive_demand') - F('current_stock'), 0.0, output_field=FloatField())),
+            0.0,
+            output_field=FloatField()
+        )
+    )
+
+
+def refresh_stale_page_products(page_products: list, order_days_value: int) -> list:
+    """
+    Refresh missing or outdated snapshots of an annotated page and re-read only those rows,
+    keeping the page order. Usually nothing is stale and no query is made.
     """
-    Context filler for product list data with pagination
+    today = datetime.now().date()
+    stale_ids: list = [
+        product.pk for product in page_products
+        if product.snapshot_as_of is None or product.snapshot_as_of < today
+    ]
+    if not stale_ids:
+        return page_products
+    refresh_product_snapshots(stale_ids, as_of=today)
+    refreshed: dict = {
+        product.pk: product
+        for product in annotate_product_queryset(Product.objects.filter(pk__in=stale_ids), order_days_value)
+    }
+    return [refreshed.get(product.pk, product) for product in page_products]
+
+
+def populate_product_list_context(request, context, include_facets: bool = True):
+    """
+    Context filler for product list data with pagination.
+    Without include_facets the category and supplier dropdowns are left out of the context
+    (no facet queries), for fragment responses that do not re-render the filter row.
     """
     items_per_page: int = request.session.get('items_per_page', 20)
     filter_data: QueryDict = request.session.get('filter_data', QueryDict())
@@ -144,6 +314,8 @@ def populate_product_list_context(request, context):
     name_filter: str = filter_data.get('name', '')
     category_filter: list = filter_data.getlist('categories') if hasattr(filter_data, 'getlist') else filter_data.get('categories', [])
     supplier_filter: list = filter_data.getlist('suppliers') if hasattr(filter_data, 'getlist') else filter_data.get('suppliers', [])
+    search_filter: str = filter_data.get('search', '')
+    sort: str = request.session.get('product_sort', '')
 
     # Get order_days value from form (default 1)
     order_days_form: OrderDaysForm = OrderDaysForm(data=order_days_data)
@@ -161,38 +333,71 @@ def populate_product_list_context(request, context):
         model_filter=model_filter,
         name_filter=name_filter,
         category_filter=category_filter,
-        supplier_filter=supplier_filter
+        supplier_filter=supplier_filter,
+        search_filter=search_filter
     )
     
-    # update session multiselect dropdowns QuerySets
-    request.session['category_ids'] = get_filter_dropdown_queryset(all_products, Category, 'products')
-    request.session['supplier_ids'] = get_filter_dropdown_queryset(all_products, Supplier, 'products')
+    # Multiselect dropdown options with product counts, one grouped query per facet (cached)
+    category_filter_form: Optional[ProductCategoryFilterForm] = None
+    supplier_filter_form: Optional[ProductSupplierFilterForm] = None
+    if include_facets:
+        list_filter_signature: str = filter_signature(
+            code=code_filter, model=model_filter, name=name_filter,
+            categories=category_filter, suppliers=supplier_filter, search=search_filter
+        )
+        facets: dict = get_product_facets(all_products, list_filter_signature)
+        category_filter_form = ProductCategoryFilterForm(data=filter_data, facet=facets['categories'])
+        supplier_filter_form = ProductSupplierFilterForm(data=filter_data, facet=facets['suppliers'])
+        category_filter_form.is_valid()
+        supplier_filter_form.is_valid()
 
     items_per_page_form: ItemsPerPageForm = ItemsPerPageForm(initial={'items_per_page': items_per_page})
     code_filter_form: ProductCodeFilterForm = ProductCodeFilterForm(data=filter_data)
     model_filter_form: ProductModelFilterForm = ProductModelFilterForm(data=filter_data)
     name_filter_form: ProductNameFilterForm = ProductNameFilterForm(data=filter_data)
-    category_filter_form: ProductCategoryFilterForm = ProductCategoryFilterForm(data=filter_data, request=request)
-    supplier_filter_form: ProductSupplierFilterForm = ProductSupplierFilterForm(data=filter_data, request=request)
+    search_form: ProductSearchForm = ProductSearchForm(data=filter_data)
+    stock_filter_form: ProductStockFilterForm = ProductStockFilterForm(data=filter_data)
+    daily_demand_filter_form: ProductDailyDemandFilterForm = ProductDailyDemandFilterForm(data=filter_data)
+    remainder_days_filter_form: ProductRemainderDaysFilterForm = ProductRemainderDaysFilterForm(data=filter_data)
+    po_quantity_filter_form: ProductPOQuantityFilterForm = ProductPOQuantityFilterForm(data=filter_data)
     order_days_form.is_valid()
     code_filter_form.is_valid()
     model_filter_form.is_valid()
     name_filter_form.is_valid()
-    category_filter_form.is_valid()
-    supplier_filter_form.is_valid()
-
-    # Pagination
-    paginator: Paginator = Paginator(all_products, items_per_page)
-    page_number: str = request.GET.get('page') if request.GET.get('page') else request.POST.get('page_number', 1)
-    page_obj = paginator.get_page(page_number)
-    # Annotate only the products on the current page
-    page_products: QuerySet = Product.objects.filter(pk__in=[p.pk for p in page_obj.object_list])
-    annotated_page_products: QuerySet = annotate_product_queryset(
-        page_products,
-        order_days_value=order_days_value
-    )
-    # Replace page_obj.object_list with annotated products
-    page_obj.object_list = list(annotated_page_products)
+    search_form.is_valid()
+    stock_filter_form.is_valid()
+    daily_demand_filter_form.is_valid()
+    remainder_days_filter_form.is_valid()
+    po_quantity_filter_form.is_valid()
+
+    # Pagination over the annotated queryset: the page window is fetched and annotated
+    # by a single ordered statement
+    annotated_products: QuerySet = annotate_product_queryset(all_products, order_days_value=order_days_value)
+    annotated_products = sort_product_queryset(apply_planning_filters(annotated_products, filter_data), sort)
+    # Keyset cursors follow the default (code, id) order, sorted or ranked lists page by offset
+    if settings.PRODUCT_LIST_PAGINATION == 'keyset' and not sort and not search_filter.strip():
+        paginator = None
+        cursor: str = request.GET.get('cursor') or request.POST.get('cursor', '')
+        page_obj = keyset_paginate(annotated_products, items_per_page, cursor)
+    else:
+        signature: str = filter_signature(
+            code=code_filter, model=model_filter, name=name_filter,
+            categories=category_filter, suppliers=supplier_filter, search=search_filter, order_days=order_days_value,
+            **{
+                f'{bound}_{name}': filter_data.get(f'{bound}_{name}', '')
+                for name in PLANNING_COLUMNS for bound in ('min', 'max')
+            }
+        )
+        paginator: Paginator = CachedCountPaginator(
+            annotated_products,
+            items_per_page,
+            cache_key=product_count_cache_key(signature),
+            cache_timeout=settings.PRODUCT_LIST_COUNT_CACHE_TIMEOUT,
+            estimate_threshold=settings.PRODUCT_LIST_COUNT_ESTIMATE_THRESHOLD if settings.PRODUCT_LIST_COUNT_ESTIMATE else None
+        )
+        page_number: str = request.GET.get('page') if request.GET.get('page') else request.POST.get('page_number', 1)
+        page_obj = paginator.get_page(page_number)
+    page_obj.object_list = refresh_stale_page_products(list(page_obj.object_list), order_days_value)
     # Update the context dictionary
     context['products'] = page_obj
     context['paginator'] = paginator
@@ -204,6 +409,12 @@ def populate_product_list_context(request, context):
     context['name_filter_form'] = name_filter_form
     context['category_filter_form'] = category_filter_form
     context['supplier_filter_form'] = supplier_filter_form
+    context['search_form'] = search_form
+    context['stock_filter_form'] = stock_filter_form
+    context['daily_demand_filter_form'] = daily_demand_filter_form
+    context['remainder_days_filter_form'] = remainder_days_filter_form
+    context['po_quantity_filter_form'] = po_quantity_filter_form
+    context['sort'] = sort
     context['selected_categories'] = category_filter
     context['selected_suppliers'] = supplier_filter
 
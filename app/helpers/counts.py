@@ -0,0 +1,75 @@
+import hashlib
+import json
+from typing import Optional
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from app.helpers.data_version import get_data_version
+
+
+def filter_signature(**filters) -> str:
+    """
+    Stable hash of list filters: text filters are stripped and lower-cased (they
+    are matched case-insensitively) and multi-value filters sorted
+    """
+    normalised: dict = {}
+    for name, value in sorted(filters.items()):
+        if isinstance(value, (list, tuple, set)):
+            normalised[name] = sorted(str(item) for item in value)
+        else:
+            normalised[name] = str(value or '').strip().lower()
+    return hashlib.sha1(json.dumps(normalised, sort_keys=True).encode()).hexdigest()
+
+
+def product_count_cache_key(signature: str) -> str:
+    """Cache key for a filtered product count, stale as soon as the data version moves"""
+    return f'product_count:{signature}:{get_data_version()}'
+
+
+def estimate_queryset_count(queryset: QuerySet) -> int:
+    """Row estimate for a queryset from the PostgreSQL planner (EXPLAIN, nothing is executed)"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose count is cached under cache_key. With estimate_threshold set,
+    result sets the planner expects to reach the threshold are not counted at all:
+    the planner estimate is used and is_estimate is set so it can be shown as "~N".
+    """
+
+    def __init__(self, object_list, per_page, cache_key: str = '', cache_timeout: int = 300,
+                 estimate_threshold: Optional[int] = None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.cache_timeout = cache_timeout
+        self.estimate_threshold = estimate_threshold
+        self.is_estimate = False
+
+    @cached_property
+    def count(self) -> int:
+        if self.cache_key:
+            cached: Optional[tuple] = cache.get(self.cache_key)
+            if cached is not None:
+                count, self.is_estimate = cached
+                return count
+        count: int = self.compute_count()
+        if self.cache_key:
+            cache.set(self.cache_key, (count, self.is_estimate), self.cache_timeout)
+        return count
+
+    def compute_count(self) -> int:
+        if self.estimate_threshold is not None and connection.vendor == 'postgresql':
+            estimate: int = estimate_queryset_count(self.object_list)
+            if estimate >= self.estimate_threshold:
+                self.is_estimate = True
+                return estimate
+        return self.object_list.count()
@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Optional
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+# Created by migration 0010; versions are its values, so bumps never wait on a row lock
+DATA_VERSION_SEQUENCE: str = 'app_dataversion_seq'
+# Seconds the first-seen time of a version is remembered for Last-Modified
+DATA_VERSION_SEEN_TIMEOUT: int = 7 * 24 * 3600
+
+
+def get_data_version() -> int:
+    """Current data version, 0 before the first change"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {DATA_VERSION_SEQUENCE}')
+        return cursor.fetchone()[0]
+
+
+def get_data_version_stamp() -> tuple[int, Optional[datetime]]:
+    """
+    Current data version and the time it was first seen, (0, None) before the first change.
+    A sequence keeps no timestamps, so the time comes from the cache: it never goes back
+    for newer versions, and losing it only makes the next Last-Modified later.
+    """
+    version: int = get_data_version()
+    if not version:
+        return 0, None
+    key: str = f'data_version_seen:{version}'
+    cache.add(key, timezone.now(), DATA_VERSION_SEEN_TIMEOUT)
+    return version, cache.get(key)
+
+
+def advance_data_version() -> int:
+    """Take the next data version"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT nextval('{DATA_VERSION_SEQUENCE}')")
+        return cursor.fetchone()[0]
+
+
+def bump_data_version() -> int:
+    """
+    Move the data version forward after a write. nextval never blocks, so concurrent
+    writers do not queue on a shared row, but other connections see the new version
+    before the write commits and may cache old results under it. Inside a transaction
+    the version therefore moves once more when it commits.
+    """
+    version: int = advance_data_version()
+    if connection.in_atomic_block:
+        transaction.on_commit(advance_data_version)
+    return version
@@ -0,0 +1,29 @@
+from typing import Iterable
+from app.helpers.data_version import bump_data_version
+from app.helpers.rollups import rebuild_metric_rollups, refresh_metric_rollups
+from app.helpers.series import rebuild_product_series, refresh_product_series
+from app.helpers.snapshots import refresh_product_snapshots
+
+
+def refresh_derived_metrics(changes: dict):
+    """
+    Refresh rollups, series and snapshots after daily metrics changed and bump the data version.
+    changes maps product id -> (first changed date, last changed date).
+    """
+    if not changes:
+        return
+    refresh_metric_rollups(changes)
+    refresh_product_series(changes)
+    refresh_product_snapshots(changes)
+    bump_data_version()
+
+
+def rebuild_derived_metrics(product_ids: Iterable[int]):
+    """Rebuild rollups, series and snapshots of products whose whole history changed"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    rebuild_metric_rollups(product_ids)
+    rebuild_product_series(product_ids)
+    refresh_product_snapshots(product_ids)
+    bump_data_version()
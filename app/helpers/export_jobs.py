@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+import tempfile
+import uuid
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from app.models import ExportJob
+from app.helpers.exports import (
+    EXPORT_CHUNK_SIZE, export_params_from_session, product_export_queryset, product_export_rows, refresh_export_snapshots,
+    write_product_export
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ExportJobReclaimed(Exception):
+    """The job was reclaimed from this worker as stale and belongs to another run now"""
+
+
+def create_export_job(session, export_format: str = 'xlsx') -> ExportJob:
+    """Queue an export of the product list as the session currently shows it"""
+    return ExportJob.objects.create(params=export_params_from_session(session), format=export_format)
+
+
+def claim_export_job() -> Optional[ExportJob]:
+    """
+    Take the oldest pending job and mark it running. SKIP LOCKED lets several workers
+    poll the same table without waiting on, or taking, each other's jobs.
+    """
+    with transaction.atomic():
+        job: Optional[ExportJob] = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ExportJob.PENDING)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ExportJob.RUNNING
+        job.started_at = timezone.now()
+        job.attempts += 1
+        # New for every claim, so a worker whose job was reclaimed can no longer write to it
+        job.claimed_by = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}'
+        job.save(update_fields=['status', 'started_at', 'attempts', 'claimed_by', 'updated_at'])
+    return job
+
+
+def claimed_job(job: ExportJob):
+    """The job's row as long as this worker's claim holds"""
+    return ExportJob.objects.filter(pk=job.pk, status=ExportJob.RUNNING, claimed_by=job.claimed_by)
+
+
+def heartbeat(job: ExportJob, **fields):
+    """Move the job's updated_at (and store fields) or raise ExportJobReclaimed if the claim was lost"""
+    if not claimed_job(job).update(updated_at=timezone.now(), **fields):
+        raise ExportJobReclaimed(job.pk)
+
+
+def reclaim_stale_export_jobs() -> int:
+    """
+    Queue running jobs again whose heartbeat (updated_at) is older than
+    EXPORT_JOB_STALE_MINUTES because their worker died, or fail them once they have used
+    EXPORT_JOB_MAX_ATTEMPTS so a job that kills its worker is not retried forever. Failed
+    jobs expire like finished ones. Each step is one conditional UPDATE, so workers may
+    run it concurrently. Returns the number of jobs reclaimed.
+    """
+    now = timezone.now()
+    stale = ExportJob.objects.filter(
+        status=ExportJob.RUNNING, updated_at__lt=now - timedelta(minutes=settings.EXPORT_JOB_STALE_MINUTES)
+    )
+    failed: int = stale.filter(attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+        status=ExportJob.FAILED, error='The export worker stopped responding.', finished_at=now,
+        expires_at=now + timedelta(hours=settings.EXPORT_JOB_EXPIRY_HOURS), updated_at=now
+    )
+    requeued: int = stale.update(
+        status=ExportJob.PENDING, processed_rows=0, started_at=None, claimed_by='', updated_at=now
+    )
+    if failed or requeued:
+        logger.warning('Reclaimed stale export jobs: %s queued again, %s failed', requeued, failed)
+    return failed + requeued
+
+
+def track_progress(job: ExportJob, rows: Iterable[list], every: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """Pass rows through, storing the number written and a heartbeat on the job every `every` rows"""
+    processed: int = 0
+    for processed, row in enumerate(rows, start=1):
+        if processed % every == 0:
+            heartbeat(job, processed_rows=processed)
+        yield row
+    job.processed_rows = processed
+
+
+def run_export_job(job: ExportJob) -> ExportJob:
+    """
+    Refresh the stale snapshots of the exported products, write a claimed job's export to
+    MEDIA_ROOT/exports/ and mark it done, or failed with the error. The file is kept for
+    EXPORT_JOB_EXPIRY_HOURS. The heartbeat also moves around the snapshot refresh and row
+    count, and the result is only stored while this worker's claim holds: a job reclaimed
+    as stale in the meantime is left to its new run and this run's file is dropped.
+    """
+    try:
+        heartbeat(job)
+        refresh_export_snapshots(job.params)
+        heartbeat(job)
+        products = product_export_queryset(job.params)
+        job.total_rows = products.count()
+        heartbeat(job, total_rows=job.total_rows)
+        with tempfile.TemporaryFile() as file:
+            write_product_export(file, job.format, track_progress(job, product_export_rows(products)))
+            file.seek(0)
+            job.file.save(f'products-{job.pk}.{job.format}', File(file), save=False)
+    except ExportJobReclaimed:
+        logger.warning('Export job %s was reclaimed from this worker, dropping this run', job.pk)
+        job.refresh_from_db()
+        return job
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception('Export job %s failed', job.pk)
+        job.status = ExportJob.FAILED
+        job.error = str(exc)
+    else:
+        job.status = ExportJob.DONE
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + timedelta(hours=settings.EXPORT_JOB_EXPIRY_HOURS)
+    finished: int = claimed_job(job).update(
+        status=job.status, error=job.error, file=job.file.name or '', total_rows=job.total_rows,
+        processed_rows=job.processed_rows, finished_at=job.finished_at, expires_at=job.expires_at,
+        updated_at=job.finished_at
+    )
+    if not finished:
+        logger.warning('Export job %s was reclaimed from this worker, dropping its result', job.pk)
+        if job.file:
+            job.file.delete(save=False)
+        job.refresh_from_db()
+    return job
+
+
+def purge_expired_export_jobs() -> int:
+    """Delete expired jobs and their files, returns the number of jobs deleted"""
+    expired: list = list(ExportJob.objects.filter(expires_at__lt=timezone.now()))
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+    return len(expired)
@@ -0,0 +1,246 @@
+import csv
+import io
+import json
+import tempfile
+from itertools import chain, islice
+from typing import Iterable, Iterator
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import QuerySet, Subquery, OuterRef, CharField
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from app.models import Product, Supplier
+from app.helpers.context import (
+    filter_product_queryset, annotate_product_queryset, apply_planning_filters, sort_product_queryset
+)
+from app.helpers.snapshots import refresh_stale_product_snapshots
+from app.helpers.categories import get_category_tree
+
+# Rows fetched per server-side cursor round trip, and per CSV / NDJSON write or Parquet row group
+EXPORT_CHUNK_SIZE: int = 2000
+# Column widths are estimated from this many leading rows instead of a second pass over every cell
+EXCEL_WIDTH_SAMPLE_ROWS: int = 500
+XLSX_CONTENT_TYPE: str = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# (header, NDJSON key / Parquet column) of the product planning export in column order
+PRODUCT_EXPORT_COLUMNS: tuple = (
+    ('Code', 'code'),
+    ('Model', 'model'),
+    ('Name', 'name'),
+    ('Category', 'category'),
+    ('Suppliers', 'suppliers'),
+    ('Current stock', 'current_stock'),
+    ('Daily Demand', 'daily_demand'),
+    ('Days Left', 'days_left'),
+    ('PO Qty', 'po_quantity'),
+)
+PRODUCT_EXPORT_HEADERS: list = [header for header, _ in PRODUCT_EXPORT_COLUMNS]
+MULTI_VALUE_FILTERS: tuple = ('categories', 'suppliers')
+
+
+def session_form_value(data, key: str) -> str:
+    """
+    Single value of a form stored in the session. A QueryDict stored in the session
+    comes back as a dict of value lists, keep the last value like QueryDict.get.
+    """
+    value = data.get(key, '')
+    if isinstance(value, list):
+        value = value[-1] if value else ''
+    return str(value or '')
+
+
+def export_params_from_session(session) -> dict:
+    """
+    JSON-safe snapshot of the product list state an export follows: the filters, order
+    days and sort stored in the session
+    """
+    filter_data = session.get('filter_data', {})
+    filters: dict = {}
+    for key in filter_data.keys():
+        if key in MULTI_VALUE_FILTERS:
+            values = filter_data.getlist(key) if hasattr(filter_data, 'getlist') else filter_data.get(key) or []
+            filters[key] = [str(value) for value in values]
+        else:
+            filters[key] = session_form_value(filter_data, key)
+    try:
+        order_days: int = max(int(session_form_value(session.get('order_days_data', {}), 'order_days') or 0), 0)
+    except ValueError:
+        order_days = 0
+    return {'filters': filters, 'order_days': order_days, 'sort': session.get('product_sort', '')}
+
+
+def filter_export_products(params: dict) -> QuerySet:
+    """Active products matching the export's list filters, before annotation"""
+    filters: dict = params.get('filters', {})
+    return filter_product_queryset(
+        product_queryset=Product.objects.filter(is_active=True).order_by('code'),
+        code_filter=filters.get('code', ''),
+        model_filter=filters.get('model', ''),
+        name_filter=filters.get('name', ''),
+        category_filter=filters.get('categories', []),
+        supplier_filter=filters.get('suppliers', []),
+        search_filter=filters.get('search', '')
+    )
+
+
+def refresh_export_snapshots(params: dict) -> int:
+    """Refresh the stale snapshots of the products an export covers, returns the number refreshed"""
+    return refresh_stale_product_snapshots(filter_export_products(params).values_list('pk', flat=True))
+
+
+def product_export_queryset(params: dict) -> QuerySet:
+    """
+    Active products filtered, annotated and sorted like the product list, ready for
+    product_export_rows. Snapshots are read as stored: refreshing a whole catalog does not
+    belong in a request, the export worker calls refresh_export_snapshots first.
+    """
+    filters: dict = params.get('filters', {})
+    products: QuerySet = filter_export_products(params)
+    products = annotate_product_queryset(product_queryset=products, order_days_value=params.get('order_days', 0))
+    products = sort_product_queryset(apply_planning_filters(products, filters), params.get('sort', ''))
+    # Supplier names per product from a correlated subquery, no prefetch or row-multiplying join
+    return products.annotate(
+        supplier_names=Subquery(
+            Supplier.products.through.objects.filter(product_id=OuterRef('pk'))
+            .order_by().values('product_id')
+            .annotate(names=StringAgg('supplier__company_name', ', ', ordering='supplier__company_name'))
+            .values('names'),
+            output_field=CharField()
+        )
+    )
+
+
+def product_export_rows(queryset: QuerySet, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """
+    Export rows (PRODUCT_EXPORT_COLUMNS order) of a product_export_queryset, read as plain
+    tuples through a server-side cursor in chunks, so only one chunk is held at a time
+    and no model instances are built. Category paths come from the in-memory tree.
+    """
+    tree = get_category_tree()
+    rows = queryset.values_list(
+        'code', 'model', 'name', 'category_id', 'supplier_names',
+        'current_stock', 'avg_daily_demand', 'remainder_days', 'po_quantity'
+    ).iterator(chunk_size=chunk_size)
+    for code, model, name, category_id, suppliers, stock, demand, remainder_days, po_quantity in rows:
+        yield [
+            code, model, name,
+            (tree.path(category_id) or '-') if category_id else '-',
+            suppliers or '',
+            stock or 0, demand or 0, remainder_days or 0, po_quantity or 0
+        ]
+
+
+def sample_column_widths(headers: list, rows: list) -> list[int]:
+    """Column widths fitting the headers and a sample of rows"""
+    widths: list[int] = [len(str(header)) for header in headers]
+    for row in rows:
+        for index, value in enumerate(row[:len(widths)]):
+            widths[index] = max(widths[index], len(str(value)))
+    return [width + 2 for width in widths]
+
+
+def write_excel(file, title: str, headers: list, rows: Iterable[list]) -> None:
+    """
+    Write rows to an xlsx file object with a write-only workbook: rows go straight to the
+    sheet's temporary file instead of being kept as cells in memory
+    """
+    rows = iter(rows)
+    sample: list = list(islice(rows, EXCEL_WIDTH_SAMPLE_ROWS))
+    wb: Workbook = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    for index, width in enumerate(sample_column_widths(headers, sample), start=1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+    ws.append(headers)
+    for row in chain(sample, rows):
+        ws.append(row)
+    wb.save(file)
+
+
+def iter_csv(headers: list, rows: Iterable[list]) -> Iterator[bytes]:
+    """UTF-8 CSV of the rows in blocks of EXPORT_CHUNK_SIZE lines, for streaming or writing to a file"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def iter_ndjson(keys: list, rows: Iterable[list]) -> Iterator[bytes]:
+    """One JSON object per row keyed by keys, in blocks of EXPORT_CHUNK_SIZE lines"""
+    lines: list = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(keys, row)), ensure_ascii=False, separators=(',', ':')))
+        if len(lines) == EXPORT_CHUNK_SIZE:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def write_parquet(file, rows: Iterable[list]) -> None:
+    """Write product export rows to a Parquet file object, one row group per EXPORT_CHUNK_SIZE rows"""
+    import pyarrow  # pylint: disable=import-outside-toplevel
+    import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+    numeric_types: dict = {
+        'current_stock': pyarrow.int64(),
+        'daily_demand': pyarrow.float64(),
+        'days_left': pyarrow.int64(),
+        'po_quantity': pyarrow.float64(),
+    }
+    schema = pyarrow.schema([(key, numeric_types.get(key, pyarrow.string())) for _, key in PRODUCT_EXPORT_COLUMNS])
+    rows = iter(rows)
+    with pyarrow.parquet.ParquetWriter(file, schema) as writer:
+        while True:
+            chunk: list = list(islice(rows, EXPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            writer.write_batch(pyarrow.record_batch([list(column) for column in zip(*chunk)], schema=schema))
+
+
+# format -> (content type, streamed as rows are read instead of through a temporary file)
+EXPORT_FORMATS: dict = {
+    'xlsx': (XLSX_CONTENT_TYPE, False),
+    'csv': ('text/csv; charset=utf-8', True),
+    'ndjson': ('application/x-ndjson', True),
+    'parquet': ('application/vnd.apache.parquet', False),
+}
+
+
+def iter_product_export(export_format: str, rows: Iterable[list]) -> Iterator[bytes]:
+    """Encoded blocks of a streamed export format (csv or ndjson)"""
+    if export_format == 'csv':
+        return iter_csv(PRODUCT_EXPORT_HEADERS, rows)
+    return iter_ndjson([key for _, key in PRODUCT_EXPORT_COLUMNS], rows)
+
+
+def write_product_export(file, export_format: str, rows: Iterable[list]) -> None:
+    """Write product export rows to a binary file object in one of EXPORT_FORMATS"""
+    if export_format == 'xlsx':
+        write_excel(file, 'Products', PRODUCT_EXPORT_HEADERS, rows)
+    elif export_format == 'parquet':
+        write_parquet(file, rows)
+    else:
+        for block in iter_product_export(export_format, rows):
+            file.write(block)
+
+
+def product_export_response(export_format: str, rows: Iterable[list], filename: str = 'products'):
+    """
+    Download of product export rows with flat memory. CSV and NDJSON are streamed as the
+    rows are read; xlsx and Parquet need the whole file before their first byte, so they
+    are written to a temporary file that is then streamed in blocks.
+    """
+    content_type, streamed = EXPORT_FORMATS[export_format]
+    filename = f'{filename}.{export_format}'
+    if streamed:
+        response = StreamingHttpResponse(iter_product_export(export_format, rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    file = tempfile.TemporaryFile()
+    write_product_export(file, export_format, rows)
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
@@ -0,0 +1,48 @@
+from typing import Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet, Count
+from app.helpers.data_version import get_data_version
+
+# facet name -> (product field to group by, label field)
+PRODUCT_FACETS: dict = {
+    'categories': ('category', 'category__name'),
+    'suppliers': ('suppliers', 'suppliers__company_name'),
+}
+
+
+def product_facet(queryset: QuerySet, facet: str) -> dict:
+    """
+    Options of one filter dropdown for a filtered Product queryset with product counts,
+    from a single grouped query. Returns {'options': [(id, label, count), ...] by label,
+    'empty': number of products without a related object}.
+    """
+    field_name, label_field = PRODUCT_FACETS[facet]
+    # The filtered products as a semi-join, so filter joins and DISTINCT cannot inflate the counts
+    products: QuerySet = queryset.model.objects.filter(pk__in=queryset.order_by().values('pk'))
+    rows = products.order_by().values_list(field_name, label_field).annotate(count=Count('pk'))
+    options: list = []
+    empty: int = 0
+    for option_id, label, count in rows:
+        if option_id is None:
+            empty = count
+        else:
+            options.append((option_id, label, count))
+    options.sort(key=lambda option: (option[1] or '').lower())
+    return {'options': options, 'empty': empty}
+
+
+def get_product_facets(queryset: QuerySet, signature: Optional[str] = None) -> dict:
+    """
+    Every product facet of a filtered queryset ({facet name: product_facet(...)}), cached
+    by filter signature until the data version changes
+    """
+    cache_key: str = f'product_facets:{signature}:{get_data_version()}' if signature else ''
+    if cache_key:
+        facets: Optional[dict] = cache.get(cache_key)
+        if facets is not None:
+            return facets
+    facets = {facet: product_facet(queryset, facet) for facet in PRODUCT_FACETS}
+    if cache_key:
+        cache.set(cache_key, facets, settings.PRODUCT_LIST_COUNT_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,198 @@
+import csv
+import io
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from app.models import Product
+from app.helpers.changes import propagate_daily_metrics_changes
+from app.helpers.partitions import ensure_future_partitions
+
+DAILY_METRICS_REQUIRED_COLUMNS: tuple = ('code', 'date')
+DAILY_METRICS_OPTIONAL_COLUMNS: tuple = ('sales_quantity', 'stock')
+STAGING_TABLE: str = 'app_dailymetrics_staging'
+# Error context PostgreSQL reports for a rejected COPY row, e.g. 'COPY ..., line 3, column date: "2024-13-01"'
+COPY_ERROR_CONTEXT = re.compile(r'line (\d+)(?:, column (\w+))?')
+
+
+def get_daily_metrics_csv_path() -> Path:
+    """
+    Path of the daily sales CSV configured by CSV_IMPORT_PATH / CSV_FILE_NAME
+    """
+    return Path(settings.CSV_IMPORT_PATH) / settings.CSV_FILE_NAME
+
+
+def get_product_code_map() -> dict:
+    """
+    Return {code: product id} for every product with a non-blank code
+    """
+    return dict(
+        Product.objects.exclude(code__isnull=True).exclude(code='').values_list('code', 'id').iterator(chunk_size=10000)
+    )
+
+
+class CopySource:
+    """
+    Read-only file-like object feeding ``COPY ... FROM STDIN`` from a row iterator.
+    Rows are serialised in CSV format a chunk at a time, so memory stays constant
+    no matter how many rows the iterator yields.
+    """
+
+    def __init__(self, rows: Iterable, chunk_rows: int = 10000):
+        self.rows: Iterator = iter(rows)
+        self.chunk_rows: int = chunk_rows
+        self.buffer: str = ''
+        self.exhausted: bool = False
+
+    def fill(self):
+        chunk = io.StringIO()
+        writer = csv.writer(chunk, lineterminator='\n')
+        for _ in range(self.chunk_rows):
+            row = next(self.rows, None)
+            if row is None:
+                self.exhausted = True
+                break
+            writer.writerow(row)
+        self.buffer += chunk.getvalue()
+
+    def read(self, size: int = -1) -> str:
+        while not self.exhausted and (size < 0 or len(self.buffer) < size):
+            self.fill()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size: int = -1) -> str:
+        while not self.exhausted and '\n' not in self.buffer:
+            self.fill()
+        end = self.buffer.find('\n') + 1 or len(self.buffer)
+        if 0 <= size < end:
+            end = size
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+
+def iter_daily_metrics_rows(csv_file, code_map: dict, stats: dict, delimiter: str = ',') -> Iterator[tuple]:
+    """
+    Yield staging rows (line_no, product_id, date, sales_quantity, stock) from an open CSV file.
+    The header is validated eagerly so a bad file fails before COPY starts.
+    Rows with unknown product codes are counted in stats and skipped.
+    """
+    reader = csv.reader(csv_file, delimiter=delimiter)
+    header: list = [column.strip().lower() for column in next(reader, [])]
+    missing: list = [column for column in DAILY_METRICS_REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+    code_index: int = header.index('code')
+    date_index: int = header.index('date')
+    sales_index: Optional[int] = header.index('sales_quantity') if 'sales_quantity' in header else None
+    stock_index: Optional[int] = header.index('stock') if 'stock' in header else None
+    stats['columns'] = [column for column in DAILY_METRICS_OPTIONAL_COLUMNS if column in header]
+    unknown_codes: set = stats['unknown_codes']
+
+    def rows() -> Iterator[tuple]:
+        for line_no, record in enumerate(reader, start=2):
+            if not record:
+                continue
+            stats['rows_read'] += 1
+            code: str = record[code_index].strip()
+            product_id: Optional[int] = code_map.get(code)
+            if product_id is None:
+                stats['rows_skipped'] += 1
+                unknown_codes.add(code)
+                continue
+            yield (
+                line_no,
+                product_id,
+                record[date_index].strip(),
+                record[sales_index].strip() if sales_index is not None else '',
+                record[stock_index].strip() if stock_index is not None else '',
+            )
+
+    return rows()
+
+
+def describe_copy_error(exc: Exception, path: Path, code_map: dict, delimiter: str, encoding: str) -> str:
+    """
+    Message for a row COPY rejected, naming its line in the CSV file and the column.
+    PostgreSQL counts the rows sent to COPY, which skip the header and unknown codes, so
+    the file is read again to find the CSV line; this only happens after a failure.
+    """
+    diag = getattr(exc.__cause__, 'diag', None)
+    message: str = (diag.message_primary if diag else None) or str(exc).strip().splitlines()[0]
+    match = COPY_ERROR_CONTEXT.search((diag.context if diag else None) or '')
+    if not match:
+        return f'Invalid daily metrics data: {message}'
+    copy_line: int = int(match.group(1))
+    location: str = f'line {copy_line} of the loaded rows'
+    with open(path, newline='', encoding=encoding) as csv_file:
+        stats: dict = {'rows_read': 0, 'rows_skipped': 0, 'unknown_codes': set()}
+        for index, row in enumerate(iter_daily_metrics_rows(csv_file, code_map, stats, delimiter=delimiter), start=1):
+            if index == copy_line:
+                location = f'line {row[0]}'
+                break
+    column: Optional[str] = match.group(2) or (diag.column_name if diag else None)
+    if column:
+        location += f', column {column}'
+    return f'Invalid daily metrics data on {location}: {message}'
+
+
+def import_daily_metrics_csv(path: Optional[Path] = None, delimiter: str = ',', encoding: str = 'utf-8') -> dict:
+    """
+    Stream the daily sales CSV into DailyMetrics.
+    Rows are loaded with COPY into a temporary staging table and upserted on the
+    (product, date) unique key; the last row in the file wins for duplicate keys.
+    Columns missing from the file keep their stored values on existing rows.
+    Existing potential_sales values are kept, new rows get NULL until recomputed.
+    Monthly partitions for the coming months are created on the way.
+    A malformed value raises ValueError naming its CSV line and column; nothing is imported.
+    stats['changes'] maps each touched product id to its (first, last) imported date;
+    products whose history was backfilled get their potential sales state invalidated
+    and every touched product gets its rollups and snapshot refreshed.
+    """
+    path = Path(path) if path else get_daily_metrics_csv_path()
+    stats: dict = {
+        'rows_read': 0, 'rows_skipped': 0, 'rows_upserted': 0, 'unknown_codes': set(), 'columns': [], 'changes': {}
+    }
+    code_map: dict = get_product_code_map()
+    with transaction.atomic(), connection.cursor() as cursor, open(path, newline='', encoding=encoding) as csv_file:
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                line_no bigint NOT NULL,
+                product_id bigint NOT NULL,
+                date date NOT NULL,
+                sales_quantity integer,
+                -- Mirrors the app_dailymetrics check so COPY reports the offending line
+                stock integer CHECK (stock >= 0)
+            ) ON COMMIT DROP
+        """)
+        rows: Iterator[tuple] = iter_daily_metrics_rows(csv_file, code_map, stats, delimiter=delimiter)
+        try:
+            # copy_expert is not wrapped by Django, so translate driver errors here
+            with connection.wrap_database_errors:
+                cursor.copy_expert(
+                    f"COPY {STAGING_TABLE} (line_no, product_id, date, sales_quantity, stock) FROM STDIN WITH (FORMAT csv)",
+                    CopySource(rows),
+                )
+        except (DataError, IntegrityError) as exc:
+            raise ValueError(describe_copy_error(exc, path, code_map, delimiter, encoding)) from exc
+        ensure_future_partitions()
+        update_columns: list = stats['columns']
+        on_conflict: str = 'DO UPDATE SET ' + ', '.join(
+            f'{column} = EXCLUDED.{column}' for column in update_columns
+        ) if update_columns else 'DO NOTHING'
+        cursor.execute(f"""
+            INSERT INTO app_dailymetrics (product_id, date, sales_quantity, stock, potential_sales)
+            SELECT DISTINCT ON (product_id, date) product_id, date, sales_quantity, stock, NULL
+            FROM {STAGING_TABLE}
+            ORDER BY product_id, date, line_no DESC
+            ON CONFLICT (product_id, date) {on_conflict}
+        """)
+        stats['rows_upserted'] = cursor.rowcount
+        cursor.execute(f"SELECT product_id, MIN(date), MAX(date) FROM {STAGING_TABLE} GROUP BY product_id")
+        stats['changes'] = {product_id: (first_date, last_date) for product_id, first_date, last_date in cursor.fetchall()}
+        cursor.execute(f"DROP TABLE {STAGING_TABLE}")
+        propagate_daily_metrics_changes(stats['changes'])
+    return stats
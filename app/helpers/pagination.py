@@ -0,0 +1,121 @@
+import base64
+import binascii
+import json
+from typing import Optional
+from django.db.models import QuerySet, Q
+
+# Cursor directions: rows after the key (next page) or before it (previous page)
+AFTER: str = 'a'
+BEFORE: str = 'b'
+
+
+def encode_cursor(direction: str, code: Optional[str], pk: int) -> str:
+    """Opaque URL-safe token for a (code, id) position in the product list"""
+    payload: bytes = json.dumps([direction, code, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[tuple]:
+    """Decode a cursor token into (direction, code, id); invalid tokens give None (first page)"""
+    if not token:
+        return None
+    try:
+        direction, code, pk = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if direction not in (AFTER, BEFORE) or not isinstance(pk, int) or not (code is None or isinstance(code, str)):
+        return None
+    return direction, code, pk
+
+
+class KeysetPage:
+    """
+    One page of a keyset paginated product list. Exposes the parts of Django's Page
+    the templates use; there are no page numbers, only cursors to the neighbouring pages.
+    """
+    is_keyset: bool = True
+
+    def __init__(self, object_list: list, cursor: Optional[str], has_next: bool, has_previous: bool):
+        self.object_list = object_list
+        self.cursor = cursor or ''
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.has_next_page
+
+    def has_previous(self) -> bool:
+        return self.has_previous_page
+
+    def has_other_pages(self) -> bool:
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self) -> str:
+        if not self.has_next_page or not self.object_list:
+            return ''
+        last = self.object_list[-1]
+        return encode_cursor(AFTER, last.code, last.pk)
+
+    @property
+    def previous_cursor(self) -> str:
+        if not self.has_previous_page or not self.object_list:
+            return ''
+        first = self.object_list[0]
+        return encode_cursor(BEFORE, first.code, first.pk)
+
+
+def keyset_paginate(queryset: QuerySet, per_page: int, cursor: Optional[str] = None) -> KeysetPage:
+    """
+    Paginate a Product queryset by (code, id) without COUNT(*) or OFFSET.
+    Rows with a code come first in code order, then rows without a code in id order
+    (PostgreSQL's NULLS LAST). Each side is read with its own index-friendly seek, so
+    the cost of a page does not depend on its depth.
+    """
+    position: Optional[tuple] = decode_cursor(cursor)
+    queryset = queryset.order_by()
+    with_code: QuerySet = queryset.filter(code__isnull=False)
+    without_code: QuerySet = queryset.filter(code__isnull=True)
+    limit: int = per_page + 1
+
+    if position is None or position[0] == AFTER:
+        if position is None:
+            rows: list = list(with_code.order_by('code', 'pk')[:limit])
+            null_from: Optional[int] = 0
+        elif position[1] is not None:
+            code, pk = position[1], position[2]
+            # code >= x gives the index a start key, the OR only breaks ties on equal codes
+            rows = list(
+                with_code.filter(Q(code__gte=code) & (Q(code__gt=code) | Q(pk__gt=pk))).order_by('code', 'pk')[:limit]
+            )
+            null_from = 0
+        else:
+            rows = []
+            null_from = position[2]
+        if len(rows) < limit:
+            rows += list(without_code.filter(pk__gt=null_from).order_by('pk')[:limit - len(rows)])
+        return KeysetPage(rows[:per_page], cursor if position else None, len(rows) > per_page, position is not None)
+
+    code, pk = position[1], position[2]
+    if code is None:
+        rows = list(without_code.filter(pk__lt=pk).order_by('-pk')[:limit])
+        if len(rows) < limit:
+            rows += list(with_code.order_by('-code', '-pk')[:limit - len(rows)])
+    else:
+        rows = list(
+            with_code.filter(Q(code__lte=code) & (Q(code__lt=code) | Q(pk__lt=pk))).order_by('-code', '-pk')[:limit]
+        )
+    has_previous: bool = len(rows) > per_page
+    if not has_previous and len(rows) < per_page:
+        # Walked back past the start: show a full first page instead of a short one
+        return keyset_paginate(queryset, per_page)
+    return KeysetPage(list(reversed(rows[:per_page])), cursor, True, has_previous)
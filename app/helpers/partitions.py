@@ -0,0 +1,157 @@
+import re
+from datetime import date
+from typing import Optional
+from django.db import connection
+from app.helpers.changes import propagate_daily_metrics_changes
+
+DAILY_METRICS_TABLE: str = 'app_dailymetrics'
+DEFAULT_PARTITION: str = f'{DAILY_METRICS_TABLE}_default'
+PARTITION_BOUND_RE = re.compile(r"FOR VALUES FROM \('(?P<start>[\d-]+)'\) TO \('(?P<end>[\d-]+)'\)")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    """Shift the first day of a month by a number of months"""
+    index: int = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{DAILY_METRICS_TABLE}_p{month:%Y_%m}'
+
+
+def is_partitioned() -> bool:
+    """Check if app_dailymetrics is a range partitioned table (PostgreSQL only)"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+            [DAILY_METRICS_TABLE]
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions() -> list:
+    """
+    Attached partitions of app_dailymetrics ordered by range as dicts
+    {'name', 'start', 'end', 'rows'}; the default partition has start and end None
+    and rows is the planner's estimate.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), GREATEST(child.reltuples, 0)::bigint
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+        """, [DAILY_METRICS_TABLE])
+        rows: list = cursor.fetchall()
+    partitions: list = []
+    for name, bound, estimated_rows in rows:
+        match = PARTITION_BOUND_RE.match(bound)
+        partitions.append({
+            'name': name,
+            'start': date.fromisoformat(match['start']) if match else None,
+            'end': date.fromisoformat(match['end']) if match else None,
+            'rows': estimated_rows,
+        })
+    return sorted(partitions, key=lambda partition: (partition['start'] is None, partition['start'] or date.min))
+
+
+def create_monthly_partitions(first_day: date, last_day: date) -> list:
+    """
+    Create the missing monthly partitions covering first_day..last_day.
+    Rows for a new month already sitting in the default partition are moved into it
+    before it is attached. Months whose partition name is taken by a detached archive
+    table are skipped and keep using the default partition.
+    Returns the names of the created partitions.
+    """
+    if not is_partitioned() or last_day < first_day:
+        return []
+    existing: set = {partition['start'] for partition in list_partitions()}
+    created: list = []
+    month: date = month_start(first_day)
+    with connection.cursor() as cursor:
+        while month <= last_day:
+            next_month: date = add_months(month, 1)
+            name: str = partition_name(month)
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+            if month not in existing and not cursor.fetchone()[0]:
+                cursor.execute(
+                    f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s)',
+                    [month, next_month]
+                )
+                if cursor.fetchone()[0]:
+                    cursor.execute(f'CREATE TABLE {name} (LIKE {DAILY_METRICS_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+                    cursor.execute(f"""
+                        WITH moved AS (
+                            DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *
+                        )
+                        INSERT INTO {name} SELECT * FROM moved
+                    """, [month, next_month])
+                    cursor.execute(
+                        f'ALTER TABLE {DAILY_METRICS_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                        [month, next_month]
+                    )
+                else:
+                    cursor.execute(
+                        f'CREATE TABLE {name} PARTITION OF {DAILY_METRICS_TABLE} FOR VALUES FROM (%s) TO (%s)',
+                        [month, next_month]
+                    )
+                created.append(name)
+            month = next_month
+    return created
+
+
+def ensure_future_partitions(months_ahead: int = 3, today: Optional[date] = None) -> list:
+    """Create partitions for the current month and the next months_ahead months"""
+    current_month: date = month_start(today or date.today())
+    return create_monthly_partitions(current_month, add_months(current_month, months_ahead))
+
+
+def detach_partitions_before(cutoff: date, drop: bool = False) -> list:
+    """
+    Detach monthly partitions that end on or before the month of cutoff, so retention
+    is a metadata operation instead of a mass DELETE. Detached tables are kept as
+    archives unless drop is set. Data derived from DailyMetrics (potential sales state,
+    rollups, series, snapshots) is then brought in line with the remaining rows like
+    after a delete: the detached months disappear from the rollups and the series.
+    Returns the names of the detached partitions.
+    """
+    if not is_partitioned():
+        return []
+    boundary: date = month_start(cutoff)
+    detached: list = []
+    changes: dict = {}
+    with connection.cursor() as cursor:
+        for partition in list_partitions():
+            if partition['end'] is None or partition['end'] > boundary:
+                continue
+            # One pass over the month being archived for the products and dates it held
+            cursor.execute(f"SELECT product_id, MIN(date), MAX(date) FROM {partition['name']} GROUP BY product_id")
+            for product_id, first_date, last_date in cursor.fetchall():
+                previous: Optional[tuple] = changes.get(product_id)
+                changes[product_id] = (
+                    (min(previous[0], first_date), max(previous[1], last_date)) if previous else (first_date, last_date)
+                )
+            cursor.execute(f"ALTER TABLE {DAILY_METRICS_TABLE} DETACH PARTITION {partition['name']}")
+            if drop:
+                cursor.execute(f"DROP TABLE {partition['name']}")
+            detached.append(partition['name'])
+    propagate_daily_metrics_changes(changes)
+    return detached
+
+
+def split_default_partition() -> list:
+    """Move rows from the default partition into monthly partitions of their own"""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(date), MAX(date) FROM {DEFAULT_PARTITION}')
+        first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return []
+    return create_monthly_partitions(first_day, last_day)
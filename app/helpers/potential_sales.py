@@ -0,0 +1,176 @@
+from typing import Iterable
+from django.db import connection, transaction
+from app.helpers.derived import rebuild_derived_metrics, refresh_derived_metrics
+
+
+def update_potential_sales(product_ids: Iterable[int], min_stock: int = 1) -> int:
+    """
+    Set-based Product.update_all_potential_sales for a batch of products.
+    A single UPDATE ... FROM computes each product's good-stock average and writes
+    every daily metric with CASE: actual sales on good stock days, the average otherwise.
+    The products' PotentialSalesState is rebuilt so later refreshes can be incremental
+    and their rollups, series and snapshot rebuilt.
+    Returns the number of daily metrics updated.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    params: dict = {'min_stock': min_stock, 'product_ids': product_ids}
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE app_dailymetrics AS dm
+            SET potential_sales = CASE
+                WHEN dm.stock >= %(min_stock)s THEN COALESCE(dm.sales_quantity, 0)::double precision
+                ELSE averages.average
+            END
+            FROM (
+                SELECT
+                    product_id,
+                    COALESCE(
+                        AVG(sales_quantity) FILTER (WHERE stock >= %(min_stock)s AND sales_quantity IS NOT NULL),
+                        0
+                    )::double precision AS average
+                FROM app_dailymetrics
+                WHERE product_id = ANY(%(product_ids)s)
+                GROUP BY product_id
+            ) AS averages
+            WHERE dm.product_id = averages.product_id
+        """, params)
+        rows_updated: int = cursor.rowcount
+        cursor.execute("""
+            INSERT INTO app_potentialsalesstate
+                (product_id, min_stock, computed_until, good_stock_sales_sum, good_stock_days, updated_at)
+            SELECT
+                product_id,
+                %(min_stock)s,
+                MAX(date),
+                COALESCE(SUM(sales_quantity) FILTER (WHERE stock >= %(min_stock)s AND sales_quantity IS NOT NULL), 0),
+                COUNT(*) FILTER (WHERE stock >= %(min_stock)s AND sales_quantity IS NOT NULL),
+                NOW()
+            FROM app_dailymetrics
+            WHERE product_id = ANY(%(product_ids)s)
+            GROUP BY product_id
+            ON CONFLICT (product_id) DO UPDATE SET
+                min_stock = EXCLUDED.min_stock,
+                computed_until = EXCLUDED.computed_until,
+                good_stock_sales_sum = EXCLUDED.good_stock_sales_sum,
+                good_stock_days = EXCLUDED.good_stock_days,
+                updated_at = EXCLUDED.updated_at
+        """, params)
+    rebuild_derived_metrics(product_ids)
+    return rows_updated
+
+
+def refresh_potential_sales(product_ids: Iterable[int], min_stock: int = 1) -> dict:
+    """
+    Incrementally maintain potential sales for a batch of products.
+    Products with a valid PotentialSalesState only have daily metrics after the
+    watermark recomputed: the new good stock days are added to the running sum and
+    count, and the new rows are filled from the updated average. Earlier rows are
+    not rewritten, so their fill value is the average as of their own refresh.
+    Products without state, with an invalidated watermark or a different min_stock
+    get a full update_potential_sales.
+    Returns {'incremental': products, 'full': products, 'rows': daily metrics updated}.
+    """
+    product_ids = list(product_ids)
+    stats: dict = {'incremental': 0, 'full': 0, 'rows': 0}
+    if not product_ids:
+        return stats
+    params: dict = {'min_stock': min_stock, 'product_ids': product_ids}
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT product_id FROM app_potentialsalesstate
+            WHERE product_id = ANY(%(product_ids)s) AND min_stock = %(min_stock)s AND computed_until IS NOT NULL
+        """, params)
+        tracked_ids: set = {row[0] for row in cursor.fetchall()}
+    if tracked_ids:
+        changes: dict = _refresh_tracked_potential_sales(list(tracked_ids), min_stock)
+        stats['rows'] += sum(rows for _, _, rows in changes.values())
+        refresh_derived_metrics({product_id: (first, last) for product_id, (first, last, _) in changes.items()})
+    stats['incremental'] = len(tracked_ids)
+    untracked_ids: list = [product_id for product_id in product_ids if product_id not in tracked_ids]
+    if untracked_ids:
+        stats['rows'] += update_potential_sales(untracked_ids, min_stock=min_stock)
+        stats['full'] = len(untracked_ids)
+    return stats
+
+
+def _refresh_tracked_potential_sales(product_ids: list, min_stock: int) -> dict:
+    """
+    Fold daily metrics after each product's watermark into its state and fill them
+    from the updated running average in one statement.
+    Returns {product_id: (first updated date, last updated date, rows updated)}.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            WITH fresh AS (
+                SELECT
+                    dm.product_id,
+                    st.computed_until AS since,
+                    MAX(dm.date) AS until,
+                    COALESCE(SUM(dm.sales_quantity) FILTER (WHERE dm.stock >= %(min_stock)s AND dm.sales_quantity IS NOT NULL), 0) AS sales_sum,
+                    COUNT(*) FILTER (WHERE dm.stock >= %(min_stock)s AND dm.sales_quantity IS NOT NULL) AS good_days
+                FROM app_dailymetrics AS dm
+                JOIN app_potentialsalesstate AS st ON st.product_id = dm.product_id
+                WHERE dm.product_id = ANY(%(product_ids)s) AND dm.date > st.computed_until
+                GROUP BY dm.product_id, st.computed_until
+            ), state AS (
+                UPDATE app_potentialsalesstate AS st
+                SET good_stock_sales_sum = st.good_stock_sales_sum + fresh.sales_sum,
+                    good_stock_days = st.good_stock_days + fresh.good_days,
+                    computed_until = fresh.until,
+                    updated_at = NOW()
+                FROM fresh
+                WHERE st.product_id = fresh.product_id
+                RETURNING st.product_id, st.good_stock_sales_sum, st.good_stock_days, fresh.since
+            ), updated AS (
+                UPDATE app_dailymetrics AS dm
+                SET potential_sales = CASE
+                    WHEN dm.stock >= %(min_stock)s THEN COALESCE(dm.sales_quantity, 0)::double precision
+                    WHEN state.good_stock_days > 0
+                        THEN (state.good_stock_sales_sum::numeric / state.good_stock_days)::double precision
+                    ELSE 0
+                END
+                FROM state
+                WHERE dm.product_id = state.product_id AND dm.date > state.since
+                RETURNING dm.product_id, dm.date
+            )
+            SELECT product_id, MIN(date), MAX(date), COUNT(*) FROM updated GROUP BY product_id
+        """, {'min_stock': min_stock, 'product_ids': product_ids})
+        return {product_id: (first_date, last_date, rows) for product_id, first_date, last_date, rows in cursor.fetchall()}
+
+
+def invalidate_potential_sales(changes: dict):
+    """
+    Force a full recompute for products whose history changed at or before the watermark.
+    changes maps product id -> (first changed date, last changed date).
+    """
+    if not changes:
+        return
+    product_ids: list = list(changes)
+    first_dates: list = [first_date for first_date, _ in changes.values()]
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE app_potentialsalesstate AS st
+            SET computed_until = NULL, updated_at = NOW()
+            FROM unnest(%s::bigint[], %s::date[]) AS changed(product_id, first_date)
+            WHERE st.product_id = changed.product_id AND changed.first_date <= st.computed_until
+        """, [product_ids, first_dates])
+
+
+def shard_product_ids(product_ids: list, batch_size: int) -> list:
+    """
+    Split sorted product ids into consecutive shards of at most batch_size ids
+    """
+    return [product_ids[offset:offset + batch_size] for offset in range(0, len(product_ids), batch_size)]
+
+
+def recompute_potential_sales_shard(product_ids: list, min_stock: int = 1, incremental: bool = False) -> int:
+    """
+    Recompute potential sales for one shard of products in its own transaction.
+    Safe to run in a worker process: Django opens a fresh connection on first use.
+    """
+    with transaction.atomic():
+        if incremental:
+            return refresh_potential_sales(product_ids, min_stock=min_stock)['rows']
+        return update_potential_sales(product_ids, min_stock=min_stock)
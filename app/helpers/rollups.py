@@ -0,0 +1,82 @@
+from typing import Iterable
+from django.db import connection
+
+# (date_trunc unit, rollup table)
+ROLLUP_TABLES: tuple = (
+    ('week', 'app_weeklymetrics'),
+    ('month', 'app_monthlymetrics'),
+)
+ROLLUP_COLUMNS: str = (
+    'product_id, period_start, days, sales_quantity_sum, potential_sales_sum, potential_sales_days, '
+    'stock_days, stockout_days, min_stock, max_stock, last_stock'
+)
+ROLLUP_SELECT: str = """
+    SELECT
+        dm.product_id,
+        date_trunc(%(unit)s, dm.date::timestamp)::date,
+        COUNT(*),
+        COALESCE(SUM(dm.sales_quantity), 0),
+        COALESCE(SUM(dm.potential_sales), 0),
+        COUNT(dm.potential_sales),
+        COUNT(*) FILTER (WHERE dm.stock > 0),
+        COUNT(*) FILTER (WHERE dm.stock = 0),
+        MIN(dm.stock),
+        MAX(dm.stock),
+        (ARRAY_AGG(dm.stock ORDER BY dm.date DESC) FILTER (WHERE dm.stock IS NOT NULL))[1]
+    FROM app_dailymetrics AS dm
+"""
+
+
+def refresh_metric_rollups(changes: dict):
+    """
+    Recompute the weekly and monthly rollups of the periods touched by changed daily metrics.
+    changes maps product id -> (first changed date, last changed date); every period
+    between the two is rebuilt, so deleted daily rows are reflected as well.
+    """
+    if not changes:
+        return
+    params: dict = {
+        'product_ids': list(changes),
+        'first_dates': [first_date for first_date, _ in changes.values()],
+        'last_dates': [last_date for _, last_date in changes.values()],
+    }
+    changed_periods: str = """
+        SELECT
+            product_id,
+            date_trunc(%(unit)s, first_date::timestamp)::date AS period_from,
+            (date_trunc(%(unit)s, last_date::timestamp) + ('1 ' || %(unit)s)::interval)::date AS period_to
+        FROM unnest(%(product_ids)s::bigint[], %(first_dates)s::date[], %(last_dates)s::date[])
+            AS changed(product_id, first_date, last_date)
+    """
+    with connection.cursor() as cursor:
+        for unit, table in ROLLUP_TABLES:
+            cursor.execute(f"""
+                DELETE FROM {table} AS rollup
+                USING ({changed_periods}) AS changed
+                WHERE rollup.product_id = changed.product_id
+                    AND rollup.period_start >= changed.period_from AND rollup.period_start < changed.period_to
+            """, {**params, 'unit': unit})
+            cursor.execute(f"""
+                INSERT INTO {table} ({ROLLUP_COLUMNS})
+                {ROLLUP_SELECT}
+                JOIN ({changed_periods}) AS changed
+                    ON dm.product_id = changed.product_id
+                    AND dm.date >= changed.period_from AND dm.date < changed.period_to
+                GROUP BY 1, 2
+            """, {**params, 'unit': unit})
+
+
+def rebuild_metric_rollups(product_ids: Iterable[int]):
+    """Recompute every weekly and monthly rollup of a batch of products"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    with connection.cursor() as cursor:
+        for unit, table in ROLLUP_TABLES:
+            cursor.execute(f'DELETE FROM {table} WHERE product_id = ANY(%(product_ids)s)', {'product_ids': product_ids})
+            cursor.execute(f"""
+                INSERT INTO {table} ({ROLLUP_COLUMNS})
+                {ROLLUP_SELECT}
+                WHERE dm.product_id = ANY(%(product_ids)s)
+                GROUP BY 1, 2
+            """, {'product_ids': product_ids, 'unit': unit})
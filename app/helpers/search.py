@@ -0,0 +1,49 @@
+from typing import Optional
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import QuerySet, Q, F, FloatField
+from django.db.models.functions import Greatest
+
+SEARCH_FIELDS: tuple = ('code', 'model', 'name')
+
+_trigram_available: Optional[bool] = None
+
+
+def trigram_available() -> bool:
+    """
+    Check if the pg_trgm extension is installed in the current database. Looked up once
+    per process: the extension comes with migrations, so restart workers after adding it.
+    """
+    global _trigram_available
+    if _trigram_available is None:
+        if connection.vendor != 'postgresql':
+            _trigram_available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+                _trigram_available = cursor.fetchone()[0]
+    return _trigram_available
+
+
+def search_product_queryset(queryset: QuerySet, search: str) -> QuerySet:
+    """
+    Search everything box: products whose code, model or name contains search.
+    Each condition is an icontains that the trigram indexes serve; with pg_trgm the
+    matches are ranked by the best word similarity of the three fields (search_rank),
+    otherwise they keep the default (code, id) order.
+    """
+    search = search.strip()
+    if not search:
+        return queryset
+    condition: Q = Q()
+    for field_name in SEARCH_FIELDS:
+        condition |= Q(**{f'{field_name}__icontains': search})
+    queryset = queryset.filter(condition)
+    if not trigram_available():
+        return queryset
+    return queryset.annotate(
+        search_rank=Greatest(
+            *(TrigramWordSimilarity(search, field_name) for field_name in SEARCH_FIELDS),
+            output_field=FloatField()
+        )
+    ).order_by(F('search_rank').desc(nulls_last=True), 'code', 'pk')
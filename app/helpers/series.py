@@ -0,0 +1,218 @@
+from datetime import date, timedelta
+from typing import Iterable, Optional
+import numpy as np
+from django.db import connection
+
+# int32 value stored for days without data (sales can be negative, so no smaller sentinel)
+MISSING_INT: int = -2147483648
+# Packed big-endian arrays as produced by int4send / float4send
+SERIES_DTYPES: dict = {
+    'sales_quantity': np.dtype('>i4'),
+    'stock': np.dtype('>i4'),
+    'potential_sales': np.dtype('>f4'),
+}
+# Upper bound on the points of one downsampled series response
+SERIES_MAX_POINTS: int = 2000
+
+
+def rebuild_product_series(product_ids: Iterable[int]) -> int:
+    """
+    Rebuild the packed ProductSeries of a batch of products from DailyMetrics.
+    Each series covers every day from the first to the last daily metric; days without
+    a row or with a NULL value are stored as MISSING_INT (integers) or NaN (floats).
+    Products without daily metrics lose their series. Returns the number of series written.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM app_productseries WHERE product_id = ANY(%s)', [product_ids])
+        cursor.execute("""
+            INSERT INTO app_productseries (product_id, start_date, length, sales_quantity, stock, potential_sales, updated_at)
+            SELECT
+                bounds.product_id,
+                bounds.first_date,
+                COUNT(*),
+                string_agg(int4send(COALESCE(dm.sales_quantity, %(missing)s)), ''::bytea ORDER BY day.date),
+                string_agg(int4send(COALESCE(dm.stock, %(missing)s)), ''::bytea ORDER BY day.date),
+                string_agg(float4send(COALESCE(dm.potential_sales::real, 'NaN'::real)), ''::bytea ORDER BY day.date),
+                NOW()
+            FROM (
+                SELECT product_id, MIN(date) AS first_date, MAX(date) AS last_date
+                FROM app_dailymetrics
+                WHERE product_id = ANY(%(product_ids)s)
+                GROUP BY product_id
+            ) AS bounds
+            CROSS JOIN LATERAL (
+                SELECT generate_series(bounds.first_date::timestamp, bounds.last_date::timestamp, interval '1 day')::date AS date
+            ) AS day
+            LEFT JOIN app_dailymetrics AS dm ON dm.product_id = bounds.product_id AND dm.date = day.date
+            GROUP BY bounds.product_id, bounds.first_date
+        """, {'product_ids': product_ids, 'missing': MISSING_INT})
+        return cursor.rowcount
+
+
+def refresh_product_series(changes: dict) -> int:
+    """
+    Bring the packed ProductSeries of products with changed daily metrics up to date in
+    place. changes maps product id -> (first changed date, last changed date). Only the
+    changed days are repacked: bytes before them are kept, days appended after the old
+    end extend the series and deletes at the end shorten it. Products whose first day
+    moved (history added before it or the first row deleted) or that have no series
+    yet are rebuilt. Returns the number of series written.
+    """
+    if not changes:
+        return 0
+    with connection.cursor() as cursor:
+        # The new first / last day only needs an index probe when the change reaches the old end points
+        cursor.execute("""
+            SELECT
+                changed.product_id,
+                series.start_date,
+                series.length,
+                changed.first_date,
+                changed.last_date,
+                CASE WHEN series.product_id IS NULL OR changed.first_date <= series.start_date
+                    THEN (SELECT MIN(date) FROM app_dailymetrics WHERE product_id = changed.product_id)
+                    ELSE series.start_date END,
+                CASE WHEN series.product_id IS NULL OR changed.last_date >= series.start_date + series.length - 1
+                    THEN (SELECT MAX(date) FROM app_dailymetrics WHERE product_id = changed.product_id)
+                    ELSE series.start_date + series.length - 1 END
+            FROM unnest(%s::bigint[], %s::date[], %s::date[]) AS changed(product_id, first_date, last_date)
+            LEFT JOIN app_productseries AS series ON series.product_id = changed.product_id
+        """, [list(changes), [first for first, _ in changes.values()], [last for _, last in changes.values()]])
+        rebuild_ids: list = []
+        windows: list = []
+        for product_id, start_date, length, first_date, last_date, new_first, new_last in cursor.fetchall():
+            if start_date is None or new_first != start_date:
+                rebuild_ids.append(product_id)
+                continue
+            # Days between the old end and an appended day are repacked too, as missing
+            window_start: date = min(first_date, start_date + timedelta(days=length), new_last + timedelta(days=1))
+            windows.append((product_id, window_start, min(last_date, new_last), new_last))
+        written: int = rebuild_product_series(rebuild_ids)
+        if not windows:
+            return written
+        product_ids, window_starts, window_ends, new_lasts = (list(column) for column in zip(*windows))
+        # prefix before the window || repacked window || old bytes after the window up to the new end
+        splice: str = """
+            substring(series.{field} FROM 1 FOR (span.window_start - series.start_date) * 4)
+            || COALESCE(packed.{field}, ''::bytea)
+            || substring(series.{field} FROM (span.window_end - series.start_date + 1) * 4 + 1
+                         FOR (span.new_last - span.window_end) * 4)
+        """
+        cursor.execute(f"""
+            UPDATE app_productseries AS series SET
+                length = span.new_last - series.start_date + 1,
+                sales_quantity = {splice.format(field='sales_quantity')},
+                stock = {splice.format(field='stock')},
+                potential_sales = {splice.format(field='potential_sales')},
+                updated_at = NOW()
+            FROM unnest(%(product_ids)s::bigint[], %(window_starts)s::date[], %(window_ends)s::date[], %(new_lasts)s::date[])
+                AS span(product_id, window_start, window_end, new_last)
+            CROSS JOIN LATERAL (
+                SELECT
+                    string_agg(int4send(COALESCE(dm.sales_quantity, %(missing)s)), ''::bytea ORDER BY day.date) AS sales_quantity,
+                    string_agg(int4send(COALESCE(dm.stock, %(missing)s)), ''::bytea ORDER BY day.date) AS stock,
+                    string_agg(float4send(COALESCE(dm.potential_sales::real, 'NaN'::real)), ''::bytea ORDER BY day.date)
+                        AS potential_sales
+                FROM generate_series(span.window_start::timestamp, span.window_end::timestamp, interval '1 day') AS day(date)
+                LEFT JOIN app_dailymetrics AS dm ON dm.product_id = span.product_id AND dm.date = day.date::date
+            ) AS packed
+            WHERE series.product_id = span.product_id
+        """, {
+            'product_ids': product_ids, 'window_starts': window_starts, 'window_ends': window_ends,
+            'new_lasts': new_lasts, 'missing': MISSING_INT,
+        })
+        return written + cursor.rowcount
+
+
+def decode_series(field: str, packed: bytes) -> np.ma.MaskedArray:
+    """Unpack a stored series into a masked array, missing days are masked"""
+    values: np.ndarray = np.frombuffer(packed, dtype=SERIES_DTYPES[field])
+    if values.dtype.kind == 'f':
+        return np.ma.masked_invalid(values.astype(np.float64))
+    return np.ma.masked_equal(values.astype(np.int64), MISSING_INT)
+
+
+def get_product_series(product_id: int, fields: tuple = ('sales_quantity', 'stock', 'potential_sales'),
+                       start_date: Optional[date] = None, end_date: Optional[date] = None) -> Optional[dict]:
+    """
+    Read a product's daily history with one single-row fetch.
+    Returns {'dates': datetime64[D] array, <field>: masked array, ...} from start_date
+    to end_date (default: the first and last day with data), or None if there is no series.
+    """
+    unknown: set = set(fields) - set(SERIES_DTYPES)
+    if unknown:
+        raise ValueError(f"Unknown series fields: {', '.join(sorted(unknown))}")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT start_date, length{''.join(f', {field}' for field in fields)} "
+            'FROM app_productseries WHERE product_id = %s',
+            [product_id]
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    series_start, length = row[0], row[1]
+    skip: int = min(max((start_date - series_start).days, 0), length) if start_date else 0
+    stop: int = min(max((end_date - series_start).days + 1, skip), length) if end_date else length
+    series: dict = {
+        'dates': np.arange(np.datetime64(series_start, 'D') + skip, np.datetime64(series_start, 'D') + stop),
+    }
+    for field, packed in zip(fields, row[2:]):
+        series[field] = decode_series(field, bytes(packed))[skip:stop]
+    return series
+
+
+def lttb_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets downsampling of an
+    evenly spaced series: the first and last points, plus from each of threshold - 2
+    buckets the point forming the largest triangle with the point kept before it and
+    the average of the next bucket. Peaks and dips survive, unlike plain striding.
+    """
+    length: int = len(y)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+    y = np.asarray(y, dtype=np.float64)
+    edges: np.ndarray = np.floor(np.linspace(1, length - 1, threshold - 1)).astype(np.int64)
+    selected: np.ndarray = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+    previous: int = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x: float = (edges[bucket + 1] + edges[bucket + 2] - 1) / 2
+            next_y: float = y[edges[bucket + 1]:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = length - 1, y[-1]
+        x: np.ndarray = np.arange(start, end)
+        areas: np.ndarray = np.abs((previous - next_x) * (y[start:end] - y[previous]) - (previous - x) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_product_series(product_id: int, points: int, start_date: Optional[date] = None,
+                              end_date: Optional[date] = None) -> dict:
+    """
+    A product's daily history between the dates reduced to at most `points` days for
+    charting: {'dates': [...], 'stock': [...], 'sales_quantity': [...],
+    'potential_sales': [...], 'total_points': days in range}. Days are picked by LTTB
+    on stock, days without stock are left out; missing values of the other fields are None.
+    """
+    series: Optional[dict] = get_product_series(
+        product_id, fields=('stock', 'sales_quantity', 'potential_sales'), start_date=start_date, end_date=end_date
+    )
+    if series is None:
+        return {'dates': [], 'stock': [], 'sales_quantity': [], 'potential_sales': [], 'total_points': 0}
+    present: np.ndarray = np.flatnonzero(~np.ma.getmaskarray(series['stock']))
+    kept: np.ndarray = present[lttb_indices(series['stock'].data[present], min(points, SERIES_MAX_POINTS))]
+    return {
+        'dates': np.datetime_as_string(series['dates'][kept]).tolist(),
+        'stock': series['stock'][kept].tolist(),
+        'sales_quantity': series['sales_quantity'][kept].tolist(),
+        'potential_sales': np.ma.round(series['potential_sales'][kept], 2).tolist(),
+        'total_points': len(series['dates']),
+    }
@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+from typing import Iterable, Optional
+from django.db import connection
+
+# Demand window of the product list: potential sales from as_of - 365 days up to as_of
+SNAPSHOT_DEMAND_DAYS: int = 365
+
+
+def refresh_product_snapshots(product_ids: Iterable[int], as_of: Optional[date] = None) -> int:
+    """
+    Rebuild ProductSnapshot rows for a batch of products in one INSERT ... ON CONFLICT.
+    Latest stock is read from the newest daily metric and average daily demand from
+    potential sales in the demand window ending on as_of (default today), both through
+    the (product, date) index, so the cost per product does not grow with history length.
+    Returns the number of snapshots written.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    as_of = as_of or date.today()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO app_productsnapshot
+                (product_id, latest_date, latest_stock, avg_daily_demand, remainder_days, as_of, updated_at)
+            SELECT
+                p.id,
+                latest.date,
+                latest.stock,
+                demand.average,
+                CASE
+                    WHEN demand.average > 0 AND latest.stock IS NOT NULL
+                        THEN FLOOR(latest.stock / demand.average)::integer
+                END,
+                %(as_of)s,
+                NOW()
+            FROM app_product AS p
+            LEFT JOIN LATERAL (
+                SELECT date, stock FROM app_dailymetrics
+                WHERE product_id = p.id
+                ORDER BY date DESC
+                LIMIT 1
+            ) AS latest ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT AVG(potential_sales) AS average FROM app_dailymetrics
+                WHERE product_id = p.id AND date BETWEEN %(start_date)s AND %(as_of)s AND potential_sales IS NOT NULL
+            ) AS demand ON TRUE
+            WHERE p.id = ANY(%(product_ids)s)
+            ON CONFLICT (product_id) DO UPDATE SET
+                latest_date = EXCLUDED.latest_date,
+                latest_stock = EXCLUDED.latest_stock,
+                avg_daily_demand = EXCLUDED.avg_daily_demand,
+                remainder_days = EXCLUDED.remainder_days,
+                as_of = EXCLUDED.as_of,
+                updated_at = EXCLUDED.updated_at
+        """, {
+            'product_ids': product_ids,
+            'as_of': as_of,
+            'start_date': as_of - timedelta(days=SNAPSHOT_DEMAND_DAYS),
+        })
+        return cursor.rowcount
+
+
+def refresh_stale_product_snapshots(product_ids: Iterable[int], as_of: Optional[date] = None) -> int:
+    """
+    Refresh the snapshots of products that have none yet or whose demand window ended
+    before as_of. Cheap when everything is current: a single lookup on the snapshot table.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    as_of = as_of or date.today()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.id FROM app_product AS p
+            LEFT JOIN app_productsnapshot AS s ON s.product_id = p.id
+            WHERE p.id = ANY(%s) AND (s.product_id IS NULL OR s.as_of < %s)
+        """, [product_ids, as_of])
+        stale_ids: list = [row[0] for row in cursor.fetchall()]
+    return refresh_product_snapshots(stale_ids, as_of=as_of)
@@ -0,0 +1,58 @@
+from django.db.models import QuerySet, Case, When, Value, IntegerField
+from app.models import Category, Supplier
+
+# source name (same as the facet and filter field) -> (model, label field)
+TYPEAHEAD_SOURCES: dict = {
+    'categories': (Category, 'name'),
+    'suppliers': (Supplier, 'company_name'),
+}
+# Shorter queries match by prefix only: trigrams need three characters and a one or two
+# letter substring matches nearly everything anyway
+TYPEAHEAD_SUBSTRING_MIN_LENGTH: int = 3
+TYPEAHEAD_MAX_PAGE_SIZE: int = 100
+
+
+def typeahead_queryset(source: str, query: str) -> QuerySet:
+    """
+    (id, label) rows of a typeahead source matching query, prefix matches first.
+    Prefix matches are served by the UPPER(label) text_pattern_ops index, substring
+    matches by the trigram index when pg_trgm is installed.
+    """
+    model, label_field = TYPEAHEAD_SOURCES[source]
+    queryset: QuerySet = model.objects.all()
+    query = query.strip()
+    if not query:
+        return queryset.order_by(label_field, 'pk').values_list('pk', label_field)
+    if len(query) < TYPEAHEAD_SUBSTRING_MIN_LENGTH:
+        queryset = queryset.filter(**{f'{label_field}__istartswith': query})
+        return queryset.order_by(label_field, 'pk').values_list('pk', label_field)
+    queryset = queryset.filter(**{f'{label_field}__icontains': query}).annotate(
+        is_substring=Case(
+            When(**{f'{label_field}__istartswith': query}, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField()
+        )
+    )
+    return queryset.order_by('is_substring', label_field, 'pk').values_list('pk', label_field)
+
+
+def typeahead_page(source: str, query: str, page: int = 1, page_size: int = 20) -> dict:
+    """One page of typeahead matches: {'results': [{'id', 'text'}, ...], 'more': bool}"""
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), TYPEAHEAD_MAX_PAGE_SIZE)
+    offset: int = (page - 1) * page_size
+    # One extra row tells whether there is a next page without counting the matches
+    rows: list = list(typeahead_queryset(source, query)[offset:offset + page_size + 1])
+    return {
+        'results': [{'id': option_id, 'text': label} for option_id, label in rows[:page_size]],
+        'more': len(rows) > page_size,
+    }
+
+
+def typeahead_labels(source: str, ids: list) -> list[tuple]:
+    """(id, label) of the given ids of a typeahead source, for rendering selected options"""
+    model, label_field = TYPEAHEAD_SOURCES[source]
+    ids = [option_id for option_id in ids if str(option_id).isdigit()]
+    if not ids:
+        return []
+    return list(model.objects.filter(pk__in=ids).order_by(label_field, 'pk').values_list('pk', label_field))
@@ -0,0 +1,81 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app.models import Product, DailyMetrics
+from app.helpers.utils import get_average_potential_sales
+from app.helpers.potential_sales import update_potential_sales
+
+
+def update_potential_sales_per_row(product: Product, min_stock: int):
+    """Legacy implementation: one save() per daily metric"""
+    all_metrics = product.daily_metrics.all()
+    average_potential_sales: float = get_average_potential_sales(all_metrics, min_stock)
+    for metric in all_metrics:
+        if metric.stock is not None and metric.stock >= min_stock:
+            metric.potential_sales = metric.sales_quantity or 0.0
+        else:
+            metric.potential_sales = average_potential_sales
+        metric.save()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark per-row vs set-based potential sales recomputation on existing data '
+        '(e.g. after generate_demo_data). All changes are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100, help='Number of products to benchmark')
+        parser.add_argument('--min-stock', type=int, default=1, help='Good stock threshold')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products per set-based batch UPDATE')
+
+    def handle(self, *args, **options):
+        min_stock: int = options['min_stock']
+        batch_size: int = options['batch_size']
+        products: list = list(Product.objects.filter(daily_metrics__isnull=False).distinct().order_by('pk')[:options['products']])
+        if not products:
+            raise CommandError('No products with daily metrics found, run generate_demo_data first.')
+        product_ids: list = [product.pk for product in products]
+        metrics_count: int = DailyMetrics.objects.filter(product_id__in=product_ids).count()
+        self.stdout.write(f'Benchmarking {len(products)} products / {metrics_count} daily metrics...')
+
+        results: dict = {}
+        with transaction.atomic():
+            start = time.perf_counter()
+            for product in products:
+                update_potential_sales_per_row(product, min_stock)
+            results['per-row save()'] = time.perf_counter() - start
+            expected: list = self.snapshot(product_ids)
+
+            start = time.perf_counter()
+            for product in products:
+                product.update_all_potential_sales(min_stock=min_stock)
+            results['set-based per product'] = time.perf_counter() - start
+            self.check_identical(expected, product_ids, 'set-based per product')
+
+            start = time.perf_counter()
+            for offset in range(0, len(product_ids), batch_size):
+                update_potential_sales(product_ids[offset:offset + batch_size], min_stock=min_stock)
+            results['set-based batched'] = time.perf_counter() - start
+            self.check_identical(expected, product_ids, 'set-based batched')
+
+            transaction.set_rollback(True)
+
+        baseline: float = results['per-row save()']
+        for label, seconds in results.items():
+            self.stdout.write(
+                f'{label:<24} {seconds:9.3f}s  {seconds / len(products) * 1000:8.2f} ms/product  '
+                f'x{baseline / seconds if seconds else float("inf"):.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS('All strategies produced identical potential sales.'))
+
+    def snapshot(self, product_ids: list) -> list:
+        return list(
+            DailyMetrics.objects.filter(product_id__in=product_ids)
+            .order_by('product_id', 'date')
+            .values_list('product_id', 'date', 'potential_sales')
+        )
+
+    def check_identical(self, expected: list, product_ids: list, label: str):
+        if self.snapshot(product_ids) != expected:
+            raise CommandError(f'{label} results differ from the per-row implementation.')
@@ -1,75 +1,195 @@
-from django.core.management.base import BaseCommand
-from app.models import Supplier, Category, Product, DailyMetrics
-from django.db import transaction
-from datetime import datetime, timedelta
-import random
+import io
+import struct
+import time
+from datetime import date, timedelta
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from app.models import (
+    Supplier, Category, CategoryClosure, Product, DailyMetrics, PotentialSalesState, ProductSnapshot, WeeklyMetrics,
+    MonthlyMetrics, ProductSeries
+)
+from app.helpers.importer import CopySource
+from app.helpers.derived import rebuild_derived_metrics
+from app.helpers.data_version import bump_data_version
+from app.helpers.partitions import add_months, create_monthly_partitions, month_start
+from app.helpers.categories import rebuild_category_closure
+
+PG_EPOCH: date = date(2000, 1, 1)
+PGCOPY_HEADER: bytes = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER: bytes = struct.pack('>h', -1)
+# Binary COPY tuple layout for (product_id, date, sales_quantity, stock, potential_sales)
+METRICS_COPY_DTYPE = np.dtype([
+    ('field_count', '>i2'),
+    ('product_id_len', '>i4'), ('product_id', '>i8'),
+    ('date_len', '>i4'), ('date', '>i4'),
+    ('sales_len', '>i4'), ('sales', '>i4'),
+    ('stock_len', '>i4'), ('stock', '>i4'),
+    ('potential_sales_len', '>i4'), ('potential_sales', '>f8'),
+])
+
 
 class Command(BaseCommand):
-    help = 'Generate demo data: 200 categories, 200 suppliers, 10k products, 2 years of daily metrics.'
+    help = (
+        'Generate demo data: categories, suppliers, products and daily metrics. '
+        'Everything is loaded with COPY and metrics are generated with NumPy, so large datasets '
+        '(e.g. --products 100000 --days 1095) build in minutes. Existing data is deleted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Number of products')
+        parser.add_argument('--days', type=int, default=730, help='Days of daily metrics history per product')
+        parser.add_argument('--categories', type=int, default=200, help='Number of categories')
+        parser.add_argument('--suppliers', type=int, default=200, help='Number of suppliers')
+        parser.add_argument('--suppliers-per-product', type=int, default=5, help='Maximum suppliers per product (at least 1)')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible datasets')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per daily metrics COPY batch')
 
     def handle(self, *args, **options):
-        with transaction.atomic():
+        products: int = options['products']
+        days: int = options['days']
+        categories: int = options['categories']
+        suppliers: int = options['suppliers']
+        suppliers_per_product: int = min(options['suppliers_per_product'], suppliers)
+        batch_size: int = options['batch_size']
+        if min(products, days, categories, suppliers, suppliers_per_product, batch_size) < 1:
+            raise CommandError('All counts must be positive.')
+        rng = np.random.default_rng(options['seed'])
+        start = time.perf_counter()
+
+        with transaction.atomic(), connection.cursor() as cursor:
             self.stdout.write('Deleting existing data...')
-            DailyMetrics.objects.all().delete()
-            Product.objects.all().delete()
-            Supplier.objects.all().delete()
-            Category.objects.all().delete()
-
-            self.stdout.write('Creating categories...')
-            categories = []
-            for i in range(200):
-                parent = random.choice(categories) if categories and random.random() < 0.5 else None
-                cat = Category.objects.create(
-                    category_code=f'C{i:03d}',
-                    name=f'Category {i+1}',
-                    description=f'Description for category {i+1}',
-                    parent=parent
-                )
-                categories.append(cat)
-
-            self.stdout.write('Creating suppliers...')
-            suppliers = []
-            for i in range(200):
-                sup = Supplier.objects.create(
-                    company_name=f'Supplier {i+1}',
-                    email=f'supplier{i+1}@example.com'
-                )
-                suppliers.append(sup)
-
-            self.stdout.write('Creating products...')
-            products = []
-            for i in range(10000):
-                cat = random.choice(categories)
-                prod = Product.objects.create(
-                    code=f'P{i+1:05d}',
-                    name=f'Product {i+1}',
-                    category=cat,
-                    last_purchase_price=random.uniform(1, 1000),
-                    currency=random.choice(['USD', 'EUR']),
-                    is_internet=random.choice([True, False]),
-                    lead_time=random.randint(1, 180),
-                    is_active=True,
-                    moq=random.randint(1, 20)
-                )
-                prod.suppliers.set(random.sample(suppliers, random.randint(1, 5)))
-                products.append(prod)
-
-            self.stdout.write('Creating daily metrics...')
-            start_date = datetime.now().date() - timedelta(days=730)
-            for prod in products:
-                metrics = []
-                stock = random.randint(0, 500)
-                for d in range(730):
-                    date = start_date + timedelta(days=d)
-                    sales = random.randint(0, 20)
-                    stock = max(0, stock + random.randint(-10, 10) - sales)
-                    metrics.append(DailyMetrics(
-                        product=prod,
-                        date=date,
-                        sales_quantity=sales,
-                        stock=stock,
-                        potential_sales=sales + random.uniform(0, 5)
-                    ))
-                DailyMetrics.objects.bulk_create(metrics)
-
-            self.stdout.write(self.style.SUCCESS('Demo data generation complete.'))
+            self.truncate(cursor)
+
+            self.stdout.write(f'Creating {categories} categories...')
+            self.create_categories(cursor, rng, categories)
+            rebuild_category_closure()
+
+            self.stdout.write(f'Creating {suppliers} suppliers...')
+            self.copy_rows(cursor, Supplier, ('id', 'company_name', 'email'), (
+                (i, f'Supplier {i}', f'supplier{i}@example.com') for i in range(1, suppliers + 1)
+            ))
+
+            self.stdout.write(f'Creating {products} products...')
+            self.create_products(cursor, rng, products, categories)
+
+            self.stdout.write('Linking suppliers to products...')
+            self.create_product_suppliers(cursor, rng, products, suppliers, suppliers_per_product, batch_size)
+
+            self.stdout.write(f'Creating {products * days} daily metrics...')
+            start_date: date = date.today() - timedelta(days=days)
+            create_monthly_partitions(start_date, add_months(month_start(date.today()), 3))
+            for offset in range(0, products, batch_size):
+                product_ids = np.arange(offset + 1, min(offset + batch_size, products) + 1, dtype=np.int64)
+                self.copy_metrics(cursor, rng, product_ids, start_date, days)
+                rebuild_derived_metrics(product_ids.tolist())
+                self.stdout.write(f'  {offset + len(product_ids)}/{products} products ({time.perf_counter() - start:.1f}s)')
+
+            self.reset_sequences(cursor)
+            # COPY and TRUNCATE send no signals: catalog-only runs still have to move the data version
+            bump_data_version()
+
+        with connection.cursor() as cursor:
+            for model in (
+                Category, CategoryClosure, Supplier, Product, Product.suppliers.through, DailyMetrics, ProductSnapshot,
+                WeeklyMetrics, MonthlyMetrics, ProductSeries
+            ):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        self.stdout.write(self.style.SUCCESS(f'Demo data generation complete in {time.perf_counter() - start:.1f}s.'))
+
+    def truncate(self, cursor):
+        tables: list = [
+            model._meta.db_table
+            for model in (
+                DailyMetrics, PotentialSalesState, ProductSnapshot, WeeklyMetrics, MonthlyMetrics, ProductSeries,
+                Product.suppliers.through, Product, Supplier, CategoryClosure, Category
+            )
+        ]
+        # Flush deferred FK checks from earlier writes in this transaction, TRUNCATE refuses to run with them pending
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+    def copy_rows(self, cursor, model, columns: tuple, rows):
+        cursor.copy_expert(
+            f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            CopySource(rows),
+        )
+
+    def create_categories(self, cursor, rng, count: int):
+        # Each category gets an earlier category as parent half of the time
+        has_parent = rng.random(count) < 0.5
+        has_parent[0] = False
+        parents = np.where(has_parent, (rng.random(count) * np.arange(count)).astype(np.int64), -1)
+        levels: list = []
+        for index, parent in enumerate(parents):
+            levels.append(levels[parent] + 1 if parent >= 0 else 0)
+        self.copy_rows(cursor, Category, ('id', 'category_code', 'name', 'description', 'parent_id', 'level'), (
+            (
+                index + 1, f'C{index:03d}', f'Category {index + 1}', f'Description for category {index + 1}',
+                parents[index] + 1 if parents[index] >= 0 else '', levels[index]
+            )
+            for index in range(count)
+        ))
+
+    def create_products(self, cursor, rng, count: int, categories: int):
+        code_width: int = max(5, len(str(count)))
+        category_ids = rng.integers(1, categories + 1, size=count)
+        prices = np.round(rng.uniform(1, 1000, size=count), 4)
+        currencies = rng.choice(['USD', 'EUR'], size=count)
+        is_internet = rng.random(count) < 0.5
+        lead_times = rng.integers(1, 181, size=count)
+        moqs = rng.integers(1, 21, size=count)
+        self.copy_rows(cursor, Product, (
+            'id', 'code', 'name', 'category_id', 'last_purchase_price', 'currency',
+            'is_internet', 'lead_time', 'is_active', 'moq'
+        ), (
+            (
+                index + 1, f'P{index + 1:0{code_width}d}', f'Product {index + 1}', category_ids[index],
+                prices[index], currencies[index], is_internet[index], lead_times[index], True, moqs[index]
+            )
+            for index in range(count)
+        ))
+
+    def create_product_suppliers(self, cursor, rng, products: int, suppliers: int, per_product: int, batch_size: int):
+        through = Product.suppliers.through
+        for offset in range(0, products, batch_size):
+            product_ids = np.arange(offset + 1, min(offset + batch_size, products) + 1)
+            # Random distinct suppliers per product: first k columns of a per-row permutation
+            picks = rng.random((len(product_ids), suppliers)).argsort(axis=1)[:, :per_product] + 1
+            counts = rng.integers(1, per_product + 1, size=len(product_ids))
+            mask = np.arange(per_product) < counts[:, None]
+            product_column = np.broadcast_to(product_ids[:, None], picks.shape)[mask]
+            self.copy_rows(cursor, through, ('supplier_id', 'product_id'), zip(picks[mask], product_column))
+
+    def copy_metrics(self, cursor, rng, product_ids, start_date: date, days: int):
+        """COPY a batch of products' daily metrics in PostgreSQL binary format"""
+        shape: tuple = (len(product_ids), days)
+        sales = rng.integers(0, 21, size=shape)
+        # stock[d] = max(0, stock[d-1] + change - sales) as a reflected random walk:
+        # X_t = S_t - min(0, min(S_0..S_t)) where S is the unclamped cumulative sum
+        walk = rng.integers(0, 501, size=(len(product_ids), 1)) + np.cumsum(rng.integers(-10, 11, size=shape) - sales, axis=1)
+        stock = walk - np.minimum(np.minimum.accumulate(walk, axis=1), 0)
+        potential_sales = sales + rng.uniform(0, 5, size=shape)
+
+        rows = np.empty(shape[0] * shape[1], dtype=METRICS_COPY_DTYPE)
+        rows['field_count'] = 5
+        rows['product_id_len'] = 8
+        rows['date_len'] = rows['sales_len'] = rows['stock_len'] = 4
+        rows['potential_sales_len'] = 8
+        rows['product_id'] = np.repeat(product_ids, days)
+        rows['date'] = np.tile(np.arange(days) + (start_date - PG_EPOCH).days, len(product_ids))
+        rows['sales'] = sales.ravel()
+        rows['stock'] = stock.ravel()
+        rows['potential_sales'] = potential_sales.ravel()
+        cursor.copy_expert(
+            f'COPY {DailyMetrics._meta.db_table} (product_id, date, sales_quantity, stock, potential_sales) '
+            'FROM STDIN WITH (FORMAT binary)',
+            io.BytesIO(PGCOPY_HEADER + rows.tobytes() + PGCOPY_TRAILER),
+        )
+
+    def reset_sequences(self, cursor):
+        models: list = [Category, Supplier, Product, Product.suppliers.through, DailyMetrics]
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, IntegrityError
+from app.helpers.importer import get_daily_metrics_csv_path, import_daily_metrics_csv
+
+
+class Command(BaseCommand):
+    help = 'Import the daily sales CSV (CSV_IMPORT_PATH / CSV_FILE_NAME) into daily metrics using COPY and upsert.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='CSV file to import (defaults to CSV_IMPORT_PATH / CSV_FILE_NAME)')
+        parser.add_argument('--delimiter', default=',', help='CSV field delimiter')
+        parser.add_argument('--encoding', default='utf-8', help='CSV file encoding')
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_daily_metrics_csv_path()
+        self.stdout.write(f'Importing daily metrics from {path}...')
+        try:
+            stats: dict = import_daily_metrics_csv(path, delimiter=options['delimiter'], encoding=options['encoding'])
+        except FileNotFoundError as exc:
+            raise CommandError(f'CSV file not found: {path}') from exc
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        except (DataError, IntegrityError) as exc:
+            # Rejected by the upsert or at commit (e.g. a product deleted during the import)
+            raise CommandError(f'Import failed, nothing was imported: {str(exc).strip()}') from exc
+
+        if stats['unknown_codes']:
+            sample: list = sorted(stats['unknown_codes'])[:10]
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {stats['rows_skipped']} rows for {len(stats['unknown_codes'])} unknown product codes "
+                f"(e.g. {', '.join(sample)})"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {stats['rows_read']} rows, upserted {stats['rows_upserted']} daily metrics."
+        ))
@@ -0,0 +1,53 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app.helpers.partitions import (
+    add_months, detach_partitions_before, ensure_future_partitions, is_partitioned, list_partitions, month_start,
+    split_default_partition
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Maintain the monthly partitions of DailyMetrics: create partitions ahead of time, '
+        'move rows out of the default partition and detach partitions past retention. '
+        'Schedule daily or monthly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future months to create partitions for')
+        parser.add_argument(
+            '--retention-months', type=int, default=None,
+            help='Detach partitions that ended more than this many months ago (default: keep everything)'
+        )
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them as tables')
+        parser.add_argument('--split-default', action='store_true', help='Move default partition rows into monthly partitions')
+        parser.add_argument('--list', action='store_true', help='List partitions and exit')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('app_dailymetrics is not partitioned, run migrate first.')
+        if options['list']:
+            for partition in list_partitions():
+                bounds: str = f"{partition['start']} - {partition['end']}" if partition['start'] else 'DEFAULT'
+                self.stdout.write(f"{partition['name']:<32} {bounds:<25} ~{partition['rows']} rows")
+            return
+        if options['months_ahead'] < 0:
+            raise CommandError('--months-ahead must not be negative.')
+        if options['retention_months'] is not None and options['retention_months'] < 1:
+            raise CommandError('--retention-months must be positive.')
+
+        with transaction.atomic():
+            created: list = ensure_future_partitions(options['months_ahead'])
+            if options['split_default']:
+                created += split_default_partition()
+            detached: list = []
+            if options['retention_months'] is not None:
+                cutoff: date = add_months(month_start(date.today()), -options['retention_months'])
+                detached = detach_partitions_before(cutoff, drop=options['drop'])
+
+        for name in created:
+            self.stdout.write(f'Created {name}')
+        for name in detached:
+            self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} {name}")
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partitions created, {len(detached)} detached.'))
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app.models import Product
+from app.helpers.derived import rebuild_derived_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the data derived from DailyMetrics (weekly/monthly rollups, packed series and '
+        'product snapshots) for all products, e.g. after a bulk load that bypassed the importer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Products per transaction')
+
+    def handle(self, *args, **options):
+        batch_size: int = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        product_ids: list = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        start = time.perf_counter()
+        for offset in range(0, len(product_ids), batch_size):
+            with transaction.atomic():
+                rebuild_derived_metrics(product_ids[offset:offset + batch_size])
+            self.stdout.write(f'  {min(offset + batch_size, len(product_ids))}/{len(product_ids)} products')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt derived metrics for {len(product_ids)} products in {time.perf_counter() - start:.1f}s.'
+        ))
@@ -0,0 +1,133 @@
+import bisect
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from app.models import Product
+from app.helpers.potential_sales import shard_product_ids, recompute_potential_sales_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute potential sales for all active products. Product ids are split into shards '
+        'processed by a pool of worker processes, each with its own database connection. '
+        'Finished shards are checkpointed so an interrupted run can be resumed with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (1 runs inline)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products per shard')
+        parser.add_argument('--min-stock', type=int, default=1, help='Good stock threshold')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only compute daily metrics after each product watermark (full recompute where history was backfilled)'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Skip shards finished by an interrupted run with the same options and active products'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=str(Path(settings.BASE_DIR) / 'logs' / 'recompute_potential_sales.json'),
+            help='Checkpoint file recording finished shards'
+        )
+
+    def handle(self, *args, **options):
+        workers: int = options['workers']
+        batch_size: int = options['batch_size']
+        min_stock: int = options['min_stock']
+        incremental: bool = options['incremental']
+        checkpoint_path = Path(options['checkpoint'])
+        if workers < 1 or batch_size < 1:
+            raise CommandError('--workers and --batch-size must be positive.')
+
+        active_ids: list = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+        # What a checkpoint is only valid for: finished ranges mean nothing for another mode or product set
+        run: dict = {'min_stock': min_stock, 'incremental': incremental, 'products': self.products_digest(active_ids)}
+        finished_ranges: list = self.load_checkpoint(checkpoint_path, run) if options['resume'] else []
+        product_ids: list = [product_id for product_id in active_ids if not self.is_finished(product_id, finished_ranges)]
+        shards: list = shard_product_ids(product_ids, batch_size)
+        if finished_ranges:
+            self.stdout.write(f'Resuming: {len(finished_ranges)} shards already finished.')
+        self.stdout.write(f'Recomputing potential sales for {len(product_ids)} products in {len(shards)} shards...')
+
+        start = time.perf_counter()
+        rows_updated: int = 0
+        for done, (shard, rows) in enumerate(self.run_shards(shards, workers, min_stock, incremental), start=1):
+            rows_updated += rows
+            finished_ranges.append([shard[0], shard[-1]])
+            self.save_checkpoint(checkpoint_path, run, finished_ranges)
+            elapsed: float = time.perf_counter() - start
+            eta: float = elapsed / done * (len(shards) - done)
+            self.stdout.write(
+                f'Shard {done}/{len(shards)} done (products {shard[0]}-{shard[-1]}, {rows} rows) '
+                f'elapsed {elapsed:.1f}s, ETA {eta:.1f}s'
+            )
+
+        if checkpoint_path.exists():
+            checkpoint_path.unlink()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed potential sales for {len(product_ids)} products ({rows_updated} daily metrics) '
+            f'in {time.perf_counter() - start:.1f}s.'
+        ))
+
+    def run_shards(self, shards: list, workers: int, min_stock: int, incremental: bool):
+        """Yield (shard, rows updated) as shards finish"""
+        if workers == 1 or len(shards) <= 1:
+            for shard in shards:
+                yield shard, recompute_potential_sales_shard(shard, min_stock, incremental)
+            return
+        # Forked workers must not share the parent's connection; they open their own on first query.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures: dict = {
+                executor.submit(recompute_potential_sales_shard, shard, min_stock, incremental): shard
+                for shard in shards
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    @staticmethod
+    def is_finished(product_id: int, finished_ranges: list) -> bool:
+        """Check if product_id falls inside one of the sorted, non-overlapping finished ranges"""
+        index: int = bisect.bisect_right(finished_ranges, [product_id, float('inf')]) - 1
+        return index >= 0 and finished_ranges[index][0] <= product_id <= finished_ranges[index][1]
+
+    @staticmethod
+    def products_digest(product_ids: list) -> str:
+        """Fingerprint of the sorted active product ids, so the checkpoint stays small"""
+        return hashlib.sha256(','.join(map(str, product_ids)).encode()).hexdigest()
+
+    def load_checkpoint(self, path: Path, run: dict) -> list:
+        if not path.exists():
+            return []
+        with open(path, encoding='utf-8') as checkpoint_file:
+            checkpoint: dict = json.load(checkpoint_file)
+        if checkpoint.get('min_stock') != run['min_stock']:
+            raise CommandError(
+                f"Checkpoint was written with --min-stock {checkpoint.get('min_stock')}, "
+                'rerun with the same value or without --resume.'
+            )
+        if checkpoint.get('incremental') != run['incremental']:
+            raise CommandError(
+                f"Checkpoint was written {'with' if checkpoint.get('incremental') else 'without'} --incremental, "
+                'rerun in the same mode or without --resume.'
+            )
+        if checkpoint.get('products') != run['products']:
+            raise CommandError(
+                'Active products changed since the checkpoint was written, so finished shards may miss '
+                'products activated since; rerun without --resume.'
+            )
+        return sorted(checkpoint.get('finished', []))
+
+    def save_checkpoint(self, path: Path, run: dict, finished_ranges: list):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({**run, 'finished': finished_ranges}, checkpoint_file)
+        os.replace(tmp_path, path)
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app.models import Product
+from app.helpers.data_version import bump_data_version
+from app.helpers.snapshots import refresh_product_snapshots, refresh_stale_product_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh ProductSnapshot rows used by the product list and export. '
+        'Schedule daily with --stale-only so the 365-day demand window moves with the calendar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per refresh statement')
+        parser.add_argument(
+            '--stale-only', action='store_true',
+            help='Only refresh products without a snapshot or with a demand window ending before today'
+        )
+
+    def handle(self, *args, **options):
+        batch_size: int = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        refresh = refresh_stale_product_snapshots if options['stale_only'] else refresh_product_snapshots
+        product_ids: list = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        start = time.perf_counter()
+        refreshed: int = 0
+        for offset in range(0, len(product_ids), batch_size):
+            with transaction.atomic():
+                refreshed += refresh(product_ids[offset:offset + batch_size])
+        if refreshed:
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {refreshed} of {len(product_ids)} product snapshots in {time.perf_counter() - start:.1f}s.'
+        ))
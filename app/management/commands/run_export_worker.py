@@ -0,0 +1,48 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from app.helpers.categories import expire_category_tree_check
+from app.helpers.export_jobs import claim_export_job, purge_expired_export_jobs, reclaim_stale_export_jobs, run_export_job
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued product list exports (ExportJob) outside the web workers. '
+        'Several workers may run side by side; jobs of dead workers are queued again and '
+        'expired export files are purged while idle.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the pending jobs, then exit instead of polling')
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.EXPORT_WORKER_POLL_SECONDS,
+            help='Seconds to wait between polls of an empty queue'
+        )
+
+    def handle(self, *args, **options):
+        poll_interval: float = options['poll_interval']
+        if poll_interval <= 0:
+            raise CommandError('--poll-interval must be positive.')
+        while True:
+            if not connection.in_atomic_block:
+                # A long-running process: drop broken or expired connections between jobs like requests do
+                close_old_connections()
+            # Like a request: pick up category changes made by other processes
+            expire_category_tree_check()
+            reclaimed: int = reclaim_stale_export_jobs()
+            if reclaimed:
+                self.stdout.write(f'Reclaimed {reclaimed} stale exports.')
+            job = claim_export_job()
+            if job is not None:
+                start = time.perf_counter()
+                job = run_export_job(job)
+                message: str = f'Export {job.pk} {job.status}: {job.processed_rows} rows in {time.perf_counter() - start:.1f}s.'
+                self.stdout.write(self.style.SUCCESS(message) if job.status == job.DONE else self.style.ERROR(message))
+                continue
+            purged: int = purge_expired_export_jobs()
+            if purged:
+                self.stdout.write(f'Purged {purged} expired exports.')
+            if options['once']:
+                return
+            time.sleep(poll_interval)
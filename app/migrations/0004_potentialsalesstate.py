@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_product_model_alter_product_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PotentialSalesState',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='potential_sales_state', serialize=False, to='app.product')),
+                ('min_stock', models.PositiveIntegerField(default=1, help_text='Good stock threshold the aggregate was built with')),
+                ('computed_until', models.DateField(blank=True, help_text='Watermark: newest daily metric date included (null = full recompute needed)', null=True)),
+                ('good_stock_sales_sum', models.BigIntegerField(default=0, help_text='Sum of sales on good stock days up to the watermark')),
+                ('good_stock_days', models.PositiveIntegerField(default=0, help_text='Number of good stock days with sales data up to the watermark')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Potential sales state',
+                'verbose_name_plural': 'Potential sales states',
+            },
+        ),
+    ]
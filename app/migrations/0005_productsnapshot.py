@@ -0,0 +1,79 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:52
+
+import django.db.models.deletion
+from datetime import date, timedelta
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Demand window of the product list, as SNAPSHOT_DEMAND_DAYS in app.helpers.snapshots
+DEMAND_DAYS = 365
+
+
+def build_product_snapshots(apps, schema_editor):
+    # The snapshot SQL is kept here, not taken from app.helpers.snapshots, so later helper changes do not alter this migration
+    Product = apps.get_model('app', 'Product')
+    product_ids = list(
+        Product.objects.using(schema_editor.connection.alias).order_by('pk').values_list('pk', flat=True)
+    )
+    as_of = date.today()
+    with schema_editor.connection.cursor() as cursor:
+        for offset in range(0, len(product_ids), BATCH_SIZE):
+            cursor.execute("""
+                INSERT INTO app_productsnapshot
+                    (product_id, latest_date, latest_stock, avg_daily_demand, remainder_days, as_of, updated_at)
+                SELECT
+                    p.id,
+                    latest.date,
+                    latest.stock,
+                    demand.average,
+                    CASE
+                        WHEN demand.average > 0 AND latest.stock IS NOT NULL
+                            THEN FLOOR(latest.stock / demand.average)::integer
+                    END,
+                    %(as_of)s,
+                    NOW()
+                FROM app_product AS p
+                LEFT JOIN LATERAL (
+                    SELECT date, stock FROM app_dailymetrics
+                    WHERE product_id = p.id
+                    ORDER BY date DESC
+                    LIMIT 1
+                ) AS latest ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT AVG(potential_sales) AS average FROM app_dailymetrics
+                    WHERE product_id = p.id AND date BETWEEN %(start_date)s AND %(as_of)s AND potential_sales IS NOT NULL
+                ) AS demand ON TRUE
+                WHERE p.id = ANY(%(product_ids)s)
+            """, {
+                'product_ids': product_ids[offset:offset + BATCH_SIZE],
+                'as_of': as_of,
+                'start_date': as_of - timedelta(days=DEMAND_DAYS),
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_potentialsalesstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSnapshot',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='app.product')),
+                ('latest_date', models.DateField(blank=True, help_text='Date of the latest daily metric', null=True)),
+                ('latest_stock', models.PositiveIntegerField(blank=True, help_text='Stock on the latest daily metric', null=True)),
+                ('avg_daily_demand', models.FloatField(blank=True, help_text='Average potential sales over the demand window', null=True)),
+                ('remainder_days', models.IntegerField(blank=True, help_text='Days the latest stock lasts at average daily demand', null=True)),
+                ('as_of', models.DateField(help_text='Last day of the demand window')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Product snapshot',
+                'verbose_name_plural': 'Product snapshots',
+                'indexes': [models.Index(fields=['latest_stock'], name='app_product_latest__201b2a_idx'), models.Index(fields=['avg_daily_demand'], name='app_product_avg_dai_17ddd4_idx'), models.Index(fields=['remainder_days'], name='app_product_remaind_ae0a94_idx'), models.Index(fields=['as_of'], name='app_product_as_of_f1ee2b_idx')],
+            },
+        ),
+        migrations.RunPython(build_product_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,129 @@
+"""
+Convert app_dailymetrics into a table range partitioned by month on date.
+
+PostgreSQL requires the partition key in every unique constraint, so the primary key
+becomes (id, date); Django keeps using id alone, which stays unique through the
+sequence. Rows outside the monthly partitions land in app_dailymetrics_default.
+The model state is unchanged, so this is a database-only migration. The SQL is kept
+here rather than taken from app.helpers.partitions, so later changes to the helpers
+do not change what this migration does.
+"""
+from datetime import date
+from django.db import migrations
+
+COLUMNS: str = 'id, date, sales_quantity, stock, potential_sales, product_id'
+MONTHS_AHEAD: int = 3
+
+
+def add_months(month: date, months: int) -> date:
+    index: int = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_monthly_partitions(cursor, first_month: date, last_month: date):
+    """Monthly partitions covering first_month..last_month of the new, still empty table"""
+    month: date = first_month
+    while month <= last_month:
+        next_month: date = add_months(month, 1)
+        cursor.execute(
+            f'CREATE TABLE app_dailymetrics_p{month:%Y_%m} PARTITION OF app_dailymetrics FOR VALUES FROM (%s) TO (%s)',
+            [month, next_month]
+        )
+        month = next_month
+
+
+def drop_constraints(cursor, table: str):
+    """Free the index and constraint names for the new table"""
+    cursor.execute(f"""
+        ALTER TABLE {table}
+            DROP CONSTRAINT app_dailymetrics_pkey,
+            DROP CONSTRAINT app_dailymetrics_product_id_date_b942ef02_uniq,
+            DROP CONSTRAINT app_dailymetrics_product_id_edf21d97_fk_app_product_id
+    """)
+    cursor.execute('DROP INDEX app_dailyme_product_450ec5_idx, app_dailymetrics_product_id_edf21d97')
+
+
+def add_constraints(cursor):
+    cursor.execute("""
+        ALTER TABLE app_dailymetrics
+            ADD CONSTRAINT app_dailymetrics_product_id_date_b942ef02_uniq UNIQUE (product_id, date),
+            ADD CONSTRAINT app_dailymetrics_product_id_edf21d97_fk_app_product_id
+                FOREIGN KEY (product_id) REFERENCES app_product (id) DEFERRABLE INITIALLY DEFERRED
+    """)
+    cursor.execute('CREATE INDEX app_dailyme_product_450ec5_idx ON app_dailymetrics (product_id, date)')
+    cursor.execute('CREATE INDEX app_dailymetrics_product_id_edf21d97 ON app_dailymetrics (product_id)')
+
+
+def partition_daily_metrics(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE app_dailymetrics RENAME TO app_dailymetrics_unpartitioned')
+        cursor.execute('ALTER SEQUENCE app_dailymetrics_id_seq RENAME TO app_dailymetrics_unpartitioned_id_seq')
+        drop_constraints(cursor, 'app_dailymetrics_unpartitioned')
+        cursor.execute('CREATE SEQUENCE app_dailymetrics_id_seq')
+        cursor.execute("""
+            CREATE TABLE app_dailymetrics (
+                id bigint NOT NULL DEFAULT nextval('app_dailymetrics_id_seq'),
+                date date NOT NULL,
+                sales_quantity integer NULL,
+                stock integer NULL CONSTRAINT app_dailymetrics_stock_check CHECK (stock >= 0),
+                potential_sales double precision NULL,
+                product_id bigint NOT NULL,
+                CONSTRAINT app_dailymetrics_pkey PRIMARY KEY (id, date)
+            ) PARTITION BY RANGE (date)
+        """)
+        cursor.execute('ALTER SEQUENCE app_dailymetrics_id_seq OWNED BY app_dailymetrics.id')
+        add_constraints(cursor)
+        cursor.execute('CREATE TABLE app_dailymetrics_default PARTITION OF app_dailymetrics DEFAULT')
+
+        cursor.execute('SELECT MIN(date), MAX(date), MAX(id) FROM app_dailymetrics_unpartitioned')
+        first_day, last_day, max_id = cursor.fetchone()
+        current_month: date = date.today().replace(day=1)
+        create_monthly_partitions(
+            cursor,
+            min(first_day or current_month, current_month).replace(day=1),
+            max(last_day or current_month, add_months(current_month, MONTHS_AHEAD))
+        )
+        cursor.execute(f'INSERT INTO app_dailymetrics ({COLUMNS}) SELECT {COLUMNS} FROM app_dailymetrics_unpartitioned')
+        if max_id is not None:
+            cursor.execute("SELECT setval('app_dailymetrics_id_seq', %s)", [max_id])
+        cursor.execute('DROP TABLE app_dailymetrics_unpartitioned')
+        cursor.execute('ANALYZE app_dailymetrics')
+
+
+def unpartition_daily_metrics(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE app_dailymetrics RENAME TO app_dailymetrics_partitioned')
+        cursor.execute('ALTER SEQUENCE app_dailymetrics_id_seq RENAME TO app_dailymetrics_partitioned_id_seq')
+        drop_constraints(cursor, 'app_dailymetrics_partitioned')
+        cursor.execute("""
+            CREATE TABLE app_dailymetrics (
+                id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY CONSTRAINT app_dailymetrics_pkey PRIMARY KEY,
+                date date NOT NULL,
+                sales_quantity integer NULL,
+                stock integer NULL CONSTRAINT app_dailymetrics_stock_check CHECK (stock >= 0),
+                potential_sales double precision NULL,
+                product_id bigint NOT NULL
+            )
+        """)
+        cursor.execute(f'INSERT INTO app_dailymetrics ({COLUMNS}) SELECT {COLUMNS} FROM app_dailymetrics_partitioned')
+        cursor.execute("""
+            SELECT setval(pg_get_serial_sequence('app_dailymetrics', 'id'), MAX(id)) FROM app_dailymetrics
+            HAVING MAX(id) IS NOT NULL
+        """)
+        cursor.execute('DROP TABLE app_dailymetrics_partitioned')
+        add_constraints(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_productsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_daily_metrics, unpartition_daily_metrics),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def build_metric_rollups(apps, schema_editor):
+    # The rollup SQL is kept here, not taken from app.helpers.rollups, so later helper changes do not alter this migration
+    Product = apps.get_model('app', 'Product')
+    product_ids = list(
+        Product.objects.using(schema_editor.connection.alias).filter(daily_metrics__isnull=False)
+        .distinct().order_by('pk').values_list('pk', flat=True)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        for offset in range(0, len(product_ids), BATCH_SIZE):
+            for unit, table in (('week', 'app_weeklymetrics'), ('month', 'app_monthlymetrics')):
+                cursor.execute(f"""
+                    INSERT INTO {table} (
+                        product_id, period_start, days, sales_quantity_sum, potential_sales_sum, potential_sales_days,
+                        stock_days, stockout_days, min_stock, max_stock, last_stock
+                    )
+                    SELECT
+                        dm.product_id,
+                        date_trunc(%(unit)s, dm.date::timestamp)::date,
+                        COUNT(*),
+                        COALESCE(SUM(dm.sales_quantity), 0),
+                        COALESCE(SUM(dm.potential_sales), 0),
+                        COUNT(dm.potential_sales),
+                        COUNT(*) FILTER (WHERE dm.stock > 0),
+                        COUNT(*) FILTER (WHERE dm.stock = 0),
+                        MIN(dm.stock),
+                        MAX(dm.stock),
+                        (ARRAY_AGG(dm.stock ORDER BY dm.date DESC) FILTER (WHERE dm.stock IS NOT NULL))[1]
+                    FROM app_dailymetrics AS dm
+                    WHERE dm.product_id = ANY(%(product_ids)s)
+                    GROUP BY 1, 2
+                """, {'product_ids': product_ids[offset:offset + BATCH_SIZE], 'unit': unit})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_partition_dailymetrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(help_text='First day of the period')),
+                ('days', models.PositiveIntegerField(default=0, help_text='Daily metrics in the period')),
+                ('sales_quantity_sum', models.BigIntegerField(default=0, help_text='Sum of sales quantity')),
+                ('potential_sales_sum', models.FloatField(default=0, help_text='Sum of potential sales')),
+                ('potential_sales_days', models.PositiveIntegerField(default=0, help_text='Days with potential sales')),
+                ('stock_days', models.PositiveIntegerField(default=0, help_text='Days with stock on hand')),
+                ('stockout_days', models.PositiveIntegerField(default=0, help_text='Days with zero stock')),
+                ('min_stock', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_stock', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_stock', models.PositiveIntegerField(blank=True, help_text='Stock on the last day with data in the period', null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_metrics', to='app.product')),
+            ],
+            options={
+                'verbose_name': 'Monthly metrics',
+                'verbose_name_plural': 'Monthly metrics',
+                'ordering': ['-period_start'],
+                'abstract': False,
+                'unique_together': {('product', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(help_text='First day of the period')),
+                ('days', models.PositiveIntegerField(default=0, help_text='Daily metrics in the period')),
+                ('sales_quantity_sum', models.BigIntegerField(default=0, help_text='Sum of sales quantity')),
+                ('potential_sales_sum', models.FloatField(default=0, help_text='Sum of potential sales')),
+                ('potential_sales_days', models.PositiveIntegerField(default=0, help_text='Days with potential sales')),
+                ('stock_days', models.PositiveIntegerField(default=0, help_text='Days with stock on hand')),
+                ('stockout_days', models.PositiveIntegerField(default=0, help_text='Days with zero stock')),
+                ('min_stock', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_stock', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_stock', models.PositiveIntegerField(blank=True, help_text='Stock on the last day with data in the period', null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_metrics', to='app.product')),
+            ],
+            options={
+                'verbose_name': 'Weekly metrics',
+                'verbose_name_plural': 'Weekly metrics',
+                'ordering': ['-period_start'],
+                'abstract': False,
+                'unique_together': {('product', 'period_start')},
+            },
+        ),
+        migrations.RunPython(build_metric_rollups, migrations.RunPython.noop),
+    ]
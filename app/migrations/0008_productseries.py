@@ -0,0 +1,68 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# int32 / float32 values stored for days without data, as in app.helpers.series
+MISSING_INT = -2147483648
+
+
+def build_product_series(apps, schema_editor):
+    # The packing SQL is kept here, not taken from app.helpers.series, so later helper changes do not alter this migration
+    Product = apps.get_model('app', 'Product')
+    product_ids = list(
+        Product.objects.using(schema_editor.connection.alias).filter(daily_metrics__isnull=False)
+        .distinct().order_by('pk').values_list('pk', flat=True)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        for offset in range(0, len(product_ids), BATCH_SIZE):
+            cursor.execute("""
+                INSERT INTO app_productseries (product_id, start_date, length, sales_quantity, stock, potential_sales, updated_at)
+                SELECT
+                    bounds.product_id,
+                    bounds.first_date,
+                    COUNT(*),
+                    string_agg(int4send(COALESCE(dm.sales_quantity, %(missing)s)), ''::bytea ORDER BY day.date),
+                    string_agg(int4send(COALESCE(dm.stock, %(missing)s)), ''::bytea ORDER BY day.date),
+                    string_agg(float4send(COALESCE(dm.potential_sales::real, 'NaN'::real)), ''::bytea ORDER BY day.date),
+                    NOW()
+                FROM (
+                    SELECT product_id, MIN(date) AS first_date, MAX(date) AS last_date
+                    FROM app_dailymetrics
+                    WHERE product_id = ANY(%(product_ids)s)
+                    GROUP BY product_id
+                ) AS bounds
+                CROSS JOIN LATERAL (
+                    SELECT generate_series(bounds.first_date::timestamp, bounds.last_date::timestamp, interval '1 day')::date AS date
+                ) AS day
+                LEFT JOIN app_dailymetrics AS dm ON dm.product_id = bounds.product_id AND dm.date = day.date
+                GROUP BY bounds.product_id, bounds.first_date
+            """, {'product_ids': product_ids[offset:offset + BATCH_SIZE], 'missing': MISSING_INT})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_metrics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSeries',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='series', serialize=False, to='app.product')),
+                ('start_date', models.DateField(help_text='Date of the first value')),
+                ('length', models.PositiveIntegerField(help_text='Number of days in the series')),
+                ('sales_quantity', models.BinaryField(help_text='Packed int32 sales, missing days = -2^31')),
+                ('stock', models.BinaryField(help_text='Packed int32 stock, missing days = -2^31')),
+                ('potential_sales', models.BinaryField(help_text='Packed float32 potential sales, missing days = NaN')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Product series',
+                'verbose_name_plural': 'Product series',
+            },
+        ),
+        migrations.RunPython(build_product_series, migrations.RunPython.noop),
+    ]
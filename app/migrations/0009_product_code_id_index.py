@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_productseries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['code', 'id'], name='app_product_code_f51970_idx'),
+        ),
+    ]
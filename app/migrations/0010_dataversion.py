@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_product_code_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Data version',
+                'verbose_name_plural': 'Data version',
+            },
+        ),
+        # Versions come from a sequence so a rolled back bump never hands out a version twice
+        migrations.RunSQL('CREATE SEQUENCE app_dataversion_seq', 'DROP SEQUENCE app_dataversion_seq'),
+    ]
@@ -0,0 +1,55 @@
+"""
+GIN trigram indexes for the code, model and name filters.
+
+The index expressions match the SQL Django emits for icontains on PostgreSQL,
+UPPER("column"::text) LIKE UPPER(...), so the existing filters use them unchanged.
+pg_trgm is a contrib extension that is not installed everywhere: when it is not
+available, or may not be created, the migration does nothing and the filters keep
+their sequential scans. Database-only; the model state is unchanged.
+"""
+from django.db import DatabaseError, migrations, transaction
+
+# (index name, column) of the indexes; search_product_queryset and the filters use them through icontains
+TRIGRAM_INDEXES = (
+    ('app_product_code_trgm_idx', 'code'),
+    ('app_product_model_trgm_idx', 'model'),
+    ('app_product_name_trgm_idx', 'name'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        if not cursor.fetchone()[0]:
+            return
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError:
+            # No privilege to create the extension: keep the plain filters
+            return
+        for name, column in TRIGRAM_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON app_product USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _ in TRIGRAM_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
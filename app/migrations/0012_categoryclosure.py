@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_category_closure(apps, schema_editor):
+    # The closure SQL is kept here, not taken from app.helpers.categories, so later helper changes do not alter this migration
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM app_category
+                UNION ALL
+                SELECT tree.ancestor_id, child.id, tree.depth + 1
+                FROM tree
+                JOIN app_category AS child ON child.parent_id = tree.descendant_id
+            )
+            INSERT INTO app_categoryclosure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, depth FROM tree
+        """)
+        cursor.execute("""
+            UPDATE app_category AS category SET level = depths.level
+            FROM (
+                SELECT descendant_id, MAX(depth) AS level FROM app_categoryclosure GROUP BY descendant_id
+            ) AS depths
+            WHERE depths.descendant_id = category.id AND category.level <> depths.level
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_product_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(default=0, help_text='Distance from ancestor to descendant (0 = same category)')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='app.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='app.category')),
+            ],
+            options={
+                'verbose_name': 'Category closure',
+                'verbose_name_plural': 'Category closure',
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_category_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+"""
+Indexes for the category and supplier typeahead endpoints.
+
+Prefix matches use btree indexes on UPPER(label::text) with text_pattern_ops, the
+expression Django emits for istartswith on PostgreSQL (UPPER("column"::text) LIKE
+UPPER('x%')). Substring matches use GIN trigram indexes which, as in migration 0011,
+are only created when pg_trgm is available. Database-only; the model state is unchanged.
+"""
+from django.db import DatabaseError, migrations, transaction
+
+# (index name, table, column) of the indexes the typeahead istartswith and icontains lookups use
+TYPEAHEAD_PREFIX_INDEXES = (
+    ('app_category_name_prefix_idx', 'app_category', 'name'),
+    ('app_supplier_company_name_prefix_idx', 'app_supplier', 'company_name'),
+)
+TYPEAHEAD_TRIGRAM_INDEXES = (
+    ('app_category_name_trgm_idx', 'app_category', 'name'),
+    ('app_supplier_company_name_trgm_idx', 'app_supplier', 'company_name'),
+)
+
+
+def create_typeahead_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, table, column in TYPEAHEAD_PREFIX_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} (UPPER({column}::text) text_pattern_ops)'
+            )
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        if not cursor.fetchone()[0]:
+            return
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError:
+            # No privilege to create the extension: substring matches keep their scans
+            return
+        for name, table, column in TYPEAHEAD_TRIGRAM_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+
+
+def drop_typeahead_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _, _ in TYPEAHEAD_PREFIX_INDEXES + TYPEAHEAD_TRIGRAM_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_categoryclosure'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_typeahead_indexes, drop_typeahead_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_exportjob_format'),
+    ]
+
+    # The data version is read from app_dataversion_seq (migration 0010), which stays
+    operations = [
+        migrations.DeleteModel(
+            name='DataVersion',
+        ),
+    ]
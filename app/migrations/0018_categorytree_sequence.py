@@ -0,0 +1,15 @@
+# Generated by Django 5.0.1 on 2026-10-17 06:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_exportjob_heartbeat'),
+    ]
+
+    # Version of the in-memory category trees, shared by every process through the database
+    operations = [
+        migrations.RunSQL('CREATE SEQUENCE app_categorytree_seq', 'DROP SEQUENCE app_categorytree_seq'),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_categorytree_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='claimed_by',
+            field=models.CharField(blank=True, help_text='Token of the current claim; only its worker may finish the job', max_length=100),
+        ),
+    ]
@@ -3,8 +3,13 @@ from typing import Optional, Union
 from django.db import models
 from django.db.models import QuerySet
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Avg
+from django.db.models import Avg, Sum, Count, Min, Max, Q, Case, When, F, Value, FloatField
+from django.db.models.functions import Coalesce
 from app.helpers.utils import get_average_potential_sales
+from app.helpers.derived import rebuild_derived_metrics
+from app.helpers.changes import propagate_daily_metrics_changes
+from app.helpers.partitions import add_months, month_start
+from app.helpers.categories import get_category_tree, get_descendant_ids, insert_category_closure, move_category_subtree
 
 
 class User(AbstractUser):
@@ -67,38 +72,61 @@ class Category(models.Model):
     
     def get_all_products(self) -> QuerySet:
         """Get products from this category and all its subcategories"""
-
-        direct_products: QuerySet = self.products.all()
-        subcategory_products: QuerySet = Product.objects.filter(
-            category__in=self.get_descendants()
-        )
-        return (direct_products | subcategory_products).distinct()
+        return Product.objects.filter(category__ancestor_links__ancestor=self)
     
     def get_descendants(self) -> list:
-        """Get all descendant categories (recursive)"""
-        descendants: list = []
-        
-        def collect_descendants(category):
-            for subcategory in category.subcategories.all():
-                descendants.append(subcategory)
-                collect_descendants(subcategory)  # Recursive call
-        
-        collect_descendants(self)
-        return descendants
+        """Get all descendant categories (one closure table query)"""
+        return list(Category.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0))
     
     def get_path(self) -> str:
-        """Get full category path (e.g., 'Electronics > Computers > Laptops')"""
+        """Get full category path (e.g., 'Electronics > Computers > Laptops') from the in-memory tree"""
+        path: Optional[str] = get_category_tree().path(self.pk) if self.pk else None
+        if path is not None:
+            return path
+        # Not in the tree yet (unsaved, or created by a transaction this process cannot see)
         if self.parent is not None:
             return f"{self.parent.get_path()} > {self.name}"
         return self.name
     
     def save(self, *args, **kwargs):
-        """Auto-calculate level based on parent"""
+        """Auto-calculate level based on parent and keep the closure table in step"""
         if self.parent:
             self.level = self.parent.level + 1
         else:
             self.level = 0
+        is_new: bool = self._state.adding
+        previous_parent_id: Optional[int] = None
+        if not is_new:
+            previous_parent_id = Category.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+            if self.parent_id is not None and self.parent_id != previous_parent_id and \
+                    self.parent_id in get_descendant_ids([self.pk]):
+                raise ValueError('A category cannot be moved under itself or one of its subcategories')
         super().save(*args, **kwargs)
+        if is_new:
+            insert_category_closure(self.pk, self.parent_id)
+        elif self.parent_id != previous_parent_id:
+            move_category_subtree(self.pk, self.parent_id)
+            self.level = Category.objects.values_list('level', flat=True).get(pk=self.pk)
+
+class CategoryClosure(models.Model):
+    """
+    Closure table of the category tree: one row per (ancestor, descendant) pair
+    including each category with itself at depth 0, so a whole subtree is a single
+    indexed lookup. Maintained by Category.save(); bulk loads call rebuild_category_closure().
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(default=0, help_text="Distance from ancestor to descendant (0 = same category)")
+
+    class Meta:
+        """Meta class for CategoryClosure model"""
+        unique_together = [['ancestor', 'descendant']]
+        verbose_name = 'Category closure'
+        verbose_name_plural = 'Category closure'
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
 
 class Supplier(models.Model):
     """
@@ -146,6 +174,10 @@ class Product(models.Model):
         ordering = ['code']
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
+        indexes = [
+            # Keyset pagination of the product list seeks on (code, id)
+            models.Index(fields=['code', 'id']),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['code'],
@@ -166,26 +198,40 @@ class Product(models.Model):
     
     def update_all_potential_sales(self, min_stock: int=1):
         """
-        Calculate potential sales for all daily metrics - fill gaps with average from good stock days
+        Calculate potential sales for all daily metrics - fill gaps with average from good stock days.
+        Set-based: one aggregate for the average and one UPDATE ... CASE for every row.
         """
-        
-        oldest_metric : DailyMetrics = self.daily_metrics.order_by('date').first()
-        newest_metric : DailyMetrics = self.daily_metrics.order_by('-date').first()
-        if not oldest_metric or not newest_metric:
-            return
-        all_metrics: QuerySet = self.daily_metrics.filter(date__range=[oldest_metric.date, newest_metric.date])
+        all_metrics: QuerySet = self.daily_metrics.all()
         average_potential_sales: float = get_average_potential_sales(all_metrics, min_stock)
-        for metric in all_metrics:
-            if metric.stock >= min_stock:
-                metric.potential_sales = metric.sales_quantity or 0.0
-            else:
-                metric.potential_sales = average_potential_sales
-            metric.save()
-    
-    def get_average_daily_demand(self, days_back: int = 365) -> Optional[float]:
-        """Calculate average daily demand from potential_sales"""
+        all_metrics.update(
+            potential_sales=Case(
+                When(stock__gte=min_stock, then=Coalesce(F('sales_quantity'), 0, output_field=FloatField())),
+                default=Value(average_potential_sales),
+                output_field=FloatField()
+            )
+        )
+        # The running aggregate no longer matches the rows, next refresh recomputes in full
+        PotentialSalesState.objects.filter(product=self).update(computed_until=None)
+        rebuild_derived_metrics([self.pk])
+
+    def refresh_potential_sales(self, min_stock: int = 1) -> dict:
+        """
+        Incrementally maintain potential sales: only daily metrics after the stored
+        watermark are computed, unless backfilled history forces a full recompute
+        """
+        from app.helpers.potential_sales import refresh_potential_sales
+        return refresh_potential_sales([self.pk], min_stock=min_stock)
+    
+    def get_average_daily_demand(self, days_back: int = 365, use_rollups: bool = False) -> Optional[float]:
+        """
+        Calculate average daily demand from potential_sales.
+        With use_rollups whole months are read from MonthlyMetrics and only the
+        partial months at both ends of the window from DailyMetrics.
+        """
         end_date: datetime.date = datetime.now().date()
         start_date: datetime.date = end_date - timedelta(days=days_back - 1)
+        if use_rollups:
+            return self.get_average_potential_sales_between(start_date, end_date)
         
         avg_sales = self.daily_metrics.filter(
             date__range=[start_date, end_date],
@@ -193,6 +239,34 @@ class Product(models.Model):
         ).aggregate(avg=Avg('potential_sales'))['avg']
         
         return float(avg_sales) if avg_sales is not None else None
+
+    def get_average_potential_sales_between(self, start_date, end_date) -> Optional[float]:
+        """Average daily potential sales in [start_date, end_date] using monthly rollups"""
+        first_full_month = start_date if start_date.day == 1 else add_months(month_start(start_date), 1)
+        after_full_months = month_start(end_date + timedelta(days=1))
+        if first_full_month >= after_full_months:
+            first_full_month = after_full_months = end_date + timedelta(days=1)
+        months: dict = self.monthly_metrics.filter(
+            period_start__gte=first_full_month,
+            period_start__lt=after_full_months
+        ).aggregate(total=Sum('potential_sales_sum'), days=Sum('potential_sales_days'))
+        edges: dict = self.daily_metrics.filter(
+            Q(date__gte=start_date, date__lt=first_full_month) | Q(date__gte=after_full_months, date__lte=end_date),
+            potential_sales__isnull=False
+        ).aggregate(total=Sum('potential_sales'), days=Count('id'))
+        days: int = (months['days'] or 0) + edges['days']
+        if not days:
+            return None
+        return ((months['total'] or 0) + (edges['total'] or 0)) / days
+
+    def get_rollup_metrics(self, period: str = 'month', days_back: int = 730) -> QuerySet:
+        """Weekly or monthly metrics of the periods overlapping the last days_back days, oldest first"""
+        start_date: datetime.date = datetime.now().date() - timedelta(days=days_back - 1)
+        if period == 'week':
+            return self.weekly_metrics.filter(period_start__gt=start_date - timedelta(days=7)).order_by('period_start')
+        if period == 'month':
+            return self.monthly_metrics.filter(period_start__gte=month_start(start_date)).order_by('period_start')
+        raise ValueError(f"Unknown rollup period: {period}")
     
     def get_remainder_days(self, days_back: int = 365) -> Optional[int]:
         """Calculate average remaining days of stock based on average daily demand"""
@@ -221,9 +295,31 @@ class Product(models.Model):
         cutoff = datetime.now().date() - timedelta(days=30)
         return not self.daily_metrics.filter(date__lt=cutoff).exists()
 
+
+class DailyMetricsQuerySet(QuerySet):
+    """
+    Deletes refresh the data derived from the deleted rows once per call. There is no
+    post_delete receiver on DailyMetrics, so product cascades keep Django's fast delete.
+    """
+
+    def delete(self):
+        changes: dict = {
+            row['product_id']: (row['first_date'], row['last_date'])
+            for row in self.order_by().values('product_id').annotate(first_date=Min('date'), last_date=Max('date'))
+        }
+        deleted = super().delete()
+        propagate_daily_metrics_changes(changes)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class DailyMetrics(models.Model):
     """
-    Daily metrics for products with potential sales tracking
+    Daily metrics for products with potential sales tracking.
+    On PostgreSQL the table is range partitioned by month on date (primary key
+    (id, date) in the database), see app.helpers.partitions and manage_partitions.
     """
     # fields to import from ERP
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_metrics')
@@ -233,6 +329,9 @@ class DailyMetrics(models.Model):
     # calculated fields
     potential_sales = models.FloatField(default=0, null=True, blank=True, 
                                         help_text="Potential sales based on recent sales trend when stock was adequate")
+
+    objects = DailyMetricsQuerySet.as_manager()
+
     class Meta:
         """Meta class for Daily_Metrics model"""
         unique_together = ('product', 'date')
@@ -248,5 +347,216 @@ class DailyMetrics(models.Model):
             return max(0, self.potential_sales - self.sales_quantity)
         return None
     
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        propagate_daily_metrics_changes({self.product_id: (self.date, self.date)})
+        return deleted
+
     def __str__(self):
         return f"{self.product.code} - {self.date} (Stock: {self.stock}, Sales: {self.sales_quantity})"
+
+
+class PotentialSalesState(models.Model):
+    """
+    Per-product running good-stock aggregate used to maintain potential sales incrementally.
+    Rows after computed_until are filled from the running average; a NULL watermark
+    (history changed at or before it) forces a full recompute.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='potential_sales_state')
+    min_stock = models.PositiveIntegerField(default=1, help_text="Good stock threshold the aggregate was built with")
+    computed_until = models.DateField(null=True, blank=True, help_text="Watermark: newest daily metric date included (null = full recompute needed)")
+    good_stock_sales_sum = models.BigIntegerField(default=0, help_text="Sum of sales on good stock days up to the watermark")
+    good_stock_days = models.PositiveIntegerField(default=0, help_text="Number of good stock days with sales data up to the watermark")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Meta class for PotentialSalesState model"""
+        verbose_name = 'Potential sales state'
+        verbose_name_plural = 'Potential sales states'
+
+    @property
+    def average_potential_sales(self) -> float:
+        """Running average sales on good stock days"""
+        if not self.good_stock_days:
+            return 0.0
+        return self.good_stock_sales_sum / self.good_stock_days
+
+    def __str__(self):
+        return f"{self.product_id} - until {self.computed_until} (min stock {self.min_stock})"
+
+
+class ProductSnapshot(models.Model):
+    """
+    Per-product planning figures materialised from DailyMetrics so the product list
+    does not aggregate history on every page view. Refreshed after daily metrics are
+    written or potential sales recomputed; the demand window ends on as_of.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    latest_date = models.DateField(null=True, blank=True, help_text="Date of the latest daily metric")
+    latest_stock = models.PositiveIntegerField(null=True, blank=True, help_text="Stock on the latest daily metric")
+    avg_daily_demand = models.FloatField(null=True, blank=True, help_text="Average potential sales over the demand window")
+    remainder_days = models.IntegerField(null=True, blank=True, help_text="Days the latest stock lasts at average daily demand")
+    as_of = models.DateField(help_text="Last day of the demand window")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Meta class for ProductSnapshot model"""
+        verbose_name = 'Product snapshot'
+        verbose_name_plural = 'Product snapshots'
+        indexes = [
+            models.Index(fields=['latest_stock']),
+            models.Index(fields=['avg_daily_demand']),
+            models.Index(fields=['remainder_days']),
+            models.Index(fields=['as_of']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - as of {self.as_of} (stock {self.latest_stock}, demand {self.avg_daily_demand})"
+
+
+class MetricsRollup(models.Model):
+    """
+    Per-product aggregate of DailyMetrics over a calendar period, maintained
+    incrementally for the periods touched whenever daily rows change
+    """
+    period_start = models.DateField(help_text="First day of the period")
+    days = models.PositiveIntegerField(default=0, help_text="Daily metrics in the period")
+    sales_quantity_sum = models.BigIntegerField(default=0, help_text="Sum of sales quantity")
+    potential_sales_sum = models.FloatField(default=0, help_text="Sum of potential sales")
+    potential_sales_days = models.PositiveIntegerField(default=0, help_text="Days with potential sales")
+    stock_days = models.PositiveIntegerField(default=0, help_text="Days with stock on hand")
+    stockout_days = models.PositiveIntegerField(default=0, help_text="Days with zero stock")
+    min_stock = models.PositiveIntegerField(null=True, blank=True)
+    max_stock = models.PositiveIntegerField(null=True, blank=True)
+    last_stock = models.PositiveIntegerField(null=True, blank=True, help_text="Stock on the last day with data in the period")
+
+    class Meta:
+        """Meta class for MetricsRollup model"""
+        abstract = True
+        ordering = ['-period_start']
+
+    @property
+    def average_potential_sales(self) -> Optional[float]:
+        """Average daily potential sales in the period"""
+        if not self.potential_sales_days:
+            return None
+        return self.potential_sales_sum / self.potential_sales_days
+
+    def __str__(self):
+        return f"{self.product_id} - {self.period_start} (Sales: {self.sales_quantity_sum}, Stock-outs: {self.stockout_days})"
+
+
+class WeeklyMetrics(MetricsRollup):
+    """
+    DailyMetrics rolled up per ISO week (period_start is the Monday)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='weekly_metrics')
+
+    class Meta(MetricsRollup.Meta):
+        """Meta class for WeeklyMetrics model"""
+        unique_together = ('product', 'period_start')
+        verbose_name = 'Weekly metrics'
+        verbose_name_plural = 'Weekly metrics'
+
+
+class MonthlyMetrics(MetricsRollup):
+    """
+    DailyMetrics rolled up per calendar month (period_start is the 1st)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='monthly_metrics')
+
+    class Meta(MetricsRollup.Meta):
+        """Meta class for MonthlyMetrics model"""
+        unique_together = ('product', 'period_start')
+        verbose_name = 'Monthly metrics'
+        verbose_name_plural = 'Monthly metrics'
+
+
+class ProductSeries(models.Model):
+    """
+    A product's daily history packed into contiguous big-endian arrays (int32 sales and
+    stock, float32 potential sales), one value per day from start_date. Reading the
+    whole history is a single-row fetch, see app.helpers.series.get_product_series.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='series')
+    start_date = models.DateField(help_text="Date of the first value")
+    length = models.PositiveIntegerField(help_text="Number of days in the series")
+    sales_quantity = models.BinaryField(help_text="Packed int32 sales, missing days = -2^31")
+    stock = models.BinaryField(help_text="Packed int32 stock, missing days = -2^31")
+    potential_sales = models.BinaryField(help_text="Packed float32 potential sales, missing days = NaN")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Meta class for ProductSeries model"""
+        verbose_name = 'Product series'
+        verbose_name_plural = 'Product series'
+
+    @property
+    def end_date(self):
+        return self.start_date + timedelta(days=self.length - 1)
+
+    def __str__(self):
+        return f"{self.product_id} - {self.start_date} to {self.end_date}"
+
+
+class ExportJob(models.Model):
+    """
+    A product list export run outside the request by the export worker
+    (manage.py run_export_worker) from a snapshot of the list filters. The finished
+    file is kept under MEDIA_ROOT/exports/ until expires_at. A running job whose
+    updated_at heartbeat stops moving is re-queued, or failed after EXPORT_JOB_MAX_ATTEMPTS.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+        ('parquet', 'Parquet'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    params = models.JSONField(default=dict, help_text="Filters, order days and sort of the product list when requested")
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='exports/', blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0, help_text="Times a worker has claimed the job")
+    claimed_by = models.CharField(max_length=100, blank=True, help_text="Token of the current claim; only its worker may finish the job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="Heartbeat of the worker running the job")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="The file is deleted after this time")
+
+    class Meta:
+        """Meta class for ExportJob model"""
+        ordering = ['-created_at']
+        verbose_name = 'Export job'
+        verbose_name_plural = 'Export jobs'
+        indexes = [
+            # The worker claims the oldest pending job
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    @property
+    def progress(self) -> int:
+        """Percentage of rows written"""
+        if self.status == self.DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(100, self.processed_rows * 100 // self.total_rows)
+
+    def __str__(self):
+        return f"Export {self.pk} ({self.status}, {self.processed_rows}/{self.total_rows or '?'} rows)"
@@ -0,0 +1,50 @@
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from app.models import Category, Supplier, Product, DailyMetrics
+from app.helpers.changes import propagate_daily_metrics_changes
+from app.helpers.data_version import bump_data_version
+from app.helpers.categories import expire_category_tree_check, invalidate_category_tree
+
+
+@receiver(post_save, sender=DailyMetrics)
+def daily_metrics_changed(sender, instance: DailyMetrics, raw: bool = False, **kwargs):
+    """
+    Update derived data when a single daily metric is saved through the ORM. Deletes are
+    handled by DailyMetrics.delete and DailyMetricsQuerySet.delete: a post_delete receiver
+    would turn every product cascade into a per-row fetch of its whole history.
+    """
+    if raw:
+        return
+    propagate_daily_metrics_changes({instance.product_id: (instance.date, instance.date)})
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def catalog_changed(sender, raw: bool = False, **kwargs):
+    """Invalidate cached list results when catalog data changes"""
+    if raw:
+        return
+    bump_data_version()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_tree_changed(sender, **kwargs):
+    """Reload the in-memory category tree after any category change, fixtures included"""
+    invalidate_category_tree()
+
+
+# Each request checks once whether another process changed the categories
+request_started.connect(expire_category_tree_check, dispatch_uid='expire_category_tree_check')
+
+
+@receiver(m2m_changed, sender=Product.suppliers.through)
+def product_suppliers_changed(sender, action: str, **kwargs):
+    """Invalidate cached list results when product suppliers change"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_data_version()
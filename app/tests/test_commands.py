@@ -0,0 +1,638 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from datetime import date, timedelta
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+import openpyxl
+from app.models import Product, Category, Supplier, DailyMetrics, PotentialSalesState, ProductSnapshot, MonthlyMetrics, ProductSeries, ExportJob
+from app.helpers.importer import CopySource, import_daily_metrics_csv
+from app.helpers import export_jobs
+from app.helpers.export_jobs import claim_export_job, reclaim_stale_export_jobs, run_export_job
+from app.helpers.potential_sales import recompute_potential_sales_shard
+from app.management.commands.recompute_potential_sales import Command as RecomputeCommand
+
+
+class ImportDailyMetricsTestCase(TestCase):
+    """Test cases for the import_daily_metrics management command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product_a = Product.objects.create(code="IMP_A", name="Import Product A")
+        self.product_b = Product.objects.create(code="IMP_B", name="Import Product B")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_csv(self, content: str, name: str = 'daily_sales.csv') -> str:
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as csv_file:
+            csv_file.write(content)
+        return path
+
+    def test_import_creates_metrics(self):
+        """Test rows are inserted for known product codes"""
+        path = self.write_csv(
+            "code,date,sales_quantity,stock\n"
+            "IMP_A,2024-01-01,5,100\n"
+            "IMP_A,2024-01-02,3,97\n"
+            "IMP_B,2024-01-01,,0\n"
+        )
+        stats = import_daily_metrics_csv(path)
+
+        self.assertEqual(stats['rows_read'], 3)
+        self.assertEqual(stats['rows_upserted'], 3)
+        metric = DailyMetrics.objects.get(product=self.product_a, date=date(2024, 1, 2))
+        self.assertEqual(metric.sales_quantity, 3)
+        self.assertEqual(metric.stock, 97)
+        self.assertIsNone(metric.potential_sales)
+        metric_b = DailyMetrics.objects.get(product=self.product_b, date=date(2024, 1, 1))
+        self.assertIsNone(metric_b.sales_quantity)
+        self.assertEqual(metric_b.stock, 0)
+
+    def test_import_upserts_existing_rows(self):
+        """Test existing (product, date) rows are updated and keep potential sales"""
+        DailyMetrics.objects.create(
+            product=self.product_a, date=date(2024, 1, 1), sales_quantity=1, stock=1, potential_sales=4.5
+        )
+        path = self.write_csv("code,date,sales_quantity,stock\nIMP_A,2024-01-01,7,50\n")
+        import_daily_metrics_csv(path)
+
+        metric = DailyMetrics.objects.get(product=self.product_a, date=date(2024, 1, 1))
+        self.assertEqual(metric.sales_quantity, 7)
+        self.assertEqual(metric.stock, 50)
+        self.assertEqual(metric.potential_sales, 4.5)
+        self.assertEqual(DailyMetrics.objects.count(), 1)
+
+    def test_import_last_duplicate_wins(self):
+        """Test duplicate keys in one file resolve to the last row"""
+        path = self.write_csv(
+            "code,date,sales_quantity,stock\n"
+            "IMP_A,2024-01-01,1,10\n"
+            "IMP_A,2024-01-01,2,20\n"
+        )
+        import_daily_metrics_csv(path)
+
+        metric = DailyMetrics.objects.get(product=self.product_a, date=date(2024, 1, 1))
+        self.assertEqual(metric.sales_quantity, 2)
+        self.assertEqual(metric.stock, 20)
+
+    def test_import_skips_unknown_codes(self):
+        """Test rows with unknown product codes are skipped and reported"""
+        path = self.write_csv(
+            "code,date,sales_quantity,stock\n"
+            "UNKNOWN,2024-01-01,1,10\n"
+            "IMP_B,2024-01-01,2,20\n"
+        )
+        stats = import_daily_metrics_csv(path)
+
+        self.assertEqual(stats['rows_skipped'], 1)
+        self.assertEqual(stats['unknown_codes'], {'UNKNOWN'})
+        self.assertEqual(DailyMetrics.objects.count(), 1)
+
+    def test_import_missing_column_keeps_stored_values(self):
+        """Test a file without a stock column leaves stored stock untouched"""
+        DailyMetrics.objects.create(product=self.product_a, date=date(2024, 1, 1), sales_quantity=1, stock=33)
+        path = self.write_csv("date;code;sales_quantity\n2024-01-01;IMP_A;9\n")
+        import_daily_metrics_csv(path, delimiter=';')
+
+        metric = DailyMetrics.objects.get(product=self.product_a, date=date(2024, 1, 1))
+        self.assertEqual(metric.sales_quantity, 9)
+        self.assertEqual(metric.stock, 33)
+
+    def test_import_backfill_invalidates_potential_sales_state(self):
+        """Test importing days at or before the watermark forces a full recompute"""
+        DailyMetrics.objects.create(product=self.product_a, date=date(2024, 1, 5), sales_quantity=1, stock=1)
+        DailyMetrics.objects.create(product=self.product_b, date=date(2024, 1, 5), sales_quantity=1, stock=1)
+        self.product_a.refresh_potential_sales()
+        self.product_b.refresh_potential_sales()
+        path = self.write_csv(
+            "code,date,sales_quantity,stock\n"
+            "IMP_A,2024-01-03,2,2\n"
+            "IMP_B,2024-01-06,2,2\n"
+        )
+        stats = import_daily_metrics_csv(path)
+
+        self.assertEqual(stats['changes'][self.product_a.pk], (date(2024, 1, 3), date(2024, 1, 3)))
+        self.assertIsNone(PotentialSalesState.objects.get(product=self.product_a).computed_until)
+        self.assertEqual(PotentialSalesState.objects.get(product=self.product_b).computed_until, date(2024, 1, 5))
+
+    def test_import_refreshes_product_snapshots(self):
+        """Test imported products get a current snapshot"""
+        yesterday = date.today() - timedelta(days=1)
+        path = self.write_csv(f"code,date,sales_quantity,stock\nIMP_A,{yesterday},2,40\n")
+        import_daily_metrics_csv(path)
+
+        snapshot = ProductSnapshot.objects.get(product=self.product_a)
+        self.assertEqual((snapshot.latest_date, snapshot.latest_stock), (yesterday, 40))
+        self.assertFalse(ProductSnapshot.objects.filter(product=self.product_b).exists())
+
+    def test_import_refreshes_rollups(self):
+        """Test imported days are rolled up into their months"""
+        DailyMetrics.objects.create(product=self.product_a, date=date(2024, 3, 31), sales_quantity=1, stock=0)
+        path = self.write_csv(
+            "code,date,sales_quantity,stock\n"
+            "IMP_A,2024-03-30,4,6\n"
+            "IMP_A,2024-04-01,2,9\n"
+        )
+        import_daily_metrics_csv(path)
+
+        march = MonthlyMetrics.objects.get(product=self.product_a, period_start=date(2024, 3, 1))
+        self.assertEqual((march.days, march.sales_quantity_sum, march.stockout_days, march.last_stock), (2, 5, 1, 0))
+        self.assertEqual(MonthlyMetrics.objects.get(product=self.product_a, period_start=date(2024, 4, 1)).last_stock, 9)
+
+    def test_import_missing_required_column(self):
+        """Test a file without a code column is rejected"""
+        path = self.write_csv("date,sales_quantity\n2024-01-01,1\n")
+        with self.assertRaises(ValueError):
+            import_daily_metrics_csv(path)
+
+    def test_command_uses_configured_path(self):
+        """Test the command reads CSV_IMPORT_PATH / CSV_FILE_NAME by default"""
+        self.write_csv("code,date,sales_quantity,stock\nIMP_A,2024-01-01,5,100\n", name='configured.csv')
+        out = StringIO()
+        with override_settings(CSV_IMPORT_PATH=self.tmp_dir.name, CSV_FILE_NAME='configured.csv'):
+            call_command('import_daily_metrics', stdout=out)
+
+        self.assertIn('upserted 1 daily metrics', out.getvalue())
+        self.assertTrue(DailyMetrics.objects.filter(product=self.product_a).exists())
+
+    def test_command_missing_file(self):
+        """Test the command fails cleanly when the file does not exist"""
+        with self.assertRaises(CommandError):
+            call_command('import_daily_metrics', path=os.path.join(self.tmp_dir.name, 'missing.csv'), stdout=StringIO())
+
+    def test_command_reports_bad_values(self):
+        """Test malformed dates and numbers fail with their CSV line and column instead of a traceback"""
+        cases = [
+            ("IMP_A,2024-13-01,5,100\n", 'line 4, column date'),
+            ("IMP_A,2024-01-02,5,lots\n", 'line 4, column stock'),
+            ("IMP_A,2024-01-02,1.5,100\n", 'line 4, column sales_quantity'),
+            ("IMP_A,,5,100\n", 'line 4, column date'),
+            ("IMP_A,2024-01-02,5,-3\n", 'line 4: new row for relation "app_dailymetrics_staging" violates check constraint "app_dailymetrics_staging_stock_check"'),
+        ]
+        for bad_row, location in cases:
+            with self.subTest(bad_row=bad_row):
+                path = self.write_csv(
+                    "code,date,sales_quantity,stock\nIMP_A,2024-01-01,5,100\nUNKNOWN,2024-01-01,1,1\n" + bad_row
+                )
+                with self.assertRaisesMessage(CommandError, location):
+                    call_command('import_daily_metrics', path=path, stdout=StringIO())
+        self.assertFalse(DailyMetrics.objects.exists())
+
+    def test_copy_source_reads_in_chunks(self):
+        """Test CopySource serialises rows lazily and preserves content"""
+        source = CopySource(((i, f'value {i}', '') for i in range(25)), chunk_rows=4)
+        first = source.readline()
+        self.assertEqual(first, '0,value 0,\n')
+        rest = ''
+        while True:
+            data = source.read(16)
+            if not data:
+                break
+            rest += data
+        self.assertEqual(len((first + rest).splitlines()), 25)
+
+
+class BenchmarkPotentialSalesTestCase(TestCase):
+    """Test cases for the benchmark_potential_sales management command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="BENCH_1", name="Benchmark Product")
+        for day in range(10):
+            DailyMetrics.objects.create(
+                product=self.product,
+                date=date(2024, 1, 1) + timedelta(days=day),
+                sales_quantity=day,
+                stock=day % 3,
+                potential_sales=None
+            )
+
+    def test_benchmark_reports_and_rolls_back(self):
+        """Test the benchmark verifies strategies agree and leaves data untouched"""
+        out = StringIO()
+        call_command('benchmark_potential_sales', products=5, stdout=out)
+
+        self.assertIn('identical potential sales', out.getvalue())
+        self.assertIn('set-based batched', out.getvalue())
+        self.assertFalse(self.product.daily_metrics.filter(potential_sales__isnull=False).exists())
+
+    def test_benchmark_without_data(self):
+        """Test the benchmark fails cleanly without daily metrics"""
+        DailyMetrics.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('benchmark_potential_sales', stdout=StringIO())
+
+
+class RecomputePotentialSalesTestCase(TestCase):
+    """Test cases for the recompute_potential_sales management command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmp_dir.name, 'checkpoint.json')
+        self.products = [
+            Product.objects.create(code=f"RECOMP_{i}", name=f"Recompute Product {i}", is_active=True)
+            for i in range(5)
+        ]
+        self.inactive = Product.objects.create(code="RECOMP_INACTIVE", name="Inactive Product", is_active=False)
+        for product in self.products + [self.inactive]:
+            for day in range(4):
+                DailyMetrics.objects.create(
+                    product=product,
+                    date=date(2024, 1, 1) + timedelta(days=day),
+                    sales_quantity=day + 1,
+                    stock=0 if day == 3 else 10,
+                    potential_sales=None
+                )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_recompute_active_products_inline(self):
+        """Test all active products are recomputed in shards and the checkpoint is cleared"""
+        out = StringIO()
+        call_command(
+            'recompute_potential_sales', workers=1, batch_size=2, checkpoint=self.checkpoint, stdout=out
+        )
+
+        self.assertIn('Shard 3/3 done', out.getvalue())
+        self.assertFalse(DailyMetrics.objects.filter(product__in=self.products, potential_sales__isnull=True).exists())
+        self.assertFalse(self.inactive.daily_metrics.filter(potential_sales__isnull=False).exists())
+        stocked_out = DailyMetrics.objects.get(product=self.products[0], date=date(2024, 1, 4))
+        self.assertEqual(stocked_out.potential_sales, 2.0)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def write_checkpoint(self, finished: list, **run):
+        """Write a checkpoint for the current active products, run overrides its mode fields"""
+        active_ids = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+        checkpoint = {'min_stock': 1, 'incremental': False, 'products': RecomputeCommand.products_digest(active_ids)}
+        with open(self.checkpoint, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({**checkpoint, **run, 'finished': finished}, checkpoint_file)
+
+    def test_resume_skips_finished_shards(self):
+        """Test --resume skips product ranges recorded in the checkpoint"""
+        self.write_checkpoint([[self.products[0].pk, self.products[1].pk]])
+        out = StringIO()
+        call_command(
+            'recompute_potential_sales', workers=1, batch_size=2, resume=True,
+            checkpoint=self.checkpoint, stdout=out
+        )
+
+        self.assertIn('Recomputing potential sales for 3 products', out.getvalue())
+        self.assertFalse(self.products[0].daily_metrics.filter(potential_sales__isnull=False).exists())
+        self.assertFalse(self.products[4].daily_metrics.filter(potential_sales__isnull=True).exists())
+
+    def test_incremental_recompute(self):
+        """Test --incremental only computes rows after the watermark"""
+        call_command('recompute_potential_sales', workers=1, checkpoint=self.checkpoint, stdout=StringIO())
+        DailyMetrics.objects.filter(product__in=self.products).update(potential_sales=-1)
+        DailyMetrics.objects.create(
+            product=self.products[0], date=date(2024, 1, 5), sales_quantity=0, stock=0, potential_sales=None
+        )
+        out = StringIO()
+        call_command('recompute_potential_sales', workers=1, incremental=True, checkpoint=self.checkpoint, stdout=out)
+
+        self.assertIn('(1 daily metrics)', out.getvalue())
+        self.assertEqual(DailyMetrics.objects.get(product=self.products[0], date=date(2024, 1, 5)).potential_sales, 2.0)
+        self.assertEqual(DailyMetrics.objects.filter(potential_sales=-1).count(), 20)
+
+    def test_resume_with_different_min_stock(self):
+        """Test resuming with a different min_stock is refused"""
+        self.write_checkpoint([], min_stock=5)
+        with self.assertRaises(CommandError):
+            call_command('recompute_potential_sales', workers=1, resume=True, checkpoint=self.checkpoint, stdout=StringIO())
+
+    def test_resume_in_other_mode_is_refused(self):
+        """Test a full run's checkpoint cannot be resumed incrementally and the reverse"""
+        self.write_checkpoint([[self.products[0].pk, self.products[1].pk]])
+        with self.assertRaisesMessage(CommandError, 'without --incremental'):
+            call_command(
+                'recompute_potential_sales', workers=1, incremental=True, resume=True,
+                checkpoint=self.checkpoint, stdout=StringIO()
+            )
+        self.write_checkpoint([], incremental=True)
+        with self.assertRaisesMessage(CommandError, 'with --incremental'):
+            call_command('recompute_potential_sales', workers=1, resume=True, checkpoint=self.checkpoint, stdout=StringIO())
+
+    def test_resume_after_activation_is_refused(self):
+        """Test a product activated inside a finished range after the interruption is not silently skipped"""
+        dormant = Product.objects.create(code="RECOMP_DORMANT", name="Dormant Product", is_active=False)
+        finished = [[self.products[0].pk, self.products[-1].pk + 100]]
+        self.write_checkpoint(finished)
+        dormant.is_active = True
+        dormant.save()
+        with self.assertRaisesMessage(CommandError, 'Active products changed'):
+            call_command('recompute_potential_sales', workers=1, resume=True, checkpoint=self.checkpoint, stdout=StringIO())
+
+    def test_interrupted_run_resumes(self):
+        """Test the checkpoint of an interrupted run lets --resume finish only the remaining shards"""
+        shard_calls = []
+
+        def fail_on_second_shard(shard, min_stock, incremental):
+            shard_calls.append(shard)
+            if len(shard_calls) == 2:
+                raise RuntimeError('worker crashed')
+            return recompute_potential_sales_shard(shard, min_stock, incremental)
+
+        with patch(
+            'app.management.commands.recompute_potential_sales.recompute_potential_sales_shard',
+            side_effect=fail_on_second_shard
+        ), self.assertRaises(RuntimeError):
+            call_command('recompute_potential_sales', workers=1, batch_size=2, checkpoint=self.checkpoint, stdout=StringIO())
+
+        out = StringIO()
+        call_command(
+            'recompute_potential_sales', workers=1, batch_size=2, resume=True, checkpoint=self.checkpoint, stdout=out
+        )
+        self.assertIn('Recomputing potential sales for 3 products', out.getvalue())
+        self.assertFalse(DailyMetrics.objects.filter(product__in=self.products, potential_sales__isnull=True).exists())
+
+
+class RecomputePotentialSalesParallelTestCase(TransactionTestCase):
+    """Test the recompute command with a real process pool (data must be committed for workers)"""
+
+    def test_recompute_with_process_pool(self):
+        """Test shards processed by worker processes update every active product"""
+        products = [Product.objects.create(code=f"PAR_{i}", name=f"Parallel {i}", is_active=True) for i in range(4)]
+        for product in products:
+            for day in range(3):
+                DailyMetrics.objects.create(
+                    product=product, date=date(2024, 1, 1) + timedelta(days=day),
+                    sales_quantity=2, stock=day, potential_sales=None
+                )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            call_command(
+                'recompute_potential_sales', workers=2, batch_size=1,
+                checkpoint=os.path.join(tmp_dir, 'checkpoint.json'), stdout=StringIO()
+            )
+
+        self.assertFalse(DailyMetrics.objects.filter(potential_sales__isnull=True).exists())
+        self.assertEqual(DailyMetrics.objects.get(product=products[0], date=date(2024, 1, 1)).potential_sales, 2.0)
+
+
+class GenerateDemoDataTestCase(TestCase):
+    """Test cases for the generate_demo_data management command"""
+
+    def generate(self, **options):
+        defaults = {'products': 6, 'days': 12, 'categories': 4, 'suppliers': 5, 'suppliers_per_product': 3, 'batch_size': 4}
+        defaults.update(options)
+        call_command('generate_demo_data', stdout=StringIO(), **defaults)
+
+    def test_generates_requested_volume(self):
+        """Test the requested numbers of rows are created and existing data is replaced"""
+        Product.objects.create(code="OLD_PRODUCT", name="Old Product")
+        self.generate(seed=1)
+
+        self.assertEqual(Category.objects.count(), 4)
+        self.assertEqual(Supplier.objects.count(), 5)
+        self.assertEqual(Product.objects.filter(is_active=True).count(), 6)
+        self.assertFalse(Product.objects.filter(code="OLD_PRODUCT").exists())
+        self.assertEqual(DailyMetrics.objects.count(), 6 * 12)
+        for product in Product.objects.all():
+            self.assertEqual(product.daily_metrics.count(), 12)
+            self.assertTrue(1 <= product.suppliers.count() <= 3)
+        self.assertFalse(DailyMetrics.objects.filter(stock__lt=0).exists())
+        self.assertEqual(ProductSnapshot.objects.filter(latest_stock__isnull=False).count(), 6)
+        self.assertEqual(sum(MonthlyMetrics.objects.values_list('days', flat=True)), 6 * 12)
+
+    def test_category_levels_follow_parents(self):
+        """Test generated category levels and closure rows are consistent with the hierarchy"""
+        self.generate(seed=2, categories=30)
+        for category in Category.objects.select_related('parent'):
+            expected = category.parent.level + 1 if category.parent else 0
+            self.assertEqual(category.level, expected)
+            self.assertEqual(
+                sorted(category.ancestor_links.values_list('ancestor_id', flat=True)),
+                sorted([category.pk] + [ancestor.pk for ancestor in self.ancestors(category)])
+            )
+
+    def ancestors(self, category) -> list:
+        ancestors: list = []
+        while category.parent_id:
+            category = category.parent
+            ancestors.append(category)
+        return ancestors
+
+    def test_seed_is_reproducible(self):
+        """Test the same seed generates the same metrics"""
+        self.generate(seed=3)
+        first = list(DailyMetrics.objects.order_by('product__code', 'date').values_list('sales_quantity', 'stock'))
+        self.generate(seed=3)
+        second = list(DailyMetrics.objects.order_by('product__code', 'date').values_list('sales_quantity', 'stock'))
+        self.assertEqual(first, second)
+
+    def test_sequences_are_reset(self):
+        """Test new rows can be created after the COPY load"""
+        self.generate(seed=4)
+        product = Product.objects.create(code="AFTER_DEMO", name="After Demo")
+        self.assertEqual(product.pk, 7)
+
+
+class RefreshProductSnapshotsTestCase(TestCase):
+    """Test cases for the refresh_product_snapshots management command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.products = [Product.objects.create(code=f"SNAP_{i}", name=f"Snapshot {i}") for i in range(3)]
+        for product in self.products:
+            DailyMetrics.objects.create(
+                product=product, date=date.today() - timedelta(days=2), sales_quantity=2, stock=20, potential_sales=2.0
+            )
+
+    def test_refresh_all(self):
+        """Test every product snapshot is rebuilt"""
+        ProductSnapshot.objects.all().delete()
+        out = StringIO()
+        call_command('refresh_product_snapshots', batch_size=2, stdout=out)
+
+        self.assertIn('Refreshed 3 of 3', out.getvalue())
+        self.assertEqual(ProductSnapshot.objects.filter(remainder_days=10).count(), 3)
+
+    def test_refresh_stale_only(self):
+        """Test --stale-only skips snapshots whose demand window is current"""
+        ProductSnapshot.objects.filter(product=self.products[0]).update(as_of=date.today() - timedelta(days=1))
+        out = StringIO()
+        call_command('refresh_product_snapshots', stale_only=True, stdout=out)
+
+        self.assertIn('Refreshed 1 of 3', out.getvalue())
+        self.assertEqual(ProductSnapshot.objects.get(product=self.products[0]).as_of, date.today())
+
+
+class ManagePartitionsTestCase(TestCase):
+    """Test cases for the manage_partitions management command"""
+
+    def test_split_default_and_retention(self):
+        """Test default rows are split out and months past retention detached"""
+        product = Product.objects.create(code="PART_CMD", name="Partition Command")
+        DailyMetrics.objects.create(product=product, date=date(2005, 3, 3))
+        out = StringIO()
+        call_command('manage_partitions', split_default=True, retention_months=12, drop=True, stdout=out)
+
+        self.assertIn('Created app_dailymetrics_p2005_03', out.getvalue())
+        self.assertIn('Dropped app_dailymetrics_p2005_03', out.getvalue())
+        self.assertFalse(DailyMetrics.objects.filter(product=product).exists())
+
+    def test_list(self):
+        """Test partitions are listed with their bounds"""
+        out = StringIO()
+        call_command('manage_partitions', list=True, stdout=out)
+        self.assertIn('app_dailymetrics_default', out.getvalue())
+        self.assertIn('DEFAULT', out.getvalue())
+
+
+class RebuildDerivedMetricsTestCase(TestCase):
+    """Test cases for the rebuild_derived_metrics management command"""
+
+    def test_rebuild_restores_derived_tables(self):
+        """Test rollups, series and snapshots are rebuilt from daily metrics"""
+        product = Product.objects.create(code="DERIVED_001", name="Derived")
+        DailyMetrics.objects.create(product=product, date=date.today(), sales_quantity=3, stock=9, potential_sales=3.0)
+        MonthlyMetrics.objects.all().delete()
+        ProductSeries.objects.all().delete()
+        ProductSnapshot.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_derived_metrics', batch_size=1, stdout=out)
+
+        self.assertIn('Rebuilt derived metrics for 1 products', out.getvalue())
+        self.assertEqual(MonthlyMetrics.objects.get(product=product).sales_quantity_sum, 3)
+        self.assertTrue(ProductSeries.objects.filter(product=product).exists())
+        self.assertEqual(ProductSnapshot.objects.get(product=product).remainder_days, 3)
+
+
+class RunExportWorkerTestCase(TestCase):
+    """Test cases for the run_export_worker management command"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.settings_override.enable()
+        for i in range(3):
+            product = Product.objects.create(code=f"JOB_{i}", name=f"Job {i}", is_active=True)
+            DailyMetrics.objects.create(product=product, date=date.today(), stock=i)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_dir.cleanup()
+
+    def test_runs_pending_jobs(self):
+        """Test queued jobs are exported with their filters and kept until expiry"""
+        job = ExportJob.objects.create(params={'filters': {'code': 'JOB_1'}, 'order_days': 0, 'sort': ''})
+        out = StringIO()
+        call_command('run_export_worker', once=True, stdout=out)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertEqual((job.total_rows, job.processed_rows, job.progress), (1, 1, 100))
+        self.assertGreater(job.expires_at, timezone.now())
+        self.assertTrue(job.file.name.startswith('exports/'))
+        ws = openpyxl.load_workbook(job.file.path).active
+        self.assertEqual([row[0] for row in ws.iter_rows(min_row=2, values_only=True)], ['JOB_1'])
+        self.assertIn(f'Export {job.pk} done', out.getvalue())
+
+    def test_failed_job_keeps_error(self):
+        """Test a failing export is marked failed and the worker carries on"""
+        job = ExportJob.objects.create(params={})
+        with patch('app.helpers.export_jobs.product_export_queryset', side_effect=ValueError('broken filter')):
+            call_command('run_export_worker', once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertEqual(job.error, 'broken filter')
+
+    def test_purges_expired_exports(self):
+        """Test expired jobs are deleted with their files"""
+        job = ExportJob.objects.create(status=ExportJob.DONE, expires_at=timezone.now() - timedelta(minutes=1))
+        job.file.save('old.xlsx', ContentFile(b'xlsx'))
+        path = job.file.path
+        kept = ExportJob.objects.create(status=ExportJob.DONE, expires_at=timezone.now() + timedelta(hours=1))
+
+        call_command('run_export_worker', once=True, stdout=StringIO())
+        self.assertFalse(ExportJob.objects.filter(pk=job.pk).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(ExportJob.objects.filter(pk=kept.pk).exists())
+
+    def test_stale_running_job_is_reclaimed(self):
+        """Test a running job whose worker stopped sending heartbeats is run again by another worker"""
+        job = ExportJob.objects.create(params={'filters': {'code': 'JOB_2'}, 'order_days': 0, 'sort': ''})
+        claim_export_job()
+        ExportJob.objects.filter(pk=job.pk).update(processed_rows=7, updated_at=timezone.now() - timedelta(minutes=16))
+        alive = ExportJob.objects.create(params={})
+        claim_export_job()
+
+        out = StringIO()
+        call_command('run_export_worker', once=True, stdout=out)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.processed_rows), (ExportJob.DONE, 2, 1))
+        self.assertIn('Reclaimed 1 stale exports.', out.getvalue())
+        alive.refresh_from_db()
+        self.assertEqual(alive.status, ExportJob.RUNNING)
+
+    def test_stale_job_fails_after_max_attempts(self):
+        """Test a job that keeps losing its worker is failed and later purged"""
+        job = ExportJob.objects.create(status=ExportJob.RUNNING, attempts=3, params={})
+        ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=16))
+        with override_settings(EXPORT_JOB_MAX_ATTEMPTS=3):
+            self.assertEqual(reclaim_stale_export_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertEqual(job.error, 'The export worker stopped responding.')
+
+        ExportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('run_export_worker', once=True, stdout=StringIO())
+        self.assertFalse(ExportJob.objects.filter(pk=job.pk).exists())
+
+    def test_heartbeat_covers_snapshot_refresh(self):
+        """Test the heartbeat moves before and after the snapshot refresh, so a slow refresh is not reclaimed"""
+        job = ExportJob.objects.create(params={})
+        claim_export_job()
+        ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=16))
+        heartbeats = []
+
+        def slow_refresh(params):
+            heartbeats.append(ExportJob.objects.get(pk=job.pk).updated_at)
+            ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=16))
+
+        with patch('app.helpers.export_jobs.refresh_export_snapshots', side_effect=slow_refresh):
+            run_export_job(ExportJob.objects.get(pk=job.pk))
+        self.assertGreater(heartbeats[0], timezone.now() - timedelta(minutes=1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertEqual(reclaim_stale_export_jobs(), 0)
+
+    def test_reclaimed_job_is_not_overwritten(self):
+        """Test a worker whose job was requeued meanwhile leaves the new run's state and no file"""
+        job = ExportJob.objects.create(params={})
+        claimed = claim_export_job()
+        product_export_rows = export_jobs.product_export_rows
+
+        def requeue_then_rows(products):
+            ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=16))
+            reclaim_stale_export_jobs()
+            return product_export_rows(products)
+
+        with patch('app.helpers.export_jobs.product_export_rows', side_effect=requeue_then_rows):
+            self.assertEqual(run_export_job(claimed).status, ExportJob.PENDING)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.claimed_by, job.file.name, job.processed_rows), (ExportJob.PENDING, '', '', 0))
+        self.assertEqual(os.listdir(os.path.join(self.media_dir.name, 'exports')), [])
+
+        again = claim_export_job()
+        self.assertNotEqual(again.claimed_by, claimed.claimed_by)
+        with patch('app.helpers.export_jobs.refresh_export_snapshots') as refresh:
+            refresh.side_effect = lambda params: ExportJob.objects.filter(pk=job.pk).update(claimed_by='other')
+            run_export_job(again)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.claimed_by, job.file.name), (ExportJob.RUNNING, 'other', ''))
+
+    def test_invalid_poll_interval(self):
+        """Test a non-positive poll interval is rejected"""
+        with self.assertRaises(CommandError):
+            call_command('run_export_worker', once=True, poll_interval=0, stdout=StringIO())
@@ -1,11 +1,44 @@
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
 from datetime import date, timedelta
 from decimal import Decimal
 from unittest.mock import Mock
 from django.http import QueryDict
-from app.models import Product, Category, Supplier, DailyMetrics
+from app.models import Product, Category, Supplier, DailyMetrics, PotentialSalesState, ProductSnapshot, WeeklyMetrics, MonthlyMetrics, ProductSeries
 from app.helpers.utils import get_average_potential_sales
-from app.helpers.context import populate_product_list_context, apply_min_max_filter
+from app.helpers.context import (
+    populate_product_list_context, apply_min_max_filter, annotate_product_queryset, filter_product_queryset,
+    apply_planning_filters, sort_product_queryset
+)
+from app.helpers.snapshots import refresh_product_snapshots, refresh_stale_product_snapshots
+from app.helpers.rollups import rebuild_metric_rollups
+from app.helpers.series import (
+    MISSING_INT, downsample_product_series, get_product_series, lttb_indices, rebuild_product_series,
+    refresh_product_series
+)
+from app.helpers.pagination import AFTER, decode_cursor, encode_cursor, keyset_paginate
+from app.helpers.search import trigram_available
+from app.helpers.counts import CachedCountPaginator, estimate_queryset_count, filter_signature, product_count_cache_key
+from app.helpers.data_version import bump_data_version, get_data_version
+from app.helpers.facets import get_product_facets, product_facet
+from app.helpers.exports import (
+    iter_csv, iter_ndjson, product_export_queryset, product_export_rows, sample_column_widths, write_excel,
+    write_parquet
+)
+from app.helpers import categories as category_helpers
+from app.helpers.categories import expire_category_tree_check, get_category_tree
+from app.forms import ProductCategoryFilterForm
+import io
+import json
+import numpy as np
+import openpyxl
+from app.helpers.partitions import (
+    DEFAULT_PARTITION, add_months, create_monthly_partitions, detach_partitions_before, ensure_future_partitions,
+    is_partitioned, list_partitions, partition_name, split_default_partition
+)
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 
 
 class HelpersUtilsTestCase(TestCase):
@@ -400,6 +433,1001 @@ class UpdateAllPotentialSalesTestCase(TestCase):
         for metric in saved_metrics:
             self.assertEqual(metric.potential_sales, 4.0)
 
+    def test_update_all_potential_sales_null_stock_gets_average(self):
+        """Test that metrics with unknown stock are filled with the average"""
+        metric = DailyMetrics.objects.create(
+            product=self.product,
+            date=self.base_date + timedelta(days=20),
+            sales_quantity=2,
+            stock=None
+        )
+        self.product.update_all_potential_sales(min_stock=1)
+        metric.refresh_from_db()
+        self.assertEqual(metric.potential_sales, 5.0)
+
+
+class UpdatePotentialSalesBatchTestCase(TestCase):
+    """Test cases for the batched set-based potential sales update"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.products = [
+            Product.objects.create(code=f"BATCH_{i}", name=f"Batch Product {i}")
+            for i in range(3)
+        ]
+        base_date = date.today() - timedelta(days=30)
+        for index, product in enumerate(self.products):
+            for day in range(30):
+                DailyMetrics.objects.create(
+                    product=product,
+                    date=base_date + timedelta(days=day),
+                    sales_quantity=None if day % 7 == 0 else (day + index) % 5,
+                    stock=0 if day % (index + 3) == 0 else day
+                )
+
+    def get_potential_sales(self) -> list:
+        return list(
+            DailyMetrics.objects.filter(product__in=self.products)
+            .order_by('product_id', 'date')
+            .values_list('potential_sales', flat=True)
+        )
+
+    def test_batch_matches_per_product_update(self):
+        """Test the batched update produces identical results to update_all_potential_sales"""
+        from app.helpers.potential_sales import update_potential_sales
+        for min_stock in (1, 10):
+            for product in self.products:
+                product.update_all_potential_sales(min_stock=min_stock)
+            expected = self.get_potential_sales()
+            DailyMetrics.objects.filter(product__in=self.products).update(potential_sales=None)
+
+            updated = update_potential_sales([p.pk for p in self.products], min_stock=min_stock)
+
+            self.assertEqual(updated, 90)
+            self.assertEqual(self.get_potential_sales(), expected)
+
+    def test_batch_only_touches_given_products(self):
+        """Test products outside the batch are left untouched"""
+        from app.helpers.potential_sales import update_potential_sales
+        DailyMetrics.objects.update(potential_sales=None)
+        update_potential_sales([self.products[0].pk])
+        self.assertFalse(self.products[0].daily_metrics.filter(potential_sales__isnull=True).exists())
+        self.assertFalse(self.products[1].daily_metrics.filter(potential_sales__isnull=False).exists())
+
+    def test_batch_empty_product_list(self):
+        """Test an empty batch is a no-op"""
+        from app.helpers.potential_sales import update_potential_sales
+        self.assertEqual(update_potential_sales([]), 0)
+
+
+class RefreshPotentialSalesTestCase(TestCase):
+    """Test cases for watermark-driven incremental potential sales maintenance"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="INCR_001", name="Incremental Product")
+        self.base_date = date.today() - timedelta(days=20)
+        # Days 1-4 good stock (sales 2, 4, 6, 8), day 5 stock-out
+        for i in range(5):
+            DailyMetrics.objects.create(
+                product=self.product,
+                date=self.base_date + timedelta(days=i),
+                sales_quantity=2 * (i + 1),
+                stock=0 if i == 4 else 10,
+                potential_sales=None
+            )
+
+    def add_day(self, offset: int, sales: int, stock: int) -> DailyMetrics:
+        return DailyMetrics.objects.create(
+            product=self.product, date=self.base_date + timedelta(days=offset),
+            sales_quantity=sales, stock=stock, potential_sales=None
+        )
+
+    def test_first_refresh_is_full_and_stores_state(self):
+        """Test a product without state is fully recomputed and gets a watermark"""
+        stats = self.product.refresh_potential_sales()
+
+        self.assertEqual(stats, {'incremental': 0, 'full': 1, 'rows': 5})
+        state = PotentialSalesState.objects.get(product=self.product)
+        self.assertEqual(state.computed_until, self.base_date + timedelta(days=4))
+        self.assertEqual(state.good_stock_sales_sum, 20)
+        self.assertEqual(state.good_stock_days, 4)
+        self.assertEqual(state.average_potential_sales, 5.0)
+        self.assertEqual(self.product.daily_metrics.get(stock=0).potential_sales, 5.0)
+
+    def test_appended_days_only_touch_new_rows(self):
+        """Test new days are filled from the running average without rewriting history"""
+        self.product.refresh_potential_sales()
+        DailyMetrics.objects.filter(product=self.product).update(potential_sales=-1)
+        self.add_day(5, sales=10, stock=10)
+        stocked_out = self.add_day(6, sales=0, stock=0)
+
+        stats = self.product.refresh_potential_sales()
+
+        self.assertEqual(stats, {'incremental': 1, 'full': 0, 'rows': 2})
+        self.assertEqual(self.product.daily_metrics.filter(potential_sales=-1).count(), 5)
+        stocked_out.refresh_from_db()
+        self.assertEqual(stocked_out.potential_sales, 30 / 5)
+        state = PotentialSalesState.objects.get(product=self.product)
+        self.assertEqual(state.computed_until, stocked_out.date)
+        self.assertEqual((state.good_stock_sales_sum, state.good_stock_days), (30, 5))
+
+    def test_refresh_without_new_rows_is_noop(self):
+        """Test a refresh with nothing after the watermark updates no rows"""
+        self.product.refresh_potential_sales()
+        self.assertEqual(self.product.refresh_potential_sales(), {'incremental': 1, 'full': 0, 'rows': 0})
+
+    def test_backfill_forces_full_recompute(self):
+        """Test writing a day at or before the watermark invalidates the aggregate"""
+        self.product.refresh_potential_sales()
+        DailyMetrics.objects.filter(product=self.product, date=self.base_date).update(sales_quantity=12)
+        self.product.daily_metrics.get(date=self.base_date + timedelta(days=1)).save()
+
+        self.assertIsNone(PotentialSalesState.objects.get(product=self.product).computed_until)
+        stats = self.product.refresh_potential_sales()
+
+        self.assertEqual(stats['full'], 1)
+        self.assertEqual(self.product.daily_metrics.get(stock=0).potential_sales, 30 / 4)
+
+    def test_min_stock_change_forces_full_recompute(self):
+        """Test a different min_stock does not reuse the stored aggregate"""
+        self.product.refresh_potential_sales(min_stock=1)
+        stats = self.product.refresh_potential_sales(min_stock=100)
+
+        self.assertEqual(stats['full'], 1)
+        self.assertEqual(PotentialSalesState.objects.get(product=self.product).min_stock, 100)
+        self.assertEqual(self.product.daily_metrics.get(date=self.base_date).potential_sales, 0.0)
+
+    def test_good_stock_rows_match_full_recompute(self):
+        """Test incremental refreshes agree with a full recompute when only good stock days arrive"""
+        self.product.refresh_potential_sales()
+        for offset in range(5, 9):
+            self.add_day(offset, sales=offset, stock=5)
+            self.product.refresh_potential_sales()
+        incremental = list(self.product.daily_metrics.order_by('date').values_list('potential_sales', flat=True))
+        incremental_state = PotentialSalesState.objects.get(product=self.product)
+
+        self.product.update_all_potential_sales()
+        full = list(self.product.daily_metrics.order_by('date').values_list('potential_sales', flat=True))
+
+        self.assertEqual(incremental[:4] + incremental[5:], full[:4] + full[5:])
+        self.product.refresh_potential_sales()
+        state = PotentialSalesState.objects.get(product=self.product)
+        self.assertEqual(state.good_stock_sales_sum, incremental_state.good_stock_sales_sum)
+        self.assertEqual(state.good_stock_days, incremental_state.good_stock_days)
+
+    def test_update_all_potential_sales_invalidates_state(self):
+        """Test the per-product full recompute resets the watermark"""
+        self.product.refresh_potential_sales()
+        self.product.update_all_potential_sales(min_stock=3)
+        self.assertIsNone(PotentialSalesState.objects.get(product=self.product).computed_until)
+
+
+class ProductSnapshotTestCase(TestCase):
+    """Test cases for the materialised ProductSnapshot"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="SNAP_001", name="Snapshot Product", is_active=True)
+        self.today = date.today()
+        for days_ago, stock, potential_sales in [(400, 500, 100.0), (10, 90, 4.0), (5, 70, 6.0), (1, 25, None)]:
+            DailyMetrics.objects.create(
+                product=self.product, date=self.today - timedelta(days=days_ago),
+                sales_quantity=1, stock=stock, potential_sales=potential_sales
+            )
+
+    def test_snapshot_maintained_on_save(self):
+        """Test ORM writes keep the snapshot current"""
+        snapshot = ProductSnapshot.objects.get(product=self.product)
+
+        self.assertEqual(snapshot.latest_date, self.today - timedelta(days=1))
+        self.assertEqual(snapshot.latest_stock, 25)
+        self.assertEqual(snapshot.avg_daily_demand, 5.0)
+        self.assertEqual(snapshot.remainder_days, 5)
+        self.assertEqual(snapshot.as_of, self.today)
+
+    def test_snapshot_matches_live_annotation(self):
+        """Test the snapshot-backed annotation equals the live aggregate"""
+        products = Product.objects.filter(pk=self.product.pk)
+        snapshot = annotate_product_queryset(products, order_days_value=30).get()
+        live = annotate_product_queryset(products, order_days_value=30, live=True).get()
+
+        self.assertEqual(snapshot.current_stock, live.current_stock)
+        self.assertEqual(snapshot.avg_daily_demand, live.avg_daily_demand)
+        self.assertEqual(snapshot.remainder_days, int(live.remainder_days))
+        self.assertEqual(snapshot.po_quantity, live.po_quantity)
+
+    def test_snapshot_refreshed_after_potential_sales_recompute(self):
+        """Test set-based recomputes update the snapshot without signals"""
+        self.product.update_all_potential_sales(min_stock=1)
+        self.assertEqual(ProductSnapshot.objects.get(product=self.product).avg_daily_demand, 1.0)
+
+    def test_snapshot_after_delete(self):
+        """Test deleting the latest metric moves the snapshot back a day"""
+        self.product.daily_metrics.get(date=self.today - timedelta(days=1)).delete()
+        snapshot = ProductSnapshot.objects.get(product=self.product)
+        self.assertEqual(snapshot.latest_stock, 70)
+
+    def test_product_delete_removes_snapshot(self):
+        """Test cascading metric deletes do not recreate the snapshot of a deleted product"""
+        product_id = self.product.pk
+        self.product.delete()
+        self.assertFalse(ProductSnapshot.objects.filter(product_id=product_id).exists())
+
+    def test_product_delete_query_count_independent_of_history(self):
+        """Test a product's metrics are deleted in bulk, not fetched and signalled row by row"""
+        query_counts: list = []
+        for code, days in (('DEL_SHORT', 3), ('DEL_LONG', 60)):
+            product = Product.objects.create(code=code, name=code)
+            DailyMetrics.objects.bulk_create([
+                DailyMetrics(product=product, date=self.today - timedelta(days=offset), stock=offset)
+                for offset in range(days)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                product.delete()
+            query_counts.append(len(queries))
+            self.assertFalse(DailyMetrics.objects.filter(product__code=code).exists())
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_queryset_delete_refreshes_once(self):
+        """Test a queryset delete refreshes the derived data of every touched product"""
+        self.product.daily_metrics.filter(date__gte=self.today - timedelta(days=1)).delete()
+        self.assertEqual(ProductSnapshot.objects.get(product=self.product).latest_stock, 70)
+
+    def test_product_without_metrics(self):
+        """Test a product without metrics gets an empty snapshot"""
+        product = Product.objects.create(code="SNAP_002", name="Empty Product")
+        self.assertEqual(refresh_product_snapshots([product.pk]), 1)
+        snapshot = ProductSnapshot.objects.get(product=product)
+        self.assertIsNone(snapshot.latest_stock)
+        self.assertIsNone(snapshot.avg_daily_demand)
+        self.assertIsNone(snapshot.remainder_days)
+
+    def test_refresh_stale_product_snapshots(self):
+        """Test only snapshots with an outdated demand window are refreshed"""
+        self.assertEqual(refresh_stale_product_snapshots([self.product.pk]), 0)
+        ProductSnapshot.objects.filter(product=self.product).update(as_of=self.today - timedelta(days=1), avg_daily_demand=None)
+
+        self.assertEqual(refresh_stale_product_snapshots([self.product.pk]), 1)
+        self.assertEqual(ProductSnapshot.objects.get(product=self.product).avg_daily_demand, 5.0)
+
+
+class LiveMetricsAnnotationTestCase(TestCase):
+    """Test cases for the live DailyMetrics annotation backend"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.today = date.today()
+        self.supplier1 = Supplier.objects.create(company_name="Live Supplier 1")
+        self.supplier2 = Supplier.objects.create(company_name="Live Supplier 2")
+        self.product = Product.objects.create(code="LIVE_001", name="Live Product", is_active=True)
+        self.product.suppliers.add(self.supplier1, self.supplier2)
+        self.empty_product = Product.objects.create(code="LIVE_002", name="No Metrics", is_active=True)
+        for days_ago, stock, potential_sales in [(40, 100, 2.0), (20, 50, 6.0), (2, 12, None)]:
+            DailyMetrics.objects.create(
+                product=self.product, date=self.today - timedelta(days=days_ago),
+                sales_quantity=1, stock=stock, potential_sales=potential_sales
+            )
+
+    def plan_nodes(self, plan: dict, in_subplan: bool = False):
+        """Yield (node, in_subplan) for every node of an EXPLAIN (FORMAT JSON) plan"""
+        in_subplan = in_subplan or plan.get('Parent Relationship') in ('SubPlan', 'InitPlan')
+        yield plan, in_subplan
+        for child in plan.get('Plans', []):
+            yield from self.plan_nodes(child, in_subplan)
+
+    def test_supplier_join_does_not_multiply_demand(self):
+        """Test two matching suppliers do not change the windowed average"""
+        products = filter_product_queryset(
+            Product.objects.all(), supplier_filter=[str(self.supplier1.pk), str(self.supplier2.pk)]
+        )
+        product = annotate_product_queryset(products, order_days_value=10, daily_demand_days=30).get()
+
+        self.assertEqual(product.current_stock, 12)
+        self.assertEqual(product.avg_daily_demand, 6.0)
+        self.assertEqual(product.remainder_days, 2)
+        self.assertEqual(product.po_quantity, 48)
+
+    def test_product_without_metrics(self):
+        """Test products without metrics get empty figures and no PO quantity"""
+        product = annotate_product_queryset(
+            Product.objects.filter(pk=self.empty_product.pk), order_days_value=10, live=True
+        ).get()
+        self.assertIsNone(product.current_stock)
+        self.assertIsNone(product.avg_daily_demand)
+        self.assertIsNone(product.remainder_days)
+        self.assertEqual(product.po_quantity, 0)
+
+    def test_plan_has_no_group_by_over_products(self):
+        """Test the live annotation aggregates only inside the per-product lateral join"""
+        products = annotate_product_queryset(
+            filter_product_queryset(Product.objects.all(), code_filter='LIVE'), order_days_value=10, live=True
+        )
+        self.assertIsNone(products.query.group_by)
+
+        plan = json.loads(products.explain(format='json'))[0]['Plan']
+        self.assertFalse([node for node, _ in self.plan_nodes(plan) if 'Group Key' in node])
+        self.assertEqual([node['Node Type'] for node, _ in self.plan_nodes(plan)].count('Aggregate'), 1)
+        # The aggregate is the inner side of the nested loop over products, run per product
+        loops = [node for node, _ in self.plan_nodes(plan) if node['Node Type'] == 'Nested Loop']
+        self.assertTrue(any(
+            'Aggregate' in [inner['Node Type'] for inner, _ in self.plan_nodes(loop['Plans'][1])] for loop in loops
+        ))
+
+    def test_lookups_run_once_per_product(self):
+        """Test filtering and sorting on the derived figures does not repeat the stock and demand lookups"""
+        products = annotate_product_queryset(
+            Product.objects.filter(code__startswith='LIVE'), order_days_value=10, live=True
+        ).filter(remainder_days__gte=0, po_quantity__gte=0).order_by('-po_quantity')
+        self.assertEqual(list(products.values_list('code', 'remainder_days', 'po_quantity')), [('LIVE_001', 3, 28.0)])
+        # The lateral join is relabeled with the rest of the query when nested
+        self.assertEqual(list(Product.objects.filter(pk__in=products.values('pk')).values_list('code', flat=True)), ['LIVE_001'])
+
+        plan = json.loads(products.explain(format='json'))[0]['Plan']
+        node_types = [node['Node Type'] for node, _ in self.plan_nodes(plan)]
+        # One aggregate for the demand, one subplan for the latest stock
+        self.assertEqual(node_types.count('Aggregate'), 1)
+        self.assertEqual(len([node for node, _ in self.plan_nodes(plan) if node.get('Parent Relationship') in ('SubPlan', 'InitPlan')]), 1)
+
+
+class MetricsRollupsTestCase(TestCase):
+    """Test cases for weekly and monthly DailyMetrics rollups"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="ROLL_001", name="Rollup Product")
+        # Wednesday 2024-01-31 to Tuesday 2024-02-06: crosses a month boundary inside one ISO week
+        self.start = date(2024, 1, 31)
+        for i, stock in enumerate([5, 0, 3, None, 8, 0, 2]):
+            DailyMetrics.objects.create(
+                product=self.product, date=self.start + timedelta(days=i),
+                sales_quantity=i, stock=stock, potential_sales=float(i) + 0.5
+            )
+
+    def test_rollups_maintained_on_save(self):
+        """Test ORM writes keep week and month aggregates current"""
+        january = MonthlyMetrics.objects.get(product=self.product, period_start=date(2024, 1, 1))
+        february = MonthlyMetrics.objects.get(product=self.product, period_start=date(2024, 2, 1))
+        self.assertEqual((january.days, january.sales_quantity_sum, january.last_stock), (1, 0, 5))
+        self.assertEqual(february.days, 6)
+        self.assertEqual(february.sales_quantity_sum, 1 + 2 + 3 + 4 + 5 + 6)
+        self.assertEqual(february.potential_sales_sum, 21 + 3.0)
+        self.assertEqual((february.stock_days, february.stockout_days), (3, 2))
+        self.assertEqual((february.min_stock, february.max_stock, february.last_stock), (0, 8, 2))
+
+        weeks = list(WeeklyMetrics.objects.filter(product=self.product).order_by('period_start'))
+        self.assertEqual([week.period_start for week in weeks], [date(2024, 1, 29), date(2024, 2, 5)])
+        self.assertEqual([week.days for week in weeks], [5, 2])
+        self.assertEqual(weeks[0].last_stock, 8)
+        self.assertEqual(weeks[0].average_potential_sales, (0.5 + 1.5 + 2.5 + 3.5 + 4.5) / 5)
+
+    def test_delete_removes_empty_period(self):
+        """Test deleting the only day of a month removes its rollup"""
+        self.product.daily_metrics.get(date=self.start).delete()
+        self.assertFalse(MonthlyMetrics.objects.filter(product=self.product, period_start=date(2024, 1, 1)).exists())
+        self.assertEqual(WeeklyMetrics.objects.get(product=self.product, period_start=date(2024, 1, 29)).days, 4)
+
+    def test_potential_sales_recompute_updates_rollups(self):
+        """Test full and incremental potential sales recomputes refresh rollup sums"""
+        self.product.update_all_potential_sales(min_stock=1)
+        february = MonthlyMetrics.objects.get(product=self.product, period_start=date(2024, 2, 1))
+        self.assertEqual(february.potential_sales_sum, sum(self.product.daily_metrics.filter(date__month=2).values_list('potential_sales', flat=True)))
+
+        self.product.refresh_potential_sales()
+        DailyMetrics.objects.create(product=self.product, date=date(2024, 2, 7), sales_quantity=4, stock=0, potential_sales=None)
+        self.product.refresh_potential_sales()
+        february = MonthlyMetrics.objects.get(product=self.product, period_start=date(2024, 2, 1))
+        expected = sum(self.product.daily_metrics.filter(date__month=2).values_list('potential_sales', flat=True))
+        self.assertAlmostEqual(february.potential_sales_sum, expected)
+        self.assertEqual(february.potential_sales_days, 7)
+
+    def test_rebuild_matches_incremental(self):
+        """Test a full rebuild reproduces the incrementally maintained rollups"""
+        fields = ('period_start', 'days', 'sales_quantity_sum', 'potential_sales_sum', 'stock_days', 'stockout_days', 'min_stock', 'max_stock', 'last_stock')
+        incremental = list(WeeklyMetrics.objects.filter(product=self.product).order_by('period_start').values_list(*fields))
+        rebuild_metric_rollups([self.product.pk])
+        self.assertEqual(list(WeeklyMetrics.objects.filter(product=self.product).order_by('period_start').values_list(*fields)), incremental)
+
+    def test_average_daily_demand_with_rollups(self):
+        """Test the rollup-backed average equals the daily average"""
+        product = Product.objects.create(code="ROLL_002", name="Long History")
+        today = date.today()
+        for days_ago in range(0, 400, 3):
+            DailyMetrics.objects.create(product=product, date=today - timedelta(days=days_ago), potential_sales=days_ago % 7)
+        self.assertAlmostEqual(
+            product.get_average_daily_demand(use_rollups=True), product.get_average_daily_demand()
+        )
+        self.assertAlmostEqual(
+            product.get_average_daily_demand(days_back=10, use_rollups=True), product.get_average_daily_demand(days_back=10)
+        )
+        self.assertIsNone(self.product.get_average_daily_demand(use_rollups=True))
+
+    def test_get_rollup_metrics(self):
+        """Test rollup periods overlapping the window are returned oldest first"""
+        product = Product.objects.create(code="ROLL_003", name="Recent")
+        DailyMetrics.objects.create(product=product, date=date.today(), sales_quantity=1, stock=1)
+        DailyMetrics.objects.create(product=product, date=date.today() - timedelta(days=100), sales_quantity=1, stock=1)
+
+        self.assertEqual(product.get_rollup_metrics('month', days_back=30).count(), 1)
+        self.assertEqual(product.get_rollup_metrics('week', days_back=365).count(), 2)
+        with self.assertRaises(ValueError):
+            product.get_rollup_metrics('year')
+
+
+class ProductSeriesTestCase(TestCase):
+    """Test cases for the packed per-product time series"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="SERIES_001", name="Series Product")
+        self.start = date(2024, 5, 1)
+        # Day 2 is missing entirely, day 3 has NULL values
+        for offset, sales, stock, potential_sales in [(0, 4, 10, 4.0), (1, -2, 12, 1.5), (3, None, None, None), (4, 1, 0, 2.25)]:
+            DailyMetrics.objects.create(
+                product=self.product, date=self.start + timedelta(days=offset),
+                sales_quantity=sales, stock=stock, potential_sales=potential_sales
+            )
+
+    def test_series_maintained_on_save(self):
+        """Test ORM writes keep a contiguous series with masked gaps"""
+        series = get_product_series(self.product.pk)
+
+        self.assertEqual(series['dates'][0], np.datetime64('2024-05-01'))
+        self.assertEqual(len(series['dates']), 5)
+        self.assertEqual(series['stock'].tolist(), [10, 12, None, None, 0])
+        self.assertEqual(series['sales_quantity'].tolist(), [4, -2, None, None, 1])
+        self.assertEqual(series['potential_sales'].tolist(), [4.0, 1.5, None, None, 2.25])
+        self.assertIsInstance(series['stock'], np.ma.MaskedArray)
+
+    def test_selected_fields_and_start_date(self):
+        """Test only requested fields are read, sliced from start_date"""
+        series = get_product_series(self.product.pk, fields=('stock',), start_date=date(2024, 5, 4))
+        self.assertEqual(set(series), {'dates', 'stock'})
+        self.assertEqual(series['dates'].tolist(), [date(2024, 5, 4), date(2024, 5, 5)])
+        self.assertEqual(series['stock'].tolist(), [None, 0])
+        series = get_product_series(self.product.pk, fields=('stock',), end_date=date(2024, 5, 2))
+        self.assertEqual(series['stock'].tolist(), [10, 12])
+        with self.assertRaises(ValueError):
+            get_product_series(self.product.pk, fields=('price',))
+
+    def test_lttb_keeps_extremes(self):
+        """Test LTTB keeps the end points and a lone spike in increasing order"""
+        values = np.zeros(1000)
+        values[617] = 50
+        indices = lttb_indices(values, 40)
+        self.assertEqual(len(indices), 40)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(617, indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(lttb_indices(values[:5], 40).tolist(), [0, 1, 2, 3, 4])
+
+    def test_downsample_skips_days_without_stock(self):
+        """Test downsampling leaves out days without stock and keeps the full day count"""
+        data = downsample_product_series(self.product.pk, points=3)
+        self.assertEqual(data['dates'], ['2024-05-01', '2024-05-02', '2024-05-05'])
+        self.assertEqual(data['potential_sales'], [4.0, 1.5, 2.25])
+        self.assertEqual(data['total_points'], 5)
+
+    def test_delete_and_missing_series(self):
+        """Test deleting all metrics removes the series"""
+        self.product.daily_metrics.get(date=self.start).delete()
+        self.assertEqual(ProductSeries.objects.get(product=self.product).start_date, date(2024, 5, 2))
+        self.product.daily_metrics.all().delete()
+        self.assertIsNone(get_product_series(self.product.pk))
+
+    def test_recompute_rewrites_potential_sales(self):
+        """Test potential sales recomputes repack the series"""
+        self.product.update_all_potential_sales(min_stock=1)
+        series = get_product_series(self.product.pk, fields=('potential_sales',))
+        self.assertEqual(series['potential_sales'].tolist(), [4.0, -2.0, None, 1.0, 1.0])
+
+    def plant_marker(self, value: int = 777):
+        """Overwrite the stored stock of the first day, so a rewrite of old bytes shows"""
+        stored = ProductSeries.objects.get(product=self.product)
+        stock = np.frombuffer(bytes(stored.stock), dtype='>i4').copy()
+        stock[0] = value
+        ProductSeries.objects.filter(product=self.product).update(stock=stock.tobytes())
+
+    def test_append_only_writes_new_tail(self):
+        """Test appending a day extends the series without rewriting the existing days"""
+        self.plant_marker()
+        DailyMetrics.objects.create(product=self.product, date=date(2024, 5, 7), sales_quantity=2, stock=9)
+
+        series = get_product_series(self.product.pk)
+        self.assertEqual(series['stock'].tolist(), [777, 12, None, None, 0, None, 9])
+        self.assertEqual(series['sales_quantity'].tolist(), [4, -2, None, None, 1, None, 2])
+        self.assertEqual(series['potential_sales'].tolist()[:5], [4.0, 1.5, None, None, 2.25])
+        self.assertEqual(ProductSeries.objects.get(product=self.product).end_date, date(2024, 5, 7))
+
+    def test_changes_inside_and_at_the_end_are_spliced(self):
+        """Test edits repack only their days and deleting the last day shortens the series"""
+        self.plant_marker()
+        metric = self.product.daily_metrics.get(date=date(2024, 5, 2))
+        metric.stock = 20
+        metric.save()
+        DailyMetrics.objects.create(product=self.product, date=date(2024, 5, 3), stock=15)
+        self.assertEqual(get_product_series(self.product.pk, fields=('stock',))['stock'].tolist(), [777, 20, 15, None, 0])
+
+        self.product.daily_metrics.filter(date__gte=date(2024, 5, 4)).delete()
+        series = get_product_series(self.product.pk, fields=('stock',))
+        self.assertEqual(series['stock'].tolist(), [777, 20, 15])
+        self.assertEqual(ProductSeries.objects.get(product=self.product).length, 3)
+
+    def test_earlier_history_rebuilds(self):
+        """Test history added before the first day rebuilds the whole series"""
+        self.plant_marker()
+        DailyMetrics.objects.create(product=self.product, date=date(2024, 4, 30), stock=3)
+        series = get_product_series(self.product.pk, fields=('stock',))
+        self.assertEqual(series['stock'].tolist(), [3, 10, 12, None, None, 0])
+
+    def test_rebuild_product_series_packs_sentinel(self):
+        """Test NULL integers are stored as the missing sentinel"""
+        self.assertEqual(rebuild_product_series([self.product.pk]), 1)
+        stored = ProductSeries.objects.get(product=self.product)
+        stock = np.frombuffer(bytes(stored.stock), dtype='>i4')
+        self.assertEqual(stock[2], MISSING_INT)
+        self.assertEqual(stored.end_date, date(2024, 5, 5))
+
+
+class KeysetPaginationTestCase(TestCase):
+    """Test cases for keyset pagination of the product list"""
+
+    def setUp(self):
+        """Set up test data"""
+        for code in ['B', None, 'A', '', 'D', None, 'C', '', 'E']:
+            Product.objects.create(code=code, name=f"Keyset {code}", is_active=True)
+        self.queryset = Product.objects.filter(is_active=True)
+        self.expected = list(Product.objects.order_by(F('code').asc(nulls_last=True), 'pk').values_list('pk', flat=True))
+
+    def walk_forward(self, per_page: int) -> list:
+        pages: list = []
+        page = keyset_paginate(self.queryset, per_page)
+        pages.append(page)
+        while page.has_next():
+            page = keyset_paginate(self.queryset, per_page, page.next_cursor)
+            pages.append(page)
+        return pages
+
+    def test_forward_walk_covers_all_rows_in_order(self):
+        """Test next cursors visit every product once in (code, id) order, nulls last"""
+        for per_page in (1, 2, 3, 4, 9, 20):
+            pages = self.walk_forward(per_page)
+            self.assertEqual([product.pk for page in pages for product in page], self.expected)
+            self.assertFalse(pages[0].has_previous())
+            self.assertTrue(all(page.has_previous() for page in pages[1:]))
+
+    def test_backward_walk_mirrors_forward(self):
+        """Test previous cursors return the same pages in reverse"""
+        pages = self.walk_forward(2)
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = keyset_paginate(self.queryset, 2, page.previous_cursor)
+            self.assertEqual([product.pk for product in page], [product.pk for product in expected])
+            self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_previous_past_start_returns_full_first_page(self):
+        """Test stepping back over the first rows shows a full first page"""
+        second = keyset_paginate(self.queryset, 4, encode_cursor(AFTER, '', self.expected[0]))
+        page = keyset_paginate(self.queryset, 4, second.previous_cursor)
+        self.assertEqual([product.pk for product in page], self.expected[:4])
+
+    def test_invalid_cursor_gives_first_page(self):
+        """Test tampered tokens fall back to the first page"""
+        for token in ['not-base64!', 'WzEsMiwzXQ', encode_cursor('x', 'A', 1)]:
+            self.assertIsNone(decode_cursor(token))
+            page = keyset_paginate(self.queryset, 3, token)
+            self.assertEqual([product.pk for product in page], self.expected[:3])
+
+    def test_cursor_round_trip(self):
+        """Test cursor tokens are URL safe and decode to their key"""
+        token = encode_cursor(AFTER, 'Ä/+?', 42)
+        self.assertRegex(token, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(decode_cursor(token), (AFTER, 'Ä/+?', 42))
+
+    def test_no_count_or_offset(self):
+        """Test deep pages are read with a bounded seek"""
+        pages = self.walk_forward(3)
+        with CaptureQueriesContext(connection) as queries:
+            keyset_paginate(self.queryset, 3, pages[1].next_cursor)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('COUNT(', sql.upper())
+        self.assertNotIn('OFFSET', sql.upper())
+
+
+class DailyMetricsPartitionsTestCase(TestCase):
+    """Test cases for monthly DailyMetrics partition maintenance"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="PART_001", name="Partitioned Product")
+
+    def partition_of(self, metric: DailyMetrics) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM app_dailymetrics WHERE id = %s', [metric.pk])
+            return cursor.fetchone()[0]
+
+    def test_table_is_partitioned(self):
+        """Test the migration leaves a default partition and partitions for the coming months"""
+        self.assertTrue(is_partitioned())
+        names = [partition['name'] for partition in list_partitions()]
+        self.assertEqual(names[-1], DEFAULT_PARTITION)
+        self.assertIn(partition_name(add_months(date.today().replace(day=1), 3)), names)
+        self.assertEqual(ensure_future_partitions(), [])
+
+    def test_add_months(self):
+        """Test month arithmetic across year boundaries"""
+        self.assertEqual(add_months(date(2024, 11, 1), 3), date(2025, 2, 1))
+        self.assertEqual(add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+
+    def test_create_partition_moves_default_rows(self):
+        """Test rows in the default partition move into a newly created month"""
+        metric = DailyMetrics.objects.create(product=self.product, date=date(2001, 2, 14), sales_quantity=3, stock=7)
+        self.assertEqual(self.partition_of(metric), DEFAULT_PARTITION)
+
+        self.assertEqual(create_monthly_partitions(date(2001, 1, 20), date(2001, 2, 1)), ['app_dailymetrics_p2001_01', 'app_dailymetrics_p2001_02'])
+
+        self.assertEqual(self.partition_of(metric), 'app_dailymetrics_p2001_02')
+        metric.refresh_from_db()
+        self.assertEqual((metric.sales_quantity, metric.stock), (3, 7))
+        self.assertEqual(create_monthly_partitions(date(2001, 1, 1), date(2001, 2, 28)), [])
+
+    def test_split_default_partition(self):
+        """Test default partition rows are spread over monthly partitions"""
+        DailyMetrics.objects.create(product=self.product, date=date(2002, 3, 1))
+        DailyMetrics.objects.create(product=self.product, date=date(2002, 5, 31))
+
+        self.assertEqual(len(split_default_partition()), 3)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {DEFAULT_PARTITION}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_detach_partitions_before(self):
+        """Test retention detaches whole months without deleting rows one by one"""
+        create_monthly_partitions(date(2003, 1, 1), date(2003, 2, 1))
+        DailyMetrics.objects.create(product=self.product, date=date(2003, 1, 10))
+        DailyMetrics.objects.create(product=self.product, date=date(2003, 2, 10))
+
+        self.assertEqual(detach_partitions_before(date(2003, 2, 15)), ['app_dailymetrics_p2003_01'])
+
+        self.assertEqual(list(self.product.daily_metrics.values_list('date', flat=True)), [date(2003, 2, 10)])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM app_dailymetrics_p2003_01')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        # The archive keeps its name, so rows for that month fall back to the default partition
+        self.assertEqual(create_monthly_partitions(date(2003, 1, 1), date(2003, 1, 1)), [])
+
+    def test_detach_rebuilds_derived_data(self):
+        """Test rollups and the series drop the detached months like after a delete"""
+        create_monthly_partitions(date(2003, 1, 1), date(2003, 2, 1))
+        DailyMetrics.objects.create(product=self.product, date=date(2003, 1, 10), stock=4)
+        DailyMetrics.objects.create(product=self.product, date=date(2003, 2, 10), stock=6)
+        self.assertTrue(MonthlyMetrics.objects.filter(product=self.product, period_start=date(2003, 1, 1)).exists())
+
+        detach_partitions_before(date(2003, 2, 15))
+
+        periods = MonthlyMetrics.objects.filter(product=self.product).values_list('period_start', flat=True)
+        self.assertEqual(list(periods), [date(2003, 2, 1)])
+        series = get_product_series(self.product.pk, fields=('stock',))
+        self.assertEqual((series['dates'][0], series['stock'].tolist()), (np.datetime64('2003-02-10'), [6]))
+
+    def test_detach_and_drop(self):
+        """Test dropped partitions are removed from the database"""
+        create_monthly_partitions(date(2004, 6, 1), date(2004, 6, 1))
+        detach_partitions_before(date(2004, 7, 1), drop=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('app_dailymetrics_p2004_06')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+
+class CachedCountTestCase(TestCase):
+    """Test cases for cached product list counts and the data version"""
+
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.supplier = Supplier.objects.create(company_name="Count Supplier")
+        for index in range(5):
+            product = Product.objects.create(code=f"CNT{index}", name=f"Count {index}")
+            product.suppliers.add(self.supplier)
+        self.queryset = Product.objects.filter(suppliers__in=[self.supplier]).distinct().order_by('code', 'pk')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_data_version_moves_on_changes(self):
+        """Test catalog saves, supplier links and metric changes move the data version"""
+        version = get_data_version()
+        product = Product.objects.create(code="CNT_NEW", name="New")
+        self.assertGreater(get_data_version(), version)
+
+        version = get_data_version()
+        product.suppliers.add(self.supplier)
+        self.assertGreater(get_data_version(), version)
+
+        version = get_data_version()
+        DailyMetrics.objects.create(product=product, date=date.today(), stock=1)
+        self.assertGreater(get_data_version(), version)
+        self.assertEqual(bump_data_version(), get_data_version())
+
+    def test_data_version_bump_takes_no_row_lock(self):
+        """Test a bump is a single nextval and moves again when its transaction commits"""
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            version = bump_data_version()
+            self.assertEqual(len(queries), 1)
+            self.assertIn('nextval', queries[0]['sql'])
+            self.assertEqual(get_data_version(), version)
+        self.assertGreater(get_data_version(), version)
+
+    def test_filter_signature_is_normalised(self):
+        """Test equivalent filters share one signature"""
+        self.assertEqual(
+            filter_signature(code=' Abc ', categories=['2', '1']),
+            filter_signature(code='abc', categories=['1', '2'])
+        )
+        self.assertEqual(filter_signature(code=None, suppliers=[]), filter_signature(code='', suppliers=[]))
+        self.assertNotEqual(filter_signature(code='abc'), filter_signature(name='abc'))
+
+    def test_count_is_cached(self):
+        """Test a second paginator with the same key does not count again"""
+        key = product_count_cache_key(filter_signature(suppliers=[self.supplier.pk]))
+        self.assertEqual(CachedCountPaginator(self.queryset, 2, cache_key=key).count, 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(self.queryset, 2, cache_key=key).count, 5)
+
+    def test_data_change_invalidates_count(self):
+        """Test the cache key changes when data changes"""
+        signature = filter_signature(suppliers=[self.supplier.pk])
+        key = product_count_cache_key(signature)
+        CachedCountPaginator(self.queryset, 2, cache_key=key).count
+        Product.objects.create(code="CNT9", name="Count 9").suppliers.add(self.supplier)
+
+        new_key = product_count_cache_key(signature)
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(CachedCountPaginator(self.queryset, 2, cache_key=new_key).count, 6)
+
+    def test_estimate_above_threshold(self):
+        """Test large results use the planner estimate and are flagged"""
+        paginator = CachedCountPaginator(Product.objects.all(), 2, estimate_threshold=0)
+        self.assertEqual(paginator.count, estimate_queryset_count(Product.objects.all()))
+        self.assertTrue(paginator.is_estimate)
+
+        paginator = CachedCountPaginator(self.queryset, 2, estimate_threshold=10 ** 9)
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.is_estimate)
+
+    @override_settings(PRODUCT_LIST_COUNT_ESTIMATE=True, PRODUCT_LIST_COUNT_ESTIMATE_THRESHOLD=0)
+    def test_list_context_shows_estimate(self):
+        """Test the product list context exposes estimated counts"""
+        request = RequestFactory().get('/')
+        request.session = {'items_per_page': 2}
+        context: dict = {}
+        populate_product_list_context(request, context)
+        self.assertTrue(context['paginator'].is_estimate)
+
+
+class PlanningColumnsTestCase(TestCase):
+    """Test cases for filtering and sorting on the planning columns"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.factory = RequestFactory()
+        today = date.today()
+        # code: (stock, daily demand) -> remainder days 50, 10, 2, none
+        for code, stock, demand in [('PLAN_A', 100, 2.0), ('PLAN_B', 50, 5.0), ('PLAN_C', 20, 10.0), ('PLAN_D', 30, None)]:
+            product = Product.objects.create(code=code, name=code, is_active=True)
+            DailyMetrics.objects.create(product=product, date=today - timedelta(days=1), stock=stock, potential_sales=demand)
+        self.products = annotate_product_queryset(filter_product_queryset(Product.objects.all()), order_days_value=30)
+
+    def codes(self, queryset) -> list:
+        return [product.code for product in queryset]
+
+    def test_remainder_days_filter_and_sort(self):
+        """Test "less than 30 days left, ascending" keeps empty values after the bound like the max filter"""
+        products = sort_product_queryset(apply_planning_filters(self.products, {'max_remainder_days': '29'}), 'remainder_days')
+        self.assertEqual(self.codes(products), ['PLAN_C', 'PLAN_B', 'PLAN_D'])
+
+    def test_min_filters(self):
+        """Test min filters on stock, demand and PO quantity"""
+        self.assertEqual(self.codes(apply_planning_filters(self.products, {'min_stock': '50'})), ['PLAN_A', 'PLAN_B'])
+        self.assertEqual(self.codes(apply_planning_filters(self.products, {'min_daily_demand': '4.5'})), ['PLAN_B', 'PLAN_C'])
+        # PO quantity for 30 days: A 0, B 100, C 280, D 0
+        self.assertEqual(self.codes(apply_planning_filters(self.products, {'min_po_quantity': '150'})), ['PLAN_C'])
+
+    def test_invalid_bounds_are_ignored(self):
+        """Test non-numeric bounds do not filter"""
+        self.assertEqual(len(apply_planning_filters(self.products, {'min_stock': 'abc', 'max_po_quantity': ''})), 4)
+
+    def test_descending_sort_puts_empty_values_last(self):
+        """Test descending sorts, unknown sort keys and the id tie-break"""
+        self.assertEqual(self.codes(sort_product_queryset(self.products, '-daily_demand')), ['PLAN_C', 'PLAN_B', 'PLAN_A', 'PLAN_D'])
+        self.assertEqual(self.codes(sort_product_queryset(self.products, '-po_quantity')), ['PLAN_C', 'PLAN_B', 'PLAN_A', 'PLAN_D'])
+        self.assertEqual(self.codes(sort_product_queryset(self.products, 'name')), ['PLAN_A', 'PLAN_B', 'PLAN_C', 'PLAN_D'])
+
+    def test_list_context_uses_session_sort_and_filters(self):
+        """Test the product list applies planning filters and sort from the session"""
+        request = self.factory.get('/')
+        request.session = {'filter_data': QueryDict('min_stock=25'), 'product_sort': '-stock'}
+        context: dict = {}
+        populate_product_list_context(request, context)
+        self.assertEqual(self.codes(context['products']), ['PLAN_A', 'PLAN_B', 'PLAN_D'])
+        self.assertEqual(context['sort'], '-stock')
+        self.assertEqual(context['paginator'].count, 3)
+
+
+class ProductSearchTestCase(TestCase):
+    """Test cases for the search everything box and the trigram indexes"""
+
+    def setUp(self):
+        """Set up test data"""
+        Product.objects.create(code="SRCH_1", model="XB-400", name="Garden hose", is_active=True)
+        Product.objects.create(code="SRCH_2", model="HOSE-12", name="Reel", is_active=True)
+        Product.objects.create(code="HOSE", model=None, name="Hose", is_active=True)
+        Product.objects.create(code="SRCH_4", model="AB-1", name="Bucket", is_active=True)
+
+    def test_search_matches_any_field(self):
+        """Test search matches code, model and name case-insensitively"""
+        codes = set(filter_product_queryset(Product.objects.all(), search_filter=' hose ').values_list('code', flat=True))
+        self.assertEqual(codes, {'SRCH_1', 'SRCH_2', 'HOSE'})
+        self.assertEqual(filter_product_queryset(Product.objects.all(), search_filter='zzz').count(), 0)
+        self.assertEqual(filter_product_queryset(Product.objects.all(), search_filter='  ').count(), 4)
+
+    def test_search_combines_with_filters(self):
+        """Test search narrows the column filters"""
+        products = filter_product_queryset(Product.objects.all(), name_filter='reel', search_filter='hose')
+        self.assertEqual(list(products.values_list('code', flat=True)), ['SRCH_2'])
+
+    def test_search_ranked_by_similarity(self):
+        """Test exact matches rank first when pg_trgm is installed"""
+        if not trigram_available():
+            self.skipTest('pg_trgm is not installed')
+        products = list(filter_product_queryset(Product.objects.all(), search_filter='hose'))
+        self.assertEqual(products[0].code, 'HOSE')
+        self.assertGreaterEqual(products[0].search_rank, products[-1].search_rank)
+
+    def test_trigram_check_runs_once_per_process(self):
+        """Test searches reuse the pg_trgm lookup instead of querying pg_extension each time"""
+        trigram_available()
+        with CaptureQueriesContext(connection) as queries:
+            list(filter_product_queryset(Product.objects.all(), search_filter='hose'))
+            list(filter_product_queryset(Product.objects.all(), search_filter='reel'))
+        self.assertFalse([query for query in queries if 'pg_extension' in query['sql']])
+        self.assertEqual(len(queries), 2)
+
+    def test_trigram_indexes_serve_icontains(self):
+        """Test the code filter can use its trigram index"""
+        if not trigram_available():
+            self.skipTest('pg_trgm is not installed')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = filter_product_queryset(Product.objects.all(), code_filter='srch').explain()
+        self.assertIn('app_product_code_trgm_idx', plan)
+
+
+class ProductFacetsTestCase(TestCase):
+    """Test cases for filter dropdown facets with product counts"""
+
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.tools = Category.objects.create(category_code="FCT1", name="Tools")
+        self.paint = Category.objects.create(category_code="FCT2", name="Paint")
+        self.alpha = Supplier.objects.create(company_name="Alpha")
+        self.beta = Supplier.objects.create(company_name="Beta")
+        hammer = Product.objects.create(code="FCT_1", name="Hammer", category=self.tools, is_active=True)
+        hammer.suppliers.add(self.alpha, self.beta)
+        Product.objects.create(code="FCT_2", name="Saw", category=self.tools, is_active=True).suppliers.add(self.alpha)
+        Product.objects.create(code="FCT_3", name="Brush", category=self.paint, is_active=True)
+        Product.objects.create(code="FCT_4", name="Loose", is_active=True)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_facet_counts(self):
+        """Test options are counted per related object with an empty bucket"""
+        categories = product_facet(Product.objects.all(), 'categories')
+        self.assertEqual(categories['options'], [(self.paint.pk, 'Paint', 1), (self.tools.pk, 'Tools', 2)])
+        self.assertEqual(categories['empty'], 1)
+
+        suppliers = product_facet(Product.objects.all(), 'suppliers')
+        self.assertEqual(suppliers['options'], [(self.alpha.pk, 'Alpha', 2), (self.beta.pk, 'Beta', 1)])
+        self.assertEqual(suppliers['empty'], 2)
+
+    def test_filter_joins_do_not_inflate_counts(self):
+        """Test a multi-supplier filter counts each product once per option"""
+        products = filter_product_queryset(Product.objects.all(), supplier_filter=[str(self.alpha.pk), str(self.beta.pk)])
+        categories = product_facet(products, 'categories')
+        self.assertEqual(categories['options'], [(self.tools.pk, 'Tools', 2)])
+        self.assertEqual(categories['empty'], 0)
+
+    def test_one_query_per_facet_and_cached(self):
+        """Test each facet is a single query and cached facets need none"""
+        with self.assertNumQueries(1):
+            product_facet(Product.objects.all(), 'suppliers')
+        signature = filter_signature(suppliers=[])
+        facets = get_product_facets(Product.objects.all(), signature)
+        with self.assertNumQueries(1):
+            # Only the data version is read
+            self.assertEqual(get_product_facets(Product.objects.all(), signature), facets)
+
+        Product.objects.create(code="FCT_5", name="Roller", category=self.paint)
+        categories = get_product_facets(Product.objects.all(), signature)['categories']
+        self.assertIn((self.paint.pk, 'Paint', 2), categories['options'])
+
+    def test_form_choices_show_counts(self):
+        """Test dropdown choices carry counts and the session keeps no id lists"""
+        form = ProductCategoryFilterForm(facet=product_facet(Product.objects.all(), 'categories'))
+        self.assertEqual(
+            list(form.fields['categories'].choices),
+            [('empty', 'Be kategorijos (1)'), (self.paint.pk, 'Paint (1)'), (self.tools.pk, 'Tools (2)')]
+        )
+        request = RequestFactory().get('/')
+        request.session = {}
+        context: dict = {}
+        populate_product_list_context(request, context)
+        self.assertNotIn('category_ids', request.session)
+        self.assertNotIn('supplier_ids', request.session)
+        self.assertIn('Tools (2)', [label for _, label in context['category_filter_form'].fields['categories'].choices])
+
+
+class ProductExportTestCase(TestCase):
+    """Test cases for the streaming product export helpers"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.category = Category.objects.create(category_code="XLS", name="Export")
+        suppliers = [Supplier.objects.create(company_name=f"Export Supplier {i}") for i in range(2)]
+        for i in range(6):
+            product = Product.objects.create(code=f"XLS_{i}", name=f"Export {i}", category=self.category, is_active=True)
+            product.suppliers.add(*suppliers)
+
+    def test_rows_read_without_per_row_queries(self):
+        """Test rows carry category paths and supplier names without extra queries"""
+        products = product_export_queryset({'filters': {}, 'order_days': 0, 'sort': ''})
+        get_category_tree()
+        with self.assertNumQueries(1):
+            rows = list(product_export_rows(products, chunk_size=2))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0][:5], ['XLS_0', None, 'Export 0', 'Export', 'Export Supplier 0, Export Supplier 1'])
+        self.assertEqual(rows[0][5:], [0, 0, 0, 0])
+
+    def test_csv_and_ndjson_blocks(self):
+        """Test CSV and NDJSON are produced in blocks holding every row"""
+        rows = [[f'CODE_{i}', i] for i in range(4500)]
+        blocks = list(iter_csv(['Code', 'Qty'], rows))
+        self.assertEqual(len(blocks), 3)
+        lines = b''.join(blocks).decode().splitlines()
+        self.assertEqual((lines[0], lines[-1], len(lines)), ('Code,Qty', 'CODE_4499,4499', 4501))
+        lines = b''.join(iter_ndjson(['code', 'qty'], rows[:2] + [['Šaltas', 2]])).decode().splitlines()
+        self.assertEqual(json.loads(lines[-1]), {'code': 'Šaltas', 'qty': 2})
+        self.assertEqual(len(lines), 3)
+
+    def test_write_parquet(self):
+        """Test the Parquet file keeps the export columns and numeric types"""
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+        products = product_export_queryset({'filters': {}, 'order_days': 0, 'sort': ''})
+        file = io.BytesIO()
+        write_parquet(file, product_export_rows(products))
+        file.seek(0)
+        table = pyarrow.parquet.read_table(file)
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.column('code').to_pylist()[0], 'XLS_0')
+        self.assertEqual(str(table.schema.field('current_stock').type), 'int64')
+        self.assertEqual(str(table.schema.field('po_quantity').type), 'double')
+
+    def test_write_excel_sizes_columns_from_sample(self):
+        """Test the workbook holds every row and widths fit the sampled values"""
+        self.assertEqual(sample_column_widths(['Code', 'Name'], [['A', 'Long name']]), [6, 11])
+        rows = ([f'CODE_{i}', 'x' * (i % 7)] for i in range(1200))
+        file = io.BytesIO()
+        write_excel(file, 'Products', ['Code', 'Name'], rows)
+        file.seek(0)
+        ws = openpyxl.load_workbook(file, read_only=False)['Products']
+        self.assertEqual(ws.max_row, 1201)
+        self.assertEqual(ws['A1201'].value, 'CODE_1199')
+        self.assertEqual(ws.column_dimensions['A'].width, len('CODE_499') + 2)
+        self.assertEqual(ws.column_dimensions['B'].width, 8)
+
 
 class PopulateProductListContextTestCase(TestCase):
     """Test cases for populate_product_list_context function"""
@@ -538,6 +1566,25 @@ class PopulateProductListContextTestCase(TestCase):
         self.assertIn('Laptop', product_names)
         self.assertIn('Orphan Product', product_names)
     
+    def test_category_filter_sees_other_process_changes(self):
+        """Test subcategories created by another process are filtered from the next request on"""
+        stale_tree = get_category_tree()
+        bags = Category.objects.create(category_code="CAT_BAGS", name="Laptop Bags", parent=self.category1)
+        Product.objects.create(code="BAG001", name="Laptop Bag", is_active=True, category=bags)
+        # This process still holds the tree it loaded before; the other process's commit moves the version
+        category_helpers._category_tree = stale_tree
+        category_helpers.bump_category_tree_version()
+        expire_category_tree_check()
+        filter_data = QueryDict(f'categories={self.category1.id}')
+        request = self.create_mock_request(session_data={'filter_data': filter_data})
+        context = {}
+
+        populate_product_list_context(request, context)
+
+        self.assertEqual(context['products'].paginator.count, 3)
+        self.assertIn('Laptop Bag', [p.name for p in context['products']])
+        self.assertIn(bags.pk, get_category_tree())
+
     def test_populate_product_list_context_with_empty_category_filter(self):
         """Test context population with 'empty' category filter (no category)"""
         filter_data = QueryDict('categories=empty')
@@ -657,6 +1704,39 @@ class PopulateProductListContextTestCase(TestCase):
         self.assertEqual(context['code_filter_form'].cleaned_data['code'], 'TEST')
         self.assertEqual(context['name_filter_form'].cleaned_data['name'], 'Product')
 
+    def test_populate_product_list_context_single_page_query(self):
+        """Test the page is fetched and annotated by one ordered query when snapshots are current"""
+        refresh_product_snapshots(Product.objects.values_list('pk', flat=True))
+        request = self.create_mock_request(session_data={'items_per_page': 3})
+        context = {}
+
+        with CaptureQueriesContext(connection) as queries:
+            populate_product_list_context(request, context)
+
+        page_queries = [query['sql'] for query in queries.captured_queries if 'LIMIT 3' in query['sql']]
+        self.assertEqual(len(page_queries), 1)
+        self.assertIn('app_productsnapshot', page_queries[0])
+        self.assertFalse(any('INSERT INTO app_productsnapshot' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(
+            [product.code for product in context['products']],
+            ['PROD001', 'PROD002', 'PROD003']
+        )
+        self.assertTrue(all(hasattr(product, 'po_quantity') for product in context['products']))
+
+    def test_populate_product_list_context_refreshes_stale_snapshots(self):
+        """Test outdated snapshots on the page are refreshed without changing the page order"""
+        DailyMetrics.objects.create(product=self.product2, date=date.today(), stock=30, potential_sales=3.0)
+        ProductSnapshot.objects.filter(product=self.product2).update(as_of=date.today() - timedelta(days=1), latest_stock=None)
+        request = self.create_mock_request()
+        context = {}
+
+        populate_product_list_context(request, context)
+
+        products = list(context['products'])
+        self.assertEqual([product.code for product in products], ['PROD001', 'PROD002', 'PROD003', 'PROD004'])
+        self.assertEqual(products[1].current_stock, 30)
+        self.assertEqual(ProductSnapshot.objects.get(product=self.product2).as_of, date.today())
+
 
 class GetRemainderDaysTestCase(TestCase):
     """Test cases for Product.get_remainder_days method"""
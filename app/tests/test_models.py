@@ -5,7 +5,11 @@ from unittest.mock import patch, Mock
 from decimal import Decimal
 import random
 import string
-from app.models import User, Category, Product, Supplier, DailyMetrics
+from app.models import User, Category, CategoryClosure, Product, Supplier, DailyMetrics
+from app.helpers.categories import (
+    bump_category_tree_version, expire_category_tree_check, get_category_tree, get_category_tree_version, get_descendant_ids,
+    rebuild_category_closure
+)
 
 
 class UserModelTest(TestCase):
@@ -162,6 +166,130 @@ class CategoryModelTest(TestCase):
                 )
 
 
+class CategoryClosureTestCase(TestCase):
+    """Test cases for the category closure table"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.root = Category.objects.create(category_code='ROOT', name='Root')
+        self.tools = Category.objects.create(category_code='TOOLS', name='Tools', parent=self.root)
+        self.drills = Category.objects.create(category_code='DRILLS', name='Drills', parent=self.tools)
+        self.bits = Category.objects.create(category_code='BITS', name='Bits', parent=self.drills)
+        self.garden = Category.objects.create(category_code='GARDEN', name='Garden')
+
+    def closure(self) -> set:
+        return set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_descendant_ids_in_one_query(self):
+        """Test a subtree is read with a single query"""
+        with self.assertNumQueries(1):
+            ids = get_descendant_ids([str(self.tools.pk), self.garden.pk])
+        self.assertEqual(set(ids), {self.tools.pk, self.drills.pk, self.bits.pk, self.garden.pk})
+        self.assertEqual(set(get_descendant_ids([self.tools.pk], include_self=False)), {self.drills.pk, self.bits.pk})
+        self.assertEqual(get_descendant_ids([]), [])
+
+    def test_move_subtree_updates_paths_and_levels(self):
+        """Test moving a category re-links and re-levels its whole subtree"""
+        self.drills.parent = self.garden
+        self.drills.save()
+
+        self.assertEqual(self.drills.level, 1)
+        self.assertEqual(Category.objects.get(pk=self.bits.pk).level, 2)
+        self.assertEqual(set(get_descendant_ids([self.tools.pk])), {self.tools.pk})
+        self.assertEqual(set(get_descendant_ids([self.garden.pk])), {self.garden.pk, self.drills.pk, self.bits.pk})
+
+        maintained = self.closure()
+        rebuild_category_closure()
+        self.assertEqual(self.closure(), maintained)
+
+    def test_move_to_root(self):
+        """Test a subtree moved to the top level starts at level 0"""
+        self.tools.parent = None
+        self.tools.save()
+        levels = dict(Category.objects.filter(pk__in=[self.tools.pk, self.drills.pk, self.bits.pk]).values_list('pk', 'level'))
+        self.assertEqual(levels, {self.tools.pk: 0, self.drills.pk: 1, self.bits.pk: 2})
+        self.assertNotIn(self.bits, self.root.get_descendants())
+
+    def test_cycle_is_rejected(self):
+        """Test a category cannot move under its own subtree"""
+        self.tools.parent = self.bits
+        with self.assertRaises(ValueError):
+            self.tools.save()
+        self.assertEqual(Category.objects.get(pk=self.tools.pk).parent_id, self.root.pk)
+
+    def test_delete_removes_closure_rows(self):
+        """Test deleting a category cascades to its subtree and closure rows"""
+        self.drills.delete()
+        self.assertFalse(CategoryClosure.objects.filter(descendant_id=self.bits.pk).exists())
+        self.assertEqual(set(get_descendant_ids([self.root.pk])), {self.root.pk, self.tools.pk})
+
+
+class CategoryTreeTestCase(TestCase):
+    """Test cases for the in-memory category tree"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.root = Category.objects.create(category_code='TREE_ROOT', name='Home')
+        self.kitchen = Category.objects.create(category_code='TREE_KITCHEN', name='Kitchen', parent=self.root)
+        self.knives = Category.objects.create(category_code='TREE_KNIVES', name='Knives', parent=self.kitchen)
+
+    def test_paths_without_queries(self):
+        """Test paths come from memory once the tree is loaded"""
+        get_category_tree()
+        knives = Category.objects.get(pk=self.knives.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(knives), 'Home > Kitchen > Knives')
+            self.assertEqual(get_category_tree().descendant_ids([self.root.pk]), {self.root.pk, self.kitchen.pk, self.knives.pk})
+            self.assertEqual(get_category_tree().descendant_ids([str(self.kitchen.pk)], include_self=False), {self.knives.pk})
+
+    def test_rename_reloads_tree(self):
+        """Test saving a category refreshes the paths of its subtree"""
+        self.assertEqual(self.knives.get_path(), 'Home > Kitchen > Knives')
+        self.kitchen.name = 'Cooking'
+        self.kitchen.save()
+        self.assertEqual(self.knives.get_path(), 'Home > Cooking > Knives')
+
+    def test_version_reloads_tree(self):
+        """Test a moved version sequence (a change in another process) reloads the tree at the next request"""
+        tree = get_category_tree()
+        bump_category_tree_version()
+        self.assertIs(get_category_tree(), tree)
+        expire_category_tree_check()
+        self.assertIsNot(get_category_tree(), tree)
+
+    def test_requests_check_version(self):
+        """Test each request compares the tree with the shared version"""
+        tree = get_category_tree()
+        bump_category_tree_version()
+        self.client.get('/', HTTP_HOST='localhost')
+        self.assertIsNot(get_category_tree(), tree)
+
+    def test_version_checked_once_per_request(self):
+        """Test the shared version is read once per request and the tree kept when it has not moved"""
+        tree = get_category_tree()
+        expire_category_tree_check()
+        with self.assertNumQueries(1):
+            self.assertIs(get_category_tree(), tree)
+            self.assertIs(get_category_tree(), tree)
+
+    def test_committed_change_moves_version(self):
+        """Test category saves move the shared version once they commit"""
+        version = get_category_tree_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(category_code='TREE_FORKS', name='Forks', parent=self.kitchen)
+        self.assertGreater(get_category_tree_version(), version)
+
+    def test_delete_reloads_tree(self):
+        """Test deleted categories leave the tree"""
+        self.kitchen.delete()
+        self.assertNotIn(self.knives.pk, get_category_tree())
+        self.assertEqual(get_category_tree().descendant_ids([self.root.pk]), {self.root.pk})
+
+    def test_unsaved_category_path(self):
+        """Test unsaved categories still build their path from the parent"""
+        self.assertEqual(Category(name='Forks', parent=self.kitchen).get_path(), 'Home > Kitchen > Forks')
+
+
 class SupplierModelTest(TestCase):
     """Test cases for Supplier model"""
     
@@ -0,0 +1,378 @@
+import io
+import json
+import tempfile
+import openpyxl
+from datetime import date, timedelta
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from app.models import User, Product, DailyMetrics, Supplier, ExportJob, ProductSnapshot
+from app.helpers.export_jobs import claim_export_job, run_export_job
+
+
+class ProductDetailsModalTestCase(TestCase):
+    """Test cases for the product details modal"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="MODAL_001", name="Modal Product", is_active=True)
+        for offset, stock in enumerate([5, 4, 3]):
+            DailyMetrics.objects.create(product=self.product, date=date(2024, 1, 1) + timedelta(days=offset), stock=stock)
+
+    def test_modal_defers_series(self):
+        """Test the modal only reads the product and points its chart at the series endpoint"""
+        # data version lookup for the ETag and the product
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product_details_modal', args=[self.product.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f"{reverse('product_series', args=[self.product.pk])}?points=200")
+        response = self.client.get(reverse('product_details_modal', args=[999999]))
+        self.assertNotContains(response, 'sparkline-data')
+
+    def test_series_endpoint(self):
+        """Test the series endpoint returns the date range downsampled from one series row"""
+        url = reverse('product_series', args=[self.product.pk])
+        # data version lookup for the ETag and the series row
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(data['dates'], ['2024-01-01', '2024-01-02', '2024-01-03'])
+        self.assertEqual((data['stock'], data['sales_quantity'], data['total_points']), ([5, 4, 3], [0, 0, 0], 3))
+
+        data = self.client.get(url, {'start': '2024-01-02', 'end': '2024-01-02'}).json()
+        self.assertEqual((data['dates'], data['stock']), (['2024-01-02'], [4]))
+        self.assertEqual(self.client.get(url, {'points': 'many'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2024-02-30'}).status_code, 400)
+
+    def test_series_without_history(self):
+        """Test a product without metrics or an unknown product gets empty series"""
+        product = Product.objects.create(code="MODAL_002", name="Empty")
+        self.assertEqual(self.client.get(reverse('product_series', args=[product.pk])).json()['stock'], [])
+        self.assertEqual(self.client.get(reverse('product_series', args=[999999])).json()['dates'], [])
+
+
+@override_settings(PRODUCT_LIST_PAGINATION='keyset')
+class KeysetProductListTestCase(TestCase):
+    """Test cases for the product list in keyset pagination mode"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.client.get(reverse('product_list'))
+        session = self.client.session
+        session['items_per_page'] = 2
+        session.save()
+        for i in range(5):
+            Product.objects.create(code=f"KS_{i}", name=f"Keyset {i}", is_active=True)
+
+    def codes(self, response) -> list:
+        return [product.code for product in response.context['products']]
+
+    def test_next_and_previous_cursors(self):
+        """Test the list pages forward and back with cursor tokens"""
+        first = self.client.get(reverse('product_list'))
+        self.assertEqual(self.codes(first), ['KS_0', 'KS_1'])
+        self.assertIsNone(first.context['paginator'])
+        self.assertContains(first, 'Next')
+
+        second = self.client.get(reverse('product_list'), {'cursor': first.context['products'].next_cursor})
+        self.assertEqual(self.codes(second), ['KS_2', 'KS_3'])
+
+        back = self.client.get(reverse('product_list'), {'cursor': second.context['products'].previous_cursor})
+        self.assertEqual(self.codes(back), ['KS_0', 'KS_1'])
+
+
+class ProductSortTestCase(TestCase):
+    """Test cases for sorting the product list by planning columns"""
+
+    def setUp(self):
+        """Set up test data"""
+        for code, stock in [('SORT_A', 5), ('SORT_B', 9), ('SORT_C', 1)]:
+            product = Product.objects.create(code=code, name=code, is_active=True)
+            DailyMetrics.objects.create(product=product, date=date.today(), stock=stock)
+
+    def codes(self, response) -> list:
+        return [product.code for product in response.context['products']]
+
+    def test_sort_cycles_ascending_descending_off(self):
+        """Test repeated clicks on a column toggle its sort"""
+        url = reverse('get_product_sort')
+        self.assertEqual(self.codes(self.client.post(url, {'sort': 'stock'})), ['SORT_C', 'SORT_A', 'SORT_B'])
+        self.assertEqual(self.codes(self.client.post(url, {'sort': 'stock'})), ['SORT_B', 'SORT_A', 'SORT_C'])
+        response = self.client.post(url, {'sort': 'stock'})
+        self.assertEqual(self.codes(response), ['SORT_A', 'SORT_B', 'SORT_C'])
+        self.assertEqual(response.context['sort'], '')
+
+    def test_unknown_sort_resets_order(self):
+        """Test unknown columns clear the sort"""
+        self.client.post(reverse('get_product_sort'), {'sort': 'stock'})
+        response = self.client.post(reverse('get_product_sort'), {'sort': 'name; DROP TABLE'})
+        self.assertEqual(self.client.session['product_sort'], '')
+        self.assertEqual(self.codes(response), ['SORT_A', 'SORT_B', 'SORT_C'])
+
+
+class FilterTypeaheadTestCase(TestCase):
+    """Test cases for the category and supplier typeahead endpoints"""
+
+    def setUp(self):
+        """Set up test data"""
+        for name in ['Baltic Tools', 'Tools Baltic', 'Nordic 100%', 'Nordic Paint', 'Acme']:
+            Supplier.objects.create(company_name=name)
+        self.product = Product.objects.create(code="TA_1", name="Typeahead", is_active=True)
+        self.product.suppliers.add(Supplier.objects.get(company_name='Acme'))
+
+    def texts(self, response) -> list:
+        return [result['text'] for result in response.json()['results']]
+
+    def test_prefix_then_substring_matches(self):
+        """Test short queries match prefixes and longer ones rank prefixes before substrings"""
+        url = reverse('filter_typeahead', args=['suppliers'])
+        self.assertEqual(self.texts(self.client.get(url, {'q': 'no'})), ['Nordic 100%', 'Nordic Paint'])
+        self.assertEqual(self.texts(self.client.get(url, {'q': 'baltic'})), ['Baltic Tools', 'Tools Baltic'])
+        self.assertEqual(self.texts(self.client.get(url, {'q': '100%'})), ['Nordic 100%'])
+        self.assertEqual(self.texts(self.client.get(url, {'q': '%'})), [])
+
+    def test_pages(self):
+        """Test results are paged with a more flag"""
+        url = reverse('filter_typeahead', args=['suppliers'])
+        first = self.client.get(url, {'page': 1, 'page_size': 2}).json()
+        self.assertEqual([result['text'] for result in first['results']], ['Acme', 'Baltic Tools'])
+        self.assertTrue(first['more'])
+        last = self.client.get(url, {'page': 3, 'page_size': 2}).json()
+        self.assertEqual([result['text'] for result in last['results']], ['Tools Baltic'])
+        self.assertFalse(last['more'])
+
+    def test_unknown_source(self):
+        """Test unknown sources are not found"""
+        self.assertEqual(self.client.get(reverse('filter_typeahead', args=['products'])).status_code, 404)
+
+    @override_settings(PRODUCT_FILTER_TYPEAHEAD_THRESHOLD=0)
+    def test_lazy_dropdown_renders_selected_only(self):
+        """Test lazy dropdowns render the selected options and point to the endpoint"""
+        paint = Supplier.objects.get(company_name='Nordic Paint')
+        baltic = Supplier.objects.get(company_name='Baltic Tools')
+        Product.objects.create(code="TA_2", name="Paint", is_active=True).suppliers.add(paint)
+        response = self.client.post(reverse('get_product_filter'), {'suppliers': [paint.pk, baltic.pk]})
+        choices = list(response.context['supplier_filter_form'].fields['suppliers'].choices)
+        # Baltic Tools has no products under the filter, its label is looked up
+        self.assertEqual(choices, [(paint.pk, 'Nordic Paint (1)'), (baltic.pk, 'Baltic Tools')])
+        self.assertContains(response, f'data-source="{reverse("filter_typeahead", args=["suppliers"])}"')
+        self.assertNotContains(response, 'Acme')
+
+
+class ProductListFragmentTestCase(TestCase):
+    """Test cases for HTMX fragment responses of the product list"""
+
+    HTMX_HEADERS: dict = {'HX-Request': 'true', 'HX-Target': 'product-rows'}
+
+    def setUp(self):
+        """Set up test data"""
+        for i in range(3):
+            product = Product.objects.create(code=f"FRAG_{i}", name=f"Fragment {i}", is_active=True)
+            DailyMetrics.objects.create(product=product, date=date.today(), stock=i, potential_sales=1)
+
+    def test_order_days_renders_rows_only(self):
+        """Test order days changes skip the filter row and its facets"""
+        url = reverse('get_order_days')
+        full = self.client.post(url, {'order_days': 5})
+        response = self.client.post(url, {'order_days': 5}, headers=self.HTMX_HEADERS)
+
+        self.assertTemplateUsed(response, 'lists/product_list_fragment.html')
+        self.assertTemplateNotUsed(response, 'filters/product_filter.html')
+        self.assertIsNone(response.context['category_filter_form'])
+        self.assertContains(response, 'id="product-rows"')
+        self.assertContains(response, 'id="product-pagination" hx-swap-oob="true"')
+        self.assertContains(response, 'id="order-days" hx-swap-oob="true"')
+        self.assertContains(response, 'FRAG_2')
+        self.assertLess(len(response.content), len(full.content) / 2)
+
+    def test_filter_swaps_filter_cells(self):
+        """Test filter changes swap the dropdowns and planning filters out of band, not the text inputs"""
+        response = self.client.post(reverse('get_product_filter'), {'code': 'FRAG_1'}, headers=self.HTMX_HEADERS)
+        self.assertEqual([product.code for product in response.context['products']], ['FRAG_1'])
+        self.assertContains(response, 'hx-swap-oob="innerHTML:#category-filter"')
+        self.assertContains(response, 'hx-swap-oob="innerHTML:#stock-filter"')
+        self.assertNotContains(response, 'name="code"')
+        self.assertNotContains(response, 'id="order-days"')
+
+    def test_items_per_page_fragment(self):
+        """Test page size changes re-render the rows and pagination"""
+        response = self.client.post(reverse('get_items_per_page'), {'items_per_page': 10}, headers=self.HTMX_HEADERS)
+        self.assertTemplateUsed(response, 'partials/pagination.html')
+        self.assertNotContains(response, 'id="order-days"')
+        self.assertNotContains(response, 'hx-swap-oob="innerHTML')
+
+    def test_other_targets_get_full_list(self):
+        """Test requests not aimed at the rows still get the whole list"""
+        response = self.client.post(reverse('get_order_days'), {'order_days': 5}, headers={'HX-Request': 'true'})
+        self.assertTemplateUsed(response, 'lists/product_list.html')
+
+
+class ExcelExportViewTestCase(TestCase):
+    """Test cases for the product list Excel download"""
+
+    def setUp(self):
+        """Set up test data"""
+        for i in range(3):
+            product = Product.objects.create(code=f"EXP_{i}", name=f"Export {i}", is_active=True)
+            DailyMetrics.objects.create(product=product, date=date.today(), stock=i + 1)
+
+    def test_export_streams_filtered_rows(self):
+        """Test the download is streamed and follows the session filters"""
+        self.client.post(reverse('get_product_filter'), {'code': 'EXP_'})
+        self.client.post(reverse('get_product_sort'), {'sort': 'stock'})
+        self.client.post(reverse('get_product_sort'), {'sort': 'stock'})
+        response = self.client.get(reverse('export_product_list_to_excel'))
+
+        self.assertTrue(response.streaming)
+        self.assertIn('products.xlsx', response['Content-Disposition'])
+        ws = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual([row[0] for row in ws.iter_rows(min_row=2, values_only=True)], ['EXP_2', 'EXP_1', 'EXP_0'])
+        self.assertEqual(ws['F2'].value, 3)
+
+    def test_alternate_formats(self):
+        """Test CSV and NDJSON are streamed, Parquet served from a file and unknown formats 404"""
+        self.client.post(reverse('get_product_filter'), {'code': 'EXP_'})
+        response = self.client.get(reverse('export_product_list', args=['csv']))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['Code', 'Model', 'Name'])
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['EXP_0', 'EXP_1', 'EXP_2'])
+
+        response = self.client.get(reverse('export_product_list', args=['ndjson']))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual((rows[2]['code'], rows[2]['current_stock']), ('EXP_2', 3))
+
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+        response = self.client.get(reverse('export_product_list', args=['parquet']))
+        self.assertIn('products.parquet', response['Content-Disposition'])
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('code').to_pylist(), ['EXP_0', 'EXP_1', 'EXP_2'])
+
+        self.assertEqual(self.client.get(reverse('export_product_list', args=['pdf'])).status_code, 404)
+
+    def test_only_background_exports_refresh_snapshots(self):
+        """Test the download reads stored snapshots and the export worker refreshes stale ones"""
+        yesterday = date.today() - timedelta(days=1)
+        ProductSnapshot.objects.update(as_of=yesterday)
+        response = self.client.get(reverse('export_product_list', args=['csv']))
+        b''.join(response.streaming_content)
+        self.assertFalse(ProductSnapshot.objects.exclude(as_of=yesterday).exists())
+
+        with tempfile.TemporaryDirectory() as media_dir, override_settings(MEDIA_ROOT=media_dir):
+            self.client.post(reverse('start_export_job'), {'export_format': 'csv'})
+            run_export_job(claim_export_job())
+        self.assertFalse(ProductSnapshot.objects.filter(as_of=yesterday).exists())
+
+
+class ExportJobViewTestCase(TestCase):
+    """Test cases for starting, polling and downloading background exports"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.settings_override.enable()
+        for i in range(2):
+            Product.objects.create(code=f"BGX_{i}", name=f"Background {i}", is_active=True)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_dir.cleanup()
+
+    def test_start_poll_and_download(self):
+        """Test a job snapshots the session filters, polls until done and serves its file"""
+        self.client.post(reverse('get_product_filter'), {'code': 'BGX_1'})
+        response = self.client.post(reverse('start_export_job'))
+        job = ExportJob.objects.get()
+        self.assertEqual(job.params['filters']['code'], 'BGX_1')
+        self.assertContains(response, 'hx-trigger="every 2s"')
+        self.assertEqual(self.client.get(reverse('download_export_job', args=[job.pk])).status_code, 404)
+
+        run_export_job(claim_export_job())
+        response = self.client.get(reverse('export_job_status', args=[job.pk]))
+        self.assertNotContains(response, 'hx-trigger')
+        self.assertContains(response, reverse('download_export_job', args=[job.pk]))
+
+        download = self.client.get(reverse('download_export_job', args=[job.pk]))
+        ws = openpyxl.load_workbook(io.BytesIO(b''.join(download.streaming_content))).active
+        self.assertEqual(ws['A2'].value, 'BGX_1')
+
+    def test_job_format(self):
+        """Test a job is written and downloaded in the requested format"""
+        self.client.post(reverse('start_export_job'), {'export_format': 'csv'})
+        job = run_export_job(claim_export_job())
+        self.assertEqual(job.format, 'csv')
+        self.assertTrue(job.file.name.endswith('.csv'))
+        download = self.client.get(reverse('download_export_job', args=[job.pk]))
+        self.assertIn('products.csv', download['Content-Disposition'])
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines], ['Code', 'BGX_0', 'BGX_1'])
+
+    def test_other_sessions_jobs_are_hidden(self):
+        """Test jobs started from another session cannot be polled or downloaded"""
+        job = ExportJob.objects.create(params={})
+        self.assertEqual(self.client.get(reverse('export_job_status', args=[job.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('download_export_job', args=[job.pk])).status_code, 404)
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test cases for data version ETags and 304 responses"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = Product.objects.create(code="ETAG_001", name="Etag Product", is_active=True)
+        DailyMetrics.objects.create(product=self.product, date=date.today(), stock=4)
+
+    def test_list_revalidates_until_state_changes(self):
+        """Test the list answers 304 until the data or the session list state changes"""
+        url = reverse('product_list')
+        self.client.get(url)
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'page': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.post(reverse('get_product_sort'), {'sort': 'stock'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_modal_and_series_not_modified(self):
+        """Test repeated modal opens and chart loads cost a single version lookup"""
+        for offset, url in enumerate([
+            reverse('product_details_modal', args=[self.product.pk]),
+            reverse('product_series', args=[self.product.pk]),
+        ], start=1):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+            )
+            DailyMetrics.objects.create(product=self.product, date=date.today() - timedelta(days=offset), stock=5)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_export_not_modified(self):
+        """Test an unchanged export is not streamed again"""
+        url = reverse('export_product_list', args=['csv'])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_admin_bulk_actions_move_data_version(self):
+        """Test the admin activate / deactivate actions invalidate cached list responses"""
+        url = reverse('product_list')
+        etag = self.client.get(url)['ETag']
+        admin = User.objects.create_superuser(username='etag_admin', password='admin123')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:app_product_changelist'), {
+            'action': 'set_products_inactive', '_selected_action': [self.product.pk]
+        })
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.is_active)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
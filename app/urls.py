@@ -1,7 +1,10 @@
 from django.urls import include, path
 from rest_framework import routers
 from app.views.static_views import homepage
-from app.views.product_views import product_list, get_items_per_page, get_product_filter, get_order_days, export_product_list_to_excel, product_details_modal
+from app.views.product_views import (
+    product_list, get_items_per_page, get_product_filter, get_product_sort, get_order_days, filter_typeahead,
+    export_product_list, export_product_list_to_excel, product_details_modal, product_series, start_export_job, export_job_status, download_export_job
+)
 
 router = routers.DefaultRouter()
 
@@ -11,8 +14,15 @@ urlpatterns = [
     path('get-items-per-page/', get_items_per_page, name='get_items_per_page'),
     path('get-order-days/', get_order_days, name='get_order_days'),  # Assuming this is the correct view for order days
     path('get-product-filter/', get_product_filter, name='get_product_filter'),
+    path('get-product-sort/', get_product_sort, name='get_product_sort'),
+    path('filter-typeahead/<str:source>/', filter_typeahead, name='filter_typeahead'),
     path('export-product-list-to-excel/', export_product_list_to_excel, name='export_product_list_to_excel'),  # Assuming this is the correct view for exporting
+    path('export-product-list/<str:export_format>/', export_product_list, name='export_product_list'),
+    path('export-jobs/', start_export_job, name='start_export_job'),
+    path('export-jobs/<int:job_id>/', export_job_status, name='export_job_status'),
+    path('export-jobs/<int:job_id>/download/', download_export_job, name='download_export_job'),
     path('product-details-modal/<int:product_id>/', product_details_modal, name='product_details_modal'),
+    path('product-series/<int:product_id>/', product_series, name='product_series'),
 ]
 
 urlpatterns.append(path('api/', include(router.urls)))
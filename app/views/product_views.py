@@ -1,15 +1,40 @@
-import json
-from django.http import HttpResponse, QueryDict
+from datetime import date
+from typing import Optional
+from django.http import FileResponse, Http404, JsonResponse
 from django.db.models import QuerySet
 from django.views.decorators.csrf import csrf_protect
-from django.views.decorators.http import require_POST
-from django.shortcuts import render
-import openpyxl
-from app.helpers.context import populate_product_list_context, filter_product_queryset, annotate_product_queryset
-from app.helpers.utils import queryset_to_excel, product_row
-from app.models import Product
+from django.views.decorators.http import require_GET, require_POST
+from django.shortcuts import get_object_or_404, render
+from django.utils.dateparse import parse_date
+from app.helpers.context import PLANNING_COLUMNS, populate_product_list_context
+from app.helpers.conditional import conditional_on_data_version, data_version_last_modified, product_list_etag
+from app.helpers.exports import (
+    EXPORT_FORMATS, export_params_from_session, product_export_queryset, product_export_response, product_export_rows
+)
+from app.helpers.series import downsample_product_series
+from app.helpers.typeahead import TYPEAHEAD_SOURCES, typeahead_page
+from app.helpers.export_jobs import create_export_job
+from app.models import Product, ExportJob
+
+# Days drawn by the product modal's stock chart, enough for its width at any history length
+PRODUCT_MODAL_SERIES_POINTS: int = 200
+
+def is_rows_request(request) -> bool:
+    """HTMX requests aimed at the table body are answered with a fragment instead of the whole list"""
+    return request.headers.get('HX-Request') == 'true' and request.headers.get('HX-Target') == 'product-rows'
+
+def render_product_rows(request, context: dict, swap_filters: bool = False, swap_order_days: bool = False):
+    """
+    render the table rows with out-of-band pagination, plus the filter cells or the
+    order days input when they changed
+    """
+    populate_product_list_context(request, context, include_facets=swap_filters)
+    context['swap_filters'] = swap_filters
+    context['swap_order_days'] = swap_order_days
+    return render(request, 'lists/product_list_fragment.html', context=context)
 
 @csrf_protect
+@conditional_on_data_version(product_list_etag)
 def product_list(request):
     context = {}
     populate_product_list_context(request, context)
@@ -24,6 +49,8 @@ def get_items_per_page(request):
     context: dict = {}
     items_per_page: str = request.POST.get('items_per_page', '20')
     request.session['items_per_page'] = int(items_per_page)
+    if is_rows_request(request):
+        return render_product_rows(request, context)
     populate_product_list_context(request, context)
     return render(request, 'lists/product_list.html', context=context)
 
@@ -35,6 +62,8 @@ def get_order_days(request):
     """
     context: dict = {}
     request.session['order_days_data'] = request.POST
+    if is_rows_request(request):
+        return render_product_rows(request, context, swap_order_days=True)
     populate_product_list_context(request, context)
     return render(request, 'lists/product_list.html', context=context)
 
@@ -53,55 +82,119 @@ def get_product_filter(request):
         else:
             filter_data[key] = request.POST.get(key)
     request.session['filter_data'] = filter_data
+    if is_rows_request(request):
+        return render_product_rows(request, context, swap_filters=True)
+    populate_product_list_context(request, context)
+    return render(request, 'lists/product_list.html', context=context)
+
+@csrf_protect
+@require_POST
+def get_product_sort(request):
+    """
+    get product sort: a column sorts ascending, then descending, then not at all
+    """
+    context: dict = {}
+    sort: str = request.POST.get('sort', '')
+    current_sort: str = request.session.get('product_sort', '')
+    if sort not in PLANNING_COLUMNS:
+        sort = ''
+    elif current_sort == sort:
+        sort = f'-{sort}'
+    elif current_sort == f'-{sort}':
+        sort = ''
+    request.session['product_sort'] = sort
     populate_product_list_context(request, context)
     return render(request, 'lists/product_list.html', context=context)
 
+@require_GET
+def filter_typeahead(request, source: str):
+    """
+    get a page of category or supplier options matching the typed text
+    """
+    if source not in TYPEAHEAD_SOURCES:
+        raise Http404
+    try:
+        page: int = int(request.GET.get('page', 1))
+        page_size: int = int(request.GET.get('page_size', 20))
+    except ValueError:
+        page, page_size = 1, 20
+    return JsonResponse(typeahead_page(source, request.GET.get('q', ''), page, page_size))
+
+@conditional_on_data_version(last_modified_func=data_version_last_modified)
 def product_details_modal(request, product_id: int):
     """
-    get product details
+    get product details, the stock chart loads its data from product_series
     """
     context: dict = {}
-    product: Product = Product.objects.filter(id=product_id).first()
-    context['product'] = product
-    if product:
-        daily_metrics = product.daily_metrics.order_by('date')
-        dates: list = [str(metric.date) for metric in daily_metrics]
-        stocks: list = [metric.stock for metric in daily_metrics]
-        context['dates'] = json.dumps(dates)
-        context['stocks'] = json.dumps(stocks)
-    else:
-        context['dates'] = json.dumps([])
-        context['stocks'] = json.dumps([])
+    context['product'] = Product.objects.filter(id=product_id).first()
+    context['series_points'] = PRODUCT_MODAL_SERIES_POINTS
     return render(request, 'modals/product_modal_content.html', context=context)
 
+@require_GET
+@conditional_on_data_version(last_modified_func=data_version_last_modified)
+def product_series(request, product_id: int):
+    """
+    get a product's daily stock, sales and potential sales between start and end
+    (ISO dates, default: the whole history) downsampled to at most `points` days
+    """
+    try:
+        points: int = int(request.GET.get('points', PRODUCT_MODAL_SERIES_POINTS))
+        start_date: Optional[date] = parse_date(request.GET.get('start', ''))
+        end_date: Optional[date] = parse_date(request.GET.get('end', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid points or dates.'}, status=400)
+    return JsonResponse(downsample_product_series(product_id, max(points, 3), start_date, end_date))
+
+@conditional_on_data_version(product_list_etag)
+def export_product_list(request, export_format: str):
+    """
+    export the product list as shown (filters, order days and sort) within the request
+    as xlsx, csv, ndjson or parquet
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise Http404
+    products: QuerySet = product_export_queryset(export_params_from_session(request.session))
+    return product_export_response(export_format, product_export_rows(products))
+
 def export_product_list_to_excel(request):
-    filter_data: QueryDict = request.session.get('filter_data', QueryDict())
-    order_days_data: QueryDict = request.session.get('order_days_data', QueryDict())
-    code_filter: str = filter_data.get('code', '')
-    model_filter: str = filter_data.get('model', '')
-    name_filter: str = filter_data.get('name', '')
-    category_filter: list = filter_data.getlist('categories') if hasattr(filter_data, 'getlist') else filter_data.get('categories', [])
-    supplier_filter: list = filter_data.getlist('suppliers') if hasattr(filter_data, 'getlist') else filter_data.get('suppliers', [])
-    order_days_value = order_days_data.get('order_days', '') or 0
-
-    products: QuerySet = filter_product_queryset(
-        product_queryset=Product.objects.filter(is_active=True).order_by('code'),
-        code_filter=code_filter,
-        model_filter=model_filter,
-        name_filter=name_filter,
-        category_filter=category_filter,
-        supplier_filter=supplier_filter
-    )
-    products = annotate_product_queryset(
-        product_queryset=products,
-        order_days_value=order_days_value
-    )
-
-    headers: list = [
-        'Code', 'Model', 'Name', 'Category', 'Suppliers', 'Current stock', 'Daily Demand', 'Days Left', 'PO Qty'
-    ]
-    wb: openpyxl.Workbook = queryset_to_excel('Products', headers, products, row_func=product_row)
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=products.xlsx'
-    wb.save(response)
-    return response
\ No newline at end of file
+    """
+    export the product list as shown within the request as xlsx
+    """
+    return export_product_list(request, 'xlsx')
+
+def get_session_export_job(request, job_id: int) -> ExportJob:
+    """Export job started from this session, 404 for anyone else's"""
+    if job_id not in request.session.get('export_job_ids', []):
+        raise Http404
+    return get_object_or_404(ExportJob, pk=job_id)
+
+@csrf_protect
+@require_POST
+def start_export_job(request):
+    """
+    queue a background export of the product list as shown and render its progress
+    """
+    export_format: str = request.POST.get('export_format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'xlsx'
+    job: ExportJob = create_export_job(request.session, export_format)
+    # Only the latest few jobs of a session stay reachable
+    request.session['export_job_ids'] = (request.session.get('export_job_ids', []) + [job.pk])[-10:]
+    return render(request, 'partials/exportJob.html', context={'job': job})
+
+@require_GET
+def export_job_status(request, job_id: int):
+    """
+    get export job progress, polled by the progress partial until the job finishes
+    """
+    return render(request, 'partials/exportJob.html', context={'job': get_session_export_job(request, job_id)})
+
+@require_GET
+def download_export_job(request, job_id: int):
+    """
+    download the file of a finished export job
+    """
+    job: ExportJob = get_session_export_job(request, job_id)
+    if job.status != ExportJob.DONE or not job.file:
+        raise Http404
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=f'products.{job.format}')
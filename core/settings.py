@@ -196,6 +196,31 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Product list pagination: 'offset' (numbered pages) or 'keyset' (next/previous cursors,
+# no COUNT(*) and constant cost at any depth)
+PRODUCT_LIST_PAGINATION = config('PRODUCT_LIST_PAGINATION', default='offset')
+
+# Offset pagination counts and filter dropdown facets are cached per filter signature until the
+# data version changes.
+# With PRODUCT_LIST_COUNT_ESTIMATE on, result sets the planner expects to hold at least
+# PRODUCT_LIST_COUNT_ESTIMATE_THRESHOLD rows show the planner estimate ("~N results") instead
+PRODUCT_LIST_COUNT_CACHE_TIMEOUT = config('PRODUCT_LIST_COUNT_CACHE_TIMEOUT', default=300, cast=int)
+PRODUCT_LIST_COUNT_ESTIMATE = config('PRODUCT_LIST_COUNT_ESTIMATE', default=False, cast=bool)
+PRODUCT_LIST_COUNT_ESTIMATE_THRESHOLD = config('PRODUCT_LIST_COUNT_ESTIMATE_THRESHOLD', default=100000, cast=int)
+
+# Category and supplier filter dropdowns with more options than this only render the selected
+# ones and load the rest from the typeahead endpoints as the user types
+PRODUCT_FILTER_TYPEAHEAD_THRESHOLD = config('PRODUCT_FILTER_TYPEAHEAD_THRESHOLD', default=200, cast=int)
+
+# Product list exports queued as ExportJob rows and run by `manage.py run_export_worker`;
+# finished files are kept under MEDIA_ROOT/exports/ for EXPORT_JOB_EXPIRY_HOURS
+EXPORT_JOB_EXPIRY_HOURS = config('EXPORT_JOB_EXPIRY_HOURS', default=24, cast=int)
+EXPORT_WORKER_POLL_SECONDS = config('EXPORT_WORKER_POLL_SECONDS', default=2.0, cast=float)
+# Running jobs without a heartbeat for EXPORT_JOB_STALE_MINUTES (their worker died) are
+# queued again, and failed once they have been claimed EXPORT_JOB_MAX_ATTEMPTS times
+EXPORT_JOB_STALE_MINUTES = config('EXPORT_JOB_STALE_MINUTES', default=15, cast=int)
+EXPORT_JOB_MAX_ATTEMPTS = config('EXPORT_JOB_MAX_ATTEMPTS', default=3, cast=int)
+
 # Django Compressor settings
 COMPRESS_ENABLED = True
 COMPRESS_OFFLINE = False
@@ -1,6 +1,8 @@
 /**
  * Custom Multi-Select Component
- * Converts regular select elements with data-select2="true" to custom multi-select dropdowns
+ * Converts regular select elements with data-select2="true" to custom multi-select dropdowns.
+ * Selects with data-source only carry their selected options; the rest is loaded page by page
+ * from that typeahead URL ({results: [{id, text}], more}) as the user types or scrolls.
  */
 
 function initializeCustomMultiSelect() {
@@ -32,6 +34,46 @@ function initializeCustomMultiSelect() {
         const $input = $container.find('.multiselect-search');
         const $dropdown = $container.find('.multiselect-dropdown');
         const $inputContainer = $container.find('.multiselect-input');
+        const source = $select.attr('data-source');
+        const typeahead = { query: null, page: 0, more: false, loading: false, pending: null, timeout: null };
+
+        // Fetch a page of typeahead options; page 1 replaces the previously loaded ones
+        function loadOptions(query, page) {
+            if (typeahead.loading) {
+                // A new search waits for the request in flight, a further page is simply skipped
+                if (page === 1) {
+                    typeahead.pending = query;
+                }
+                return;
+            }
+            typeahead.loading = true;
+            $.getJSON(source, { q: query, page: page }, function (data) {
+                if (page === 1) {
+                    $dropdown.find('.multiselect-option.remote').remove();
+                }
+                data.results.forEach(function (result) {
+                    const value = String(result.id);
+                    if ($dropdown.find(`[data-value="${value}"]`).length > 0) {
+                        return;
+                    }
+                    const $option = $('<div class="multiselect-option remote"></div>').attr('data-value', value).text(result.text);
+                    if ($select.find(`option[value="${value}"]`).prop('selected')) {
+                        $option.addClass('selected');
+                    }
+                    $dropdown.append($option);
+                });
+                typeahead.query = query;
+                typeahead.page = page;
+                typeahead.more = data.more;
+            }).always(function () {
+                typeahead.loading = false;
+                if (typeahead.pending !== null) {
+                    const pending = typeahead.pending;
+                    typeahead.pending = null;
+                    loadOptions(pending, 1);
+                }
+            });
+        }
 
         // Populate dropdown with options
         $select.find('option').each(function () {
@@ -104,6 +146,17 @@ function initializeCustomMultiSelect() {
             });
 
             $dropdown.addClass('show');
+
+            if (source && typeahead.query === null) {
+                loadOptions('', 1);
+            }
+        });
+
+        // Load the next typeahead page when the list is scrolled to its end
+        $dropdown.on('scroll', function () {
+            if (source && typeahead.more && this.scrollTop + this.clientHeight >= this.scrollHeight - 20) {
+                loadOptions(typeahead.query, typeahead.page + 1);
+            }
         });
 
         $(document).on('click', function (e) {
@@ -115,8 +168,13 @@ function initializeCustomMultiSelect() {
         // Handle option selection
         $dropdown.on('click', '.multiselect-option', function () {
             const $option = $(this);
-            const value = $option.data('value');
-            const text = $option.text();
+            const value = $option.attr('data-value');
+            const text = $option.text().trim();
+
+            // Options loaded from the typeahead are not in the original select yet
+            if (source && $select.find(`option[value="${value}"]`).length === 0) {
+                $select.append($('<option></option>').attr('value', value).text(text));
+            }
 
             if (!$option.hasClass('selected')) {
                 // Add selection
@@ -172,10 +230,18 @@ function initializeCustomMultiSelect() {
         $input.on('input', function () {
             const search = $(this).val().toLowerCase();
 
-            $dropdown.find('.multiselect-option').each(function () {
+            $dropdown.find('.multiselect-option:not(.remote)').each(function () {
                 const text = $(this).text().toLowerCase();
                 $(this).toggle(text.includes(search));
             });
+
+            if (source) {
+                const query = $(this).val().trim();
+                clearTimeout(typeahead.timeout);
+                typeahead.timeout = setTimeout(function () {
+                    loadOptions(query, 1);
+                }, 250);
+            }
         });
 
         // Reposition dropdown on window resize or scroll
@@ -241,7 +307,7 @@ function triggerHTMXFilter() {
             // Make the HTMX request
             htmx.ajax('POST', $filterRow.attr('hx-post'), {
                 values: formData,
-                target: '#product-list',
+                target: '#product-rows',
                 swap: 'outerHTML'
             });
         }, 250);